@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预警状态机 - 按房间和预警类型记录预警状态，决定每次检查是否需要发送预警
+
+状态:
+    armed        尚未触发，下一次超过阈值时发送
+    fired        刚刚发送过预警
+    cooling_down 条件仍然满足，冷却期内不再重复发送
+    resolved     条件已解除（例如已充值），下一次超过阈值时立即发送
+
+状态保存在 alert_state 表中（按房间和类型的主键查询）。每次判断都重新读取状态，
+状态变化以条件更新（比较读取时的状态）写入，只有写入成功的一方发送预警：
+多个进程（多个Web工作进程、调度器进程）同时处理同一次超限时只会发送一次，冷却期对所有进程有效。
+同一条电费记录只判断一次，余额上升（充值）会重新启用预警
+"""
+
+import time
+import threading
+
+ARMED = 'armed'
+FIRED = 'fired'
+COOLING_DOWN = 'cooling_down'
+RESOLVED = 'resolved'
+
+# 余额上升超过该值视为充值
+RECHARGE_EPSILON = 0.01
+
+FIELDS = ('state', 'record_id', 'last_value', 'fired_at', 'updated_at')
+
+# 条件更新因并发修改失败时重新读取并判断的最多次数
+MAX_ATTEMPTS = 5
+
+
+def _initial():
+    return {'state': ARMED, 'record_id': None, 'last_value': None, 'fired_at': None, 'updated_at': None}
+
+
+class AlertStateMachine:
+    def __init__(self, connect, cooldown=24 * 3600):
+        """
+        Args:
+            connect: 返回数据库连接的函数
+            cooldown: 条件持续满足时重复发送预警的间隔（秒）
+        """
+        self.connect = connect
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(cursor, room, alert_type):
+        """读取状态，返回 (状态, 数据库中是否已有该行)"""
+        cursor.execute('''
+            SELECT state, record_id, last_value, fired_at, updated_at
+            FROM alert_state WHERE room = ? AND alert_type = ?
+        ''', (room, alert_type))
+        row = cursor.fetchone()
+        if row:
+            return dict(zip(FIELDS, row)), True
+        return _initial(), False
+
+    @staticmethod
+    def _compare_and_set(cursor, room, alert_type, current, exists, state):
+        """
+        仅当数据库中的状态仍是读取时的 current 时写入 state
+
+        Returns:
+            bool: 是否写入成功（失败说明其他进程已经修改了状态）
+        """
+        if not exists:
+            cursor.execute('''
+                INSERT INTO alert_state (room, alert_type, state, record_id, last_value, fired_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (room, alert_type) DO NOTHING
+            ''', (room, alert_type) + tuple(state[field] for field in FIELDS))
+        else:
+            cursor.execute('''
+                UPDATE alert_state
+                SET state = ?, record_id = ?, last_value = ?, fired_at = ?, updated_at = ?
+                WHERE room = ? AND alert_type = ?
+                  AND state = ? AND record_id IS ? AND fired_at IS ? AND updated_at IS ?
+            ''', tuple(state[field] for field in FIELDS) + (room, alert_type) +
+                 (current['state'], current['record_id'], current['fired_at'], current['updated_at']))
+        return cursor.rowcount == 1
+
+    def _transition(self, current, record_id, breached, value, now):
+        """根据当前状态和本次检查结果计算新状态，返回 (新状态, 是否发送预警)"""
+        recharged = (value is not None and current['last_value'] is not None
+                     and value > current['last_value'] + RECHARGE_EPSILON)
+        state = dict(current, record_id=record_id, updated_at=now)
+        if value is not None:
+            state['last_value'] = value
+
+        fire = False
+        if not breached:
+            if current['state'] in (FIRED, COOLING_DOWN):
+                state['state'] = RESOLVED
+        elif current['state'] in (ARMED, RESOLVED) or recharged:
+            fire = True
+        elif current['fired_at'] is None or now - current['fired_at'] >= self.cooldown:
+            fire = True
+        else:
+            state['state'] = COOLING_DOWN
+
+        if fire:
+            state['state'] = FIRED
+            state['fired_at'] = now
+        return state, fire
+
+    def observe(self, room, alert_type, record_id, breached, value=None, now=None):
+        """
+        根据一次检查结果更新状态
+
+        Args:
+            room: 房间标识
+            alert_type: 预警类型（low_balance、prediction_warning等）
+            record_id: 本次检查对应的电费记录ID，同一记录重复调用时直接忽略
+            breached: 本次检查是否满足预警条件
+            value: 当前余额，用于识别充值
+
+        Returns:
+            bool: 是否需要发送预警（返回True时状态已置为fired）
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self.connect()
+            try:
+                cursor = conn.cursor()
+                for _ in range(MAX_ATTEMPTS):
+                    current, exists = self._load(cursor, room, alert_type)
+                    if record_id is not None and current['record_id'] == record_id:
+                        return False
+
+                    state, fire = self._transition(current, record_id, breached, value, now)
+                    if state == current:
+                        return False
+                    if self._compare_and_set(cursor, room, alert_type, current, exists, state):
+                        conn.commit()
+                        return fire
+                    # 其他进程刚刚修改了状态，按最新状态重新判断
+                    conn.rollback()
+                return False
+            finally:
+                conn.close()
+
+    def rearm(self, room, alert_type):
+        """预警发送失败时恢复为armed，下一条记录会再次尝试发送"""
+        with self._lock:
+            conn = self.connect()
+            try:
+                cursor = conn.cursor()
+                state, _ = self._load(cursor, room, alert_type)
+                state.update(state=ARMED, fired_at=None)
+                cursor.execute('''
+                    INSERT INTO alert_state (room, alert_type, state, record_id, last_value, fired_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (room, alert_type) DO UPDATE SET state = excluded.state, fired_at = excluded.fired_at
+                ''', (room, alert_type) + tuple(state[field] for field in FIELDS))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def get_state(self, room, alert_type):
+        conn = self.connect()
+        try:
+            return self._load(conn.cursor(), room, alert_type)[0]
+        finally:
+            conn.close()
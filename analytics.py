@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预测分析汇总 - 用电模式和预测准确性
+
+用电模式直接读取 consumption_daily 每日汇总（随每条新记录增量更新）；
+预测准确性按预测方法累加在 prediction_accuracy_stats 表中，每次评估新预测时只更新对应方法的一行
+"""
+
+import ledger
+
+ANALYSIS_DAYS = 30
+HIGH_ACCURACY_SCORE = 80  # 准确率达到该分数视为高准确率预测
+
+
+def usage_pattern(cursor, days=ANALYSIS_DAYS):
+    """
+    最近若干天工作日和周末的日均消费金额
+
+    Returns:
+        dict: analysis_period 和 usage_pattern（与预测分析接口的结构一致）
+    """
+    weekday_usages = []
+    weekend_usages = []
+    # 与高级预测相同，只统计至少有两个流水区间的日期
+    for day, weekday, consumed, kwh, recharged, intervals in ledger.daily_usage(cursor, days):
+        if intervals < 2:
+            continue
+        if int(weekday) in (0, 6):
+            weekend_usages.append(consumed)
+        else:
+            weekday_usages.append(consumed)
+
+    weekday_avg = sum(weekday_usages) / len(weekday_usages) if weekday_usages else 0.0
+    weekend_avg = sum(weekend_usages) / len(weekend_usages) if weekend_usages else 0.0
+    samples = weekday_usages + weekend_usages
+    overall_avg = sum(samples) / len(samples) if samples else 0.0
+    return {
+        'analysis_period': days,
+        'usage_pattern': {
+            'weekday_avg': round(weekday_avg, 2),
+            'weekday_samples': len(weekday_usages),
+            'weekend_avg': round(weekend_avg, 2),
+            'weekend_samples': len(weekend_usages),
+            'overall_avg': round(overall_avg, 2),
+            'pattern_difference': round(abs(weekday_avg - weekend_avg), 2) if weekday_usages and weekend_usages else 0.0
+        }
+    }
+
+
+def record_evaluations(cursor, evaluations):
+    """
+    把新评估的预测累加到准确性统计（在调用方的事务中执行）
+
+    Args:
+        evaluations: [(预测方法, 准确率分数)]
+    """
+    cursor.executemany('''
+        INSERT INTO prediction_accuracy_stats (method, total, score_sum, min_score, max_score, high_count)
+        VALUES (?, 1, ?, ?, ?, ?)
+        ON CONFLICT (method) DO UPDATE SET
+            total = total + 1,
+            score_sum = score_sum + excluded.score_sum,
+            min_score = MIN(min_score, excluded.min_score),
+            max_score = MAX(max_score, excluded.max_score),
+            high_count = high_count + excluded.high_count
+    ''', [(method or 'unknown', score, score, score, 1 if score >= HIGH_ACCURACY_SCORE else 0)
+          for method, score in evaluations])
+
+
+def rebuild_accuracy(cursor):
+    """根据已评估的预测记录重新计算准确性统计"""
+    cursor.execute('DELETE FROM prediction_accuracy_stats')
+    cursor.execute('''
+        INSERT INTO prediction_accuracy_stats (method, total, score_sum, min_score, max_score, high_count)
+        SELECT COALESCE(prediction_method, 'unknown'), COUNT(*), SUM(accuracy_score), MIN(accuracy_score), MAX(accuracy_score),
+               COUNT(CASE WHEN accuracy_score >= ? THEN 1 END)
+        FROM prediction_records
+        WHERE is_evaluated = 1 AND accuracy_score IS NOT NULL
+        GROUP BY COALESCE(prediction_method, 'unknown')
+    ''', (HIGH_ACCURACY_SCORE,))
+
+
+def accuracy_summary(cursor):
+    """
+    读取准确性统计
+
+    Returns:
+        dict: overall_stats 和 method_stats（与预测准确性接口的结构一致）
+    """
+    cursor.execute('''
+        SELECT method, total, score_sum, min_score, max_score, high_count
+        FROM prediction_accuracy_stats
+        ORDER BY total DESC, method
+    ''')
+    rows = cursor.fetchall()
+
+    method_stats = []
+    for method, total, score_sum, min_score, max_score, high_count in rows:
+        method_stats.append({
+            'method': method,
+            'total_predictions': total,
+            'average_accuracy': round(score_sum / total, 2) if total else 0,
+            'min_accuracy': round(min_score, 2) if min_score else 0,
+            'max_accuracy': round(max_score, 2) if max_score else 0,
+            'high_accuracy_rate': round(high_count / total * 100, 2) if total else 0
+        })
+
+    total = sum(row[1] for row in rows)
+    return {
+        'overall_stats': {
+            'total_predictions': total,
+            'average_accuracy': round(sum(row[2] for row in rows) / total, 2) if total else 0,
+            'high_accuracy_rate': round(sum(row[5] for row in rows) / total * 100, 2) if total else 0
+        },
+        'method_stats': method_stats
+    }
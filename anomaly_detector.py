@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用电异常检测 - 按星期×小时基线的流式 z-score
+
+每条消费流水换算为用电速率（元/小时），与区间中点所在星期×小时格的基线比较。
+每个格子只保存指数加权的均值、方差和样本数（另有一个不分时段的总体基线，格子样本不足时使用），
+共 169×3 个 float64，以二进制形式保存在 anomaly_baseline 表的一行中。
+新记录到来时只读写这一行，计算量与历史记录数无关。
+
+超过基线 ANOMALY_Z_THRESHOLD 个标准差且超出 MIN_EXCESS_RATE 元/小时的区间视为异常；
+异常值只按截断后的值计入基线（winsorize），一次突增不会抬高之后的基线
+"""
+
+import math
+import struct
+from datetime import datetime, timedelta
+
+CELLS = 7 * 24
+OVERALL = CELLS           # 总体基线的下标
+ALPHA = 0.1               # 星期×小时格的平滑系数（每格约每周一个样本）
+OVERALL_ALPHA = 0.01      # 总体基线的平滑系数（每小时一个样本）
+MIN_SAMPLES = 4           # 格子样本达到该数量后才使用该格子的基线
+MIN_OVERALL_SAMPLES = 48
+MAX_INTERVAL_HOURS = 6    # 更长的区间（长时间未采集）会稀释突增，不参与检测
+MIN_STD = 0.05            # 标准差下限（元/小时），避免用电平稳时的微小波动被放大
+RELATIVE_STD_FLOOR = 0.25  # 标准差下限（相对基线均值）
+MIN_EXCESS_RATE = 0.3     # 超出基线至少该速率（元/小时）才视为异常
+WINSOR_Z = 3.0            # 计入基线时截断到均值上方的标准差数
+BASELINE_NAME = 'hour_of_week'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_BLOB = struct.Struct(f'<{(CELLS + 1) * 3}d')
+
+
+def _cell(ts):
+    """时间所在的格子下标，星期一0点为0"""
+    return ts.weekday() * 24 + ts.hour
+
+
+class Baseline:
+    def __init__(self, means=None, variances=None, counts=None, updated_at=None):
+        size = CELLS + 1
+        self.means = list(means) if means else [0.0] * size
+        self.variances = list(variances) if variances else [0.0] * size
+        self.counts = list(counts) if counts else [0.0] * size
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_blob(cls, blob, updated_at=None):
+        values = _BLOB.unpack(blob)
+        size = CELLS + 1
+        return cls(values[:size], values[size:size * 2], values[size * 2:], updated_at)
+
+    def to_blob(self):
+        return _BLOB.pack(*self.means, *self.variances, *self.counts)
+
+    def reference(self, cell):
+        """格子使用的基线下标，样本不足时为None"""
+        if self.counts[cell] >= MIN_SAMPLES:
+            return cell
+        if self.counts[OVERALL] >= MIN_OVERALL_SAMPLES:
+            return OVERALL
+        return None
+
+    def std(self, index):
+        return max(math.sqrt(self.variances[index]), MIN_STD, RELATIVE_STD_FLOOR * self.means[index])
+
+    def score(self, cell, rate):
+        """速率相对基线的 z-score，返回 (z, 基线下标)，基线样本不足时返回 (None, None)"""
+        index = self.reference(cell)
+        if index is None:
+            return None, None
+        return (rate - self.means[index]) / self.std(index), index
+
+    def _update(self, index, rate, alpha):
+        if self.counts[index] >= MIN_SAMPLES:
+            rate = min(rate, self.means[index] + WINSOR_Z * self.std(index))
+        # 样本较少时按算术平均累积，之后按固定系数指数加权
+        alpha = max(alpha, 1 / (self.counts[index] + 1))
+        diff = rate - self.means[index]
+        self.means[index] += alpha * diff
+        self.variances[index] = (1 - alpha) * (self.variances[index] + alpha * diff * diff)
+        self.counts[index] += 1
+
+    def update(self, cell, rate):
+        self._update(cell, rate, ALPHA)
+        self._update(OVERALL, rate, OVERALL_ALPHA)
+
+
+def _interval(entry):
+    """从流水行中取出可检测的消费区间 (中点, 速率)，不可检测时返回None"""
+    if entry is None or entry[1] != 'consumption':
+        return None
+    seconds = entry[4]
+    if seconds <= 0 or seconds > MAX_INTERVAL_HOURS * 3600:
+        return None
+    start = datetime.strptime(entry[2], TIME_FORMAT)
+    return start + timedelta(seconds=seconds / 2), entry[7] / (seconds / 3600)
+
+
+def load(cursor):
+    """读取基线，尚未生成时返回空的基线"""
+    cursor.execute('SELECT stats, updated_at FROM anomaly_baseline WHERE name = ?', (BASELINE_NAME,))
+    row = cursor.fetchone()
+    return Baseline.from_blob(row[0], row[1]) if row else Baseline()
+
+
+def save(cursor, baseline):
+    cursor.execute('''
+        INSERT INTO anomaly_baseline (name, stats, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET stats = excluded.stats, updated_at = excluded.updated_at
+    ''', (BASELINE_NAME, baseline.to_blob(), baseline.updated_at))
+
+
+def observe(cursor, entry, z_threshold):
+    """
+    检测一行新的用电流水（ledger.append的返回值）并计入基线，在调用方的事务中执行
+
+    Returns:
+        dict | None: 异常时返回异常信息，否则为None
+    """
+    interval = _interval(entry)
+    if interval is None:
+        return None
+    middle, rate = interval
+    cell = _cell(middle)
+
+    baseline = load(cursor)
+    z, index = baseline.score(cell, rate)
+    expected = baseline.means[index] if index is not None else None
+    baseline.update(cell, rate)
+    baseline.updated_at = entry[3]
+    save(cursor, baseline)
+
+    if z is None or z < z_threshold or rate - expected < MIN_EXCESS_RATE:
+        return None
+    return {
+        'start_time': entry[2],
+        'end_time': entry[3],
+        'amount': round(entry[7], 2),
+        'rate': round(rate, 3),
+        'expected_rate': round(expected, 3),
+        'z_score': round(z, 1),
+        'baseline': 'hour_of_week' if index == cell else 'overall'
+    }
+
+
+def rebuild(cursor):
+    """根据全部消费流水重新生成基线（不产生预警），返回计入的区间数"""
+    cursor.execute('''
+        SELECT record_id, kind, start_time, end_time, seconds, start_balance, end_balance, amount
+        FROM consumption_ledger
+        WHERE kind = 'consumption'
+        ORDER BY end_time, id
+    ''')
+    baseline = Baseline()
+    count = 0
+    for entry in cursor.fetchall():
+        interval = _interval(entry)
+        if interval is None:
+            continue
+        middle, rate = interval
+        baseline.update(_cell(middle), rate)
+        baseline.updated_at = entry[3]
+        count += 1
+
+    # 没有可计入的流水时不保存，以便之后写入记录的数据库在初始化时重新回填
+    cursor.execute('DELETE FROM anomaly_baseline WHERE name = ?', (BASELINE_NAME,))
+    if count:
+        save(cursor, baseline)
+    return count
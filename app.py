@@ -6,64 +6,151 @@
 """
 
 import os
+import copy
 import sqlite3
-import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import time
 import json
 import re
-import shutil
-import importlib
-from bs4 import BeautifulSoup
-from flask import Flask, render_template, jsonify, request, redirect, url_for
-from apscheduler.schedulers.background import BackgroundScheduler
+from flask import Blueprint, Flask, Response, render_template, jsonify, request, redirect, url_for, send_from_directory, stream_with_context
 import atexit
 import logging
+import profiler
+import log_queue
+import health
+import http_cache
+import series
+import settings_store
+import alert_state
+import mailer
+import history_io
+import usage_accumulator
+import ledger
+import usage_heatmap
+import analytics
+import predictors
+import anomaly_detector
+import circuit_breaker
+import time_keys
+from bisect import bisect_right
 
-# 导入配置
+# 导入配置（缺少配置时不在导入阶段退出，由启动入口检查）
 try:
     import config
 except ImportError:
-    print("请先配置config.py文件，填写用户名、密码等信息")
-    print("可以复制config.py.example为config.py并填写实际信息")
-    exit(1)
-
-# 检查配置是否已填写
-if (hasattr(config, 'BUPT_USERNAME') and config.BUPT_USERNAME == "你的学号") or \
-   (hasattr(config, 'EMAIL_USERNAME') and config.EMAIL_USERNAME == "你的邮箱@qq.com"):
-    print("请先在config.py中填写实际的用户名、密码等信息！")
-    print("当前配置文件中仍然是示例值，请修改为实际值")
-    exit(1)
-
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('electric_monitor.log'),
-        logging.StreamHandler()
-    ]
-)
+    config = None
+
+# 可在网页上修改的设置（settings.json），config.py中的同名配置作为默认值
+settings = settings_store.SettingsStore(legacy=config)
+
+def check_config():
+    """检查配置是否存在且已填写，返回错误提示（配置正常时返回None）"""
+    if config is None:
+        return ("请先配置config.py文件，填写用户名、密码等信息\n"
+                "可以复制config.py.example为config.py并填写实际信息")
+
+    if (hasattr(config, 'BUPT_USERNAME') and config.BUPT_USERNAME == "你的学号") or \
+       (hasattr(config, 'EMAIL_USERNAME') and config.EMAIL_USERNAME == "你的邮箱@qq.com"):
+        return ("请先在config.py中填写实际的用户名、密码等信息！\n"
+                "当前配置文件中仍然是示例值，请修改为实际值")
+    return None
 
-app = Flask(__name__)
-app.secret_key = 'electric_monitor_secret_key'
+def setup_logging():
+    """设置日志（经内存队列由后台线程写入文件和控制台）"""
+    log_queue.setup()
 
-# 添加JSON过滤器
-@app.template_filter('tojsonfilter')
+bp = Blueprint('main', __name__)
+
+# JSON过滤器
 def to_json_filter(value):
     return json.dumps(value, ensure_ascii=False)
 
+# 数据库文件路径
+DB_PATH = 'electric_data.db'
+
+# 预测结果缓存的最大条目数
+PREDICTION_CACHE_SIZE = 32
+# 检查汇总发件箱的间隔（分钟）
+DIGEST_CHECK_MINUTES = 5
+
 class ElectricMonitor:
-    def __init__(self):
-        self.session = requests.Session()
-        self.init_database()
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._client = None
+        self.session_valid = False  # 当前会话是否已通过认证
+        self.last_success_at = None  # 最近一次成功获取电费数据的时间戳
+        self._db_initialized = False
+        self._db_lock = threading.Lock()
+        self._last_snapshot_key = None  # 最近一次保存的预测快照 (记录ID, 方法, 阈值)
+        self._prediction_cache = OrderedDict()  # 按数据版本缓存的预测结果（LRU）
+        self._prediction_lock = threading.Lock()
+        self._aggregate_cache = {}  # 按数据版本缓存的分析汇总: 名称 -> (缓存键, 结果)
+        self._last_evaluated_count = 0  # 最近一次准确性评估新评估的预测数
+        self.alert_state = alert_state.AlertStateMachine(self.connect)
+        self.mailer = mailer.Mailer(config, self.connect)
+        # 上游（电费系统和统一身份认证）故障时快速失败
+        self.upstream_breaker = circuit_breaker.CircuitBreaker(
+            'upstream',
+            failure_threshold=getattr(config, 'UPSTREAM_BREAKER_FAILURES', 3),
+            cooldown=getattr(config, 'UPSTREAM_BREAKER_COOLDOWN', 60),
+            max_cooldown=getattr(config, 'UPSTREAM_BREAKER_MAX_COOLDOWN', 3600)
+        )
+
+    @property
+    def client(self):
+        """上游客户端，首次访问上游时才创建"""
+        if self._client is None:
+            import bupt_client
+            self._client = bupt_client.BuptClient(
+                config.BUPT_USERNAME,
+                config.BUPT_PASSWORD,
+                concurrency=getattr(config, 'UPSTREAM_CONCURRENCY', 4),
+                retries=getattr(config, 'UPSTREAM_RETRIES', 3),
+                deadline=getattr(config, 'UPSTREAM_DEADLINE', 30),
+                breaker=self.upstream_breaker
+            )
+        return self._client
+
+    def connect(self):
+        """获取数据库连接，首次使用时初始化数据库"""
+        if not self._db_initialized:
+            with self._db_lock:
+                if not self._db_initialized:
+                    self.init_database()
+                    self._db_initialized = True
+        return sqlite3.connect(self.db_path)
+
+    def mark_data_changed(self):
+        """记录数据已变更（写入或删除电费记录后调用），清空预测缓存"""
+        with self._prediction_lock:
+            self._prediction_cache.clear()
+            self._aggregate_cache.clear()
+
+    def get_data_version(self):
+        """
+        获取当前数据版本
+
+        Returns:
+            tuple: (版本字符串, 最新记录时间字符串)，版本由最新记录ID和 data_version 表中由触发器维护的
+                   变更计数组成，删除记录后同样变化，多进程部署时各进程得到相同的版本；两次查询都只读一行
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM data_version WHERE name = 'electric_records'")
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        cursor.execute('SELECT id, timestamp FROM electric_records ORDER BY id DESC LIMIT 1')
+        row = cursor.fetchone()
+        conn.close()
+
+        latest_id, latest_timestamp = row if row else (0, None)
+        return f"{latest_id}.{version}", latest_timestamp
         
     def init_database(self):
         """初始化数据库"""
-        conn = sqlite3.connect('electric_data.db')
+        conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -103,129 +190,271 @@ class ElectricMonitor:
                 confidence TEXT,
                 actual_days REAL,
                 accuracy_score REAL,
-                is_evaluated INTEGER DEFAULT 0
+                is_evaluated INTEGER DEFAULT 0,
+                record_id INTEGER
+            )
+        ''')
+        
+        # 旧版本数据库的预测记录表没有record_id列
+        cursor.execute('PRAGMA table_info(prediction_records)')
+        if 'record_id' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE prediction_records ADD COLUMN record_id INTEGER')
+        
+        # 每个数据点、预测方法和阈值只保存一条预测快照
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_prediction_snapshot
+            ON prediction_records (record_id, prediction_method, threshold)
+        ''')
+        
+        # 按预测方法累加的准确性统计
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prediction_accuracy_stats (
+                method TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                score_sum REAL NOT NULL,
+                min_score REAL,
+                max_score REAL,
+                high_count INTEGER NOT NULL
             )
         ''')
+        cursor.execute('SELECT 1 FROM prediction_accuracy_stats LIMIT 1')
+        if cursor.fetchone() is None:
+            analytics.rebuild_accuracy(cursor)
+        
+        # 每个房间、每种预警类型一行状态
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alert_state (
+                room TEXT NOT NULL,
+                alert_type TEXT NOT NULL,
+                state TEXT NOT NULL,
+                record_id INTEGER,
+                last_value REAL,
+                fired_at REAL,
+                updated_at REAL,
+                PRIMARY KEY (room, alert_type)
+            )
+        ''')
+        
+        # 汇总模式下待发送的预警
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alert_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                recipient TEXT NOT NULL,
+                room TEXT,
+                alert_type TEXT,
+                subject TEXT,
+                body TEXT,
+                sent_at REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_alert_outbox_pending ON alert_outbox (sent_at, created_at)')
+        
+        # 按时间范围读取余额曲线
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_electric_records_timestamp ON electric_records (timestamp)')
+        # 健康检查读取最近一次成功记录的时间（部分索引，MAX只读索引末端）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_electric_records_success_timestamp
+            ON electric_records (timestamp) WHERE status = 'success'
+        ''')
+        
+        # 整数时间列（Unix时间戳和本地日期/小时键），旧数据库在此回填
+        time_keys.migrate(cursor, 'electric_records')
+        time_keys.migrate(cursor, 'prediction_records', with_buckets=False)
+        
+        # 电费记录的数据版本：任何写入、修改或删除都由触发器递增，读取版本只需读一行
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO data_version (name, version) VALUES ('electric_records', 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_electric_records_version_{event.lower()}
+                AFTER {event} ON electric_records
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE name = 'electric_records';
+                END
+            ''')
+        
+        # 余额曲线按小时/按天的预聚合
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS balance_rollup (
+                level TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                balance_sum REAL NOT NULL,
+                balance_count INTEGER NOT NULL,
+                min_balance REAL,
+                max_balance REAL,
+                PRIMARY KEY (level, bucket)
+            )
+        ''')
+        
+        # 旧数据库或外部导入的记录还没有预聚合时回填
+        cursor.execute('SELECT 1 FROM balance_rollup LIMIT 1')
+        if cursor.fetchone() is None:
+            series.rebuild_rollup(cursor)
+        
+        # 按日/周/月累计的用电量，每个周期一行
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_accumulator (
+                period TEXT PRIMARY KEY,
+                period_start TEXT NOT NULL,
+                consumed REAL NOT NULL DEFAULT 0,
+                kwh REAL NOT NULL DEFAULT 0,
+                recharged REAL NOT NULL DEFAULT 0,
+                last_balance REAL,
+                last_timestamp TEXT
+            )
+        ''')
+        cursor.execute('SELECT 1 FROM usage_accumulator LIMIT 1')
+        if cursor.fetchone() is None:
+            usage_accumulator.rebuild(cursor)
+        
+        # 由相邻余额记录推导出的消费/充值流水
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS consumption_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_id INTEGER NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                start_time TEXT NOT NULL,
+                end_time TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                start_balance REAL,
+                end_balance REAL,
+                amount REAL NOT NULL,
+                kwh REAL NOT NULL,
+                price REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_consumption_ledger_end_time ON consumption_ledger (end_time)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS consumption_daily (
+                day TEXT PRIMARY KEY,
+                weekday INTEGER NOT NULL,
+                consumed REAL NOT NULL,
+                kwh REAL NOT NULL,
+                recharged REAL NOT NULL,
+                intervals INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('SELECT 1 FROM consumption_ledger LIMIT 1')
+        if cursor.fetchone() is None:
+            ledger.rebuild(cursor)
+        cursor.execute('SELECT 1 FROM consumption_daily LIMIT 1')
+        if cursor.fetchone() is None:
+            ledger.refresh_daily(cursor)
+        
+        # 星期×小时用电热力图（二进制矩阵）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS usage_profile (
+                name TEXT PRIMARY KEY,
+                matrix BLOB NOT NULL,
+                updated_at TEXT
+            )
+        ''')
+        cursor.execute('SELECT 1 FROM usage_profile LIMIT 1')
+        if cursor.fetchone() is None:
+            usage_heatmap.rebuild(cursor)
+        
+        # 有状态预测方法（如 Holt-Winters）的模型状态（JSON）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS predictor_state (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at TEXT
+            )
+        ''')
+        cursor.execute('SELECT name FROM predictor_state')
+        if {row[0] for row in cursor.fetchall()} != {predictor.name for predictor in predictors.stateful()}:
+            predictors.rebuild_states(cursor)
+        
+        # 用电异常检测的星期×小时基线（二进制）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS anomaly_baseline (
+                name TEXT PRIMARY KEY,
+                stats BLOB NOT NULL,
+                updated_at TEXT
+            )
+        ''')
+        cursor.execute('SELECT 1 FROM anomaly_baseline LIMIT 1')
+        if cursor.fetchone() is None:
+            anomaly_detector.rebuild(cursor)
         
         conn.commit()
         conn.close()
         
     def login_bupt(self):
         """登录北邮统一身份认证"""
+        import bupt_client
+
         try:
-            # 获取登录页面
-            login_url = "https://auth.bupt.edu.cn/authserver/login"
-            response = self.session.get(login_url, timeout=10)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 新的登录页面结构：提取必要的隐藏字段
-            type_input = soup.find('input', {'name': 'type'})
-            execution_input = soup.find('input', {'name': 'execution'})
-            _eventId_input = soup.find('input', {'name': '_eventId'})
-            
-            if not type_input or not execution_input or not _eventId_input:
-                logging.error("无法找到登录所需的隐藏字段，页面结构可能已变化")
+            self.client.login()
+            logging.info("登录成功")
+            self.session_valid = True
+            return True
+        except bupt_client.CircuitOpen as e:
+            logging.warning(f"跳过登录: {str(e)}")
+            return False
+        except bupt_client.LoginFailed as e:
+            logging.error(str(e))
+            if e.page:
                 # 保存页面内容用于调试
                 with open('debug_login_page.html', 'w', encoding='utf-8') as f:
-                    f.write(response.text)
+                    f.write(e.page)
                 logging.info("登录页面内容已保存到debug_login_page.html")
-                return False
-            
-            type_value = type_input.get('value', '') if type_input else '' # type: ignore
-            execution = execution_input.get('value', '') if execution_input else '' # type: ignore
-            _eventId = _eventId_input.get('value', '') if _eventId_input else '' # type: ignore # type: ignore
-            
-            # 登录数据 - 使用新的字段结构
-            login_data = {
-                'username': config.BUPT_USERNAME,
-                'password': config.BUPT_PASSWORD,
-                'type': type_value,
-                'execution': execution,
-                '_eventId': _eventId
-            }
-            
-            # 提交登录
-            response = self.session.post(login_url, data=login_data, timeout=10)
-            
-            if 'CAS Login' in response.text or '统一身份认证' in response.text:
-                logging.error("登录失败，请检查用户名和密码")
-                return False
-            
-            logging.info("登录成功")
-            return True
-            
+            return False
         except Exception as e:
             logging.error(f"登录过程中出现错误: {str(e)}")
             return False
     
-    def check_login_needed(self, response):
-        """检查响应是否需要登录"""
-        # 检查是否跳转到了登录页面
-        if (response.status_code == 302 or 
-            'auth.bupt.edu.cn' in response.url or
-            'CAS Login' in response.text or
-            '统一身份认证' in response.text or
-            'login' in response.url.lower()):
-            logging.info("检测到需要登录")
-            return True
-        return False
-    
+    def query_electric_data(self, area_id, apartment_id, floor_id, room_number):
+        """
+        查询电费接口 - 先直接用已有会话查询，会话失效时才登录后重试
+
+        Returns:
+            dict: 查询接口返回的JSON，登录失败时返回None
+        """
+        import bupt_client
+
+        try:
+            return self.client.query(area_id, apartment_id, floor_id, room_number)
+        except bupt_client.SessionExpired as e:
+            logging.info(f"会话已失效，开始登录流程: {str(e)}")
+            self.session_valid = False
+
+        if not self.login_bupt():
+            logging.error("登录失败")
+            return None
+
+        # 登录后访问一次电费页面，完成应用侧的认证跳转
+        response = self.client.chong()
+        if response.status_code != 200:
+            logging.error(f"登录后访问电费页面失败，状态码: {response.status_code}")
+            return None
+        logging.info("登录成功，重新查询电费数据")
+        return self.client.query(area_id, apartment_id, floor_id, room_number)
+
     def get_electric_data(self):
-        """获取电费数据 - 智能登录检查"""
+        """获取电费数据 - 直接查询，会话失效时自动登录"""
         try:
-            # 先尝试直接访问电费查询页面，检查是否需要登录
-            electric_url = "https://app.bupt.edu.cn/buptdf/wap/default/chong"
-            response = self.session.get(electric_url, timeout=10, allow_redirects=True)
-            
-            logging.info(f"访问电费页面: 状态码={response.status_code}, URL={response.url}")
-            
-            # 检查是否被重定向到登录页面
-            if self.check_login_needed(response):
-                logging.info("需要登录，开始登录流程...")
-                if not self.login_bupt():
-                    logging.error("登录失败")
-                    return None
-                
-                # 重新访问电费页面
-                response = self.session.get(electric_url, timeout=10)
-                if response.status_code != 200:
-                    logging.error(f"登录后访问电费页面失败，状态码: {response.status_code}")
-                    return None
-                logging.info("登录成功，重新访问电费页面成功")
-            else:
-                logging.info("无需登录，直接查询电费数据")
-            
-            if response.status_code != 200:
-                logging.error(f"访问电费页面失败，状态码: {response.status_code}")
-                return None
-            
-            logging.info("开始查询电费数据...")
-            
             # 配置查询参数
             area_id = getattr(config, 'AREA_ID', 2)  # 默认沙河校区
             apartment_id = getattr(config, 'APARTMENT_ID', '沙河校区雁北园A楼')
             floor_id = getattr(config, 'FLOOR_ID', '1层')
             room_number = getattr(config, 'ROOM_NUMBER', '190807009132')  # 需要在配置中设置实际房间号
             
-            logging.info(f"查询参数: 校区ID={area_id}, 公寓={apartment_id}, 楼层={floor_id}, 房间号={room_number}")
+            logging.debug(f"查询参数: 校区ID={area_id}, 公寓={apartment_id}, 楼层={floor_id}, 房间号={room_number}")
             
             # 查询电费数据
-            search_url = "https://app.bupt.edu.cn/buptdf/wap/default/search"
-            response = self.session.post(search_url, data={
-                'partmentId': apartment_id,
-                'floorId': floor_id,
-                'dromNumber': room_number,
-                'areaid': area_id
-            }, timeout=10)
-            
-            if response.status_code != 200:
-                logging.error(f"电费查询接口访问失败，状态码: {response.status_code}")
+            electric_data = self.query_electric_data(area_id, apartment_id, floor_id, room_number)
+            if electric_data is None:
                 return None
             
-            # 解析JSON响应
             try:
-                electric_data = response.json()
-                logging.info(f"收到电费数据响应: {electric_data}")
+                log_queue.payload('electric_response', electric_data)
                 
                 if electric_data.get('e') != 0:
                     logging.error(f"电费查询失败: {electric_data.get('m', '未知错误')}")
@@ -237,8 +466,8 @@ class ElectricMonitor:
                 data = {
                     'balance': float(raw_data.get('surplus', 0)),  # 余额
                     'total_usage': float(raw_data.get('vTotal', 0)),  # 总用电量
-                    'usage_today': None,  # 今日用电量（从原始数据无法直接获取，设为None）
-                    'usage_month': None,  # 本月用电量（从原始数据无法直接获取，设为None）
+                    'usage_today': None,  # 今日用电量（保存时由用电量累加器计算）
+                    'usage_month': None,  # 本月用电量（保存时由用电量累加器计算）
                     'price': float(raw_data.get('price', 0.48)),  # 电价
                     'query_time': raw_data.get('time', ''),  # 查询时间
                     'apartment': raw_data.get('parName', ''),  # 公寓名称
@@ -250,70 +479,22 @@ class ElectricMonitor:
                 
                 logging.info(f"解析电费数据成功: 余额={data['balance']}元, 总用电={data['total_usage']}度, 电价={data['price']}元/度")
                 
-                # 计算今日和月度用电量
-                data = self.calculate_usage_data(data)
-                
+                self.session_valid = True
+                self.last_success_at = time.time()
                 return data
                 
-            except json.JSONDecodeError as e:
-                logging.error(f"电费数据JSON解析失败: {e}")
-                logging.error(f"响应内容: {response.text[:500]}")
-                return None
-            except (ValueError, KeyError) as e:
+            except (ValueError, KeyError, AttributeError) as e:
                 logging.error(f"电费数据解析错误: {e}")
                 return None
             
         except Exception as e:
-            logging.error(f"获取电费数据时出现错误: {str(e)}")
+            import bupt_client
+            if isinstance(e, bupt_client.CircuitOpen):
+                logging.warning(f"跳过电费查询: {str(e)}")
+            else:
+                logging.error(f"获取电费数据时出现错误: {str(e)}")
             return None
     
-    def calculate_usage_data(self, data):
-        """根据历史数据计算今日和月度用电量"""
-        try:
-            conn = sqlite3.connect('electric_data.db')
-            cursor = conn.cursor()
-            
-            # 获取当天最早的记录，用于计算今日用电量
-            cursor.execute('''
-                SELECT * FROM electric_records
-                WHERE timestamp >= datetime('now', 'localtime', 'start of day')
-                AND balance IS NOT NULL
-                ORDER BY timestamp ASC
-                LIMIT 1
-            ''')
-            today_first = cursor.fetchone()
-            
-            # 获取本月最早的记录，用于计算月度用电量
-            cursor.execute('''
-                SELECT * FROM electric_records
-                WHERE timestamp >= datetime('now', 'localtime', 'start of month')
-                AND balance IS NOT NULL
-                ORDER BY timestamp ASC
-                LIMIT 1
-            ''')
-            month_first = cursor.fetchone()
-            
-            # 计算今日用电量和月度用电量
-            if today_first and today_first[2] is not None and data['balance'] is not None:
-                # 今日电费变化（消费为正值，充值为负值）
-                today_usage = float(today_first[2]) - float(data['balance'])
-                if today_usage > 0:  # 消费了电费，才计算为用电量
-                    data['usage_today'] = today_usage / float(data['price']) if data['price'] > 0 else 0
-            
-            if month_first and month_first[2] is not None and data['balance'] is not None:
-                # 月度电费变化（消费为正值，充值为负值）
-                month_usage = float(month_first[2]) - float(data['balance']) 
-                if month_usage > 0:  # 消费了电费，才计算为用电量
-                    data['usage_month'] = month_usage / float(data['price']) if data['price'] > 0 else 0
-            
-            conn.close()
-            
-            logging.info(f"计算用电量：今日={data.get('usage_today')}度，本月={data.get('usage_month')}度")
-            return data
-        except Exception as e:
-            logging.error(f"计算用电量时出错: {str(e)}")
-            return data
-    
     def save_data(self, data):
         """保存数据到数据库"""
         if not data:
@@ -321,35 +502,49 @@ class ElectricMonitor:
             return
             
         try:
-            conn = sqlite3.connect('electric_data.db')
+            conn = self.connect()
             cursor = conn.cursor()
             
             # 使用当前系统时间
-            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            now = datetime.now().replace(microsecond=0)
+            current_time = now.strftime('%Y-%m-%d %H:%M:%S')
             
             # 确保数值型字段不为None，否则使用默认值
             balance = float(data.get('balance', 0)) if data.get('balance') is not None else 0.0
-            usage_today = float(data.get('usage_today', 0)) if data.get('usage_today') is not None else None
-            usage_month = float(data.get('usage_month', 0)) if data.get('usage_month') is not None else None
+            
+            # 在同一事务中累加今日和本月用电量（余额上升视为充值）
+            price = data.get('price') or usage_accumulator.DEFAULT_PRICE
+            usage = usage_accumulator.advance(cursor, now, balance, price)
+            usage_today = data['usage_today'] = usage['day']['kwh']
+            usage_month = data['usage_month'] = usage['month']['kwh']
             
             cursor.execute('''
-                INSERT INTO electric_records (timestamp, balance, usage_today, usage_month, status, raw_data)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO electric_records (timestamp, epoch, day_key, hour_key, balance, usage_today, usage_month, status, raw_data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 current_time,
+                *time_keys.keys(now),
                 balance,
                 usage_today,
                 usage_month,
                 data.get('status', 'success'),
                 data.get('raw_data', '')
             ))
+            record_id = cursor.lastrowid
+            series.update_rollup(cursor, now, balance)
+            entry = ledger.append(cursor, record_id, now, balance, price)
+            usage_heatmap.update(cursor, entry)
+            predictors.update_states(cursor, entry)
+            anomaly = anomaly_detector.observe(cursor, entry, settings.ANOMALY_Z_THRESHOLD)
             
             conn.commit()
             conn.close()
+            self.mark_data_changed()
+            logging.info(f"用电量：今日={usage_today:.2f}度，本月={usage_month:.2f}度")
             
-            # 检查是否需要发送预警
-            if balance < config.LOW_BALANCE_THRESHOLD:
-                self.send_alert(balance)
+            # 更新预警状态，需要时发送预警
+            self.send_alert(balance, record_id)
+            self.send_anomaly_alert(anomaly, record_id)
         except Exception as e:
             logging.error(f"保存数据失败: {str(e)}")
             # 如果发生错误，尝试关闭数据库连接
@@ -358,33 +553,50 @@ class ElectricMonitor:
             except:
                 pass
     
-    def send_alert(self, balance):
-        """发送低余额预警邮件"""
+    def alert_room(self):
+        """预警状态所属的房间"""
+        return str(getattr(config, 'ROOM_NUMBER', ''))
+    
+    def latest_record_id(self):
+        """最新一条有余额的电费记录ID"""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT MAX(id) FROM electric_records WHERE balance IS NOT NULL')
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else None
+    
+    def deliver_alert(self, alert_type, recipients, subject, body):
+        """
+        发送预警邮件，启用汇总模式时加入汇总发件箱
+        
+        Returns:
+            int: 成功发送或加入发件箱的收件人数量
+        """
+        if settings.ALERT_DIGEST_ENABLED:
+            return self.mailer.queue(recipients, self.alert_room(), alert_type, subject, body)
+        return self.mailer.send(recipients, subject, body)
+    
+    def send_alert(self, balance, record_id=None):
+        """
+        根据当前余额更新低余额预警状态，需要时发送预警邮件
+        
+        Args:
+            balance: 当前余额
+            record_id: 对应的电费记录ID，同一条记录只判断一次（默认使用最新记录）
+        """
+        if record_id is None:
+            record_id = self.latest_record_id()
+        breached = float(balance) < settings.LOW_BALANCE_THRESHOLD
+        if not self.alert_state.observe(self.alert_room(), 'low_balance', record_id, breached, float(balance)):
+            return
+        
         try:
-            # 检查是否已经发送过预警（24小时内）
-            conn = sqlite3.connect('electric_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM alerts
-                WHERE alert_type = 'low_balance'
-                AND timestamp > datetime('now', 'localtime', '-24 hours')
-                AND sent = 1
-            ''')
-            
-            if cursor.fetchone():
-                conn.close()
-                logging.info("24小时内已发送过预警邮件，跳过")
-                return
-            
             # 获取邮箱列表
-            alert_emails = []
-            if hasattr(config, 'ALERT_EMAILS') and config.ALERT_EMAILS:
-                alert_emails = config.ALERT_EMAILS
-            elif hasattr(config, 'ALERT_EMAIL'):
-                alert_emails = [config.ALERT_EMAIL] # type: ignore
-            else:
+            alert_emails = settings.ALERT_EMAILS
+            if not alert_emails:
                 logging.error("未配置预警邮箱")
+                self.alert_state.rearm(self.alert_room(), 'low_balance')
                 return
             
             # 创建邮件内容
@@ -394,7 +606,7 @@ class ElectricMonitor:
             您的电费余额不足，请及时充值：
             
             当前余额: {balance:.2f} 元
-            预警阈值: {config.LOW_BALANCE_THRESHOLD} 元
+            预警阈值: {settings.LOW_BALANCE_THRESHOLD} 元
             查询时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             
             请及时前往 https://app.bupt.edu.cn/buptdf/wap/default/chong 进行充值。
@@ -403,35 +615,18 @@ class ElectricMonitor:
             电费自动提醒系统
             """
             
-            # 连接SMTP服务器
-            server = smtplib.SMTP(config.EMAIL_SMTP_SERVER, config.EMAIL_SMTP_PORT)
-            server.starttls()
-            server.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
-            
-            # 发送给每个邮箱
-            sent_count = 0
-            for email in alert_emails:
-                try:
-                    msg = MIMEMultipart()
-                    msg['From'] = config.EMAIL_USERNAME
-                    msg['To'] = email
-                    msg['Subject'] = "⚠️ 电费余额不足预警"
-                    msg.attach(MIMEText(body, 'plain', 'utf-8'))
-                    
-                    text = msg.as_string()
-                    server.sendmail(config.EMAIL_USERNAME, email, text)
-                    sent_count += 1
-                    logging.info(f"预警邮件已发送到: {email}")
-                except Exception as e:
-                    logging.error(f"发送邮件到 {email} 失败: {str(e)}")
+            sent_count = self.deliver_alert('low_balance', alert_emails, "⚠️ 电费余额不足预警", body)
             
-            server.quit()
+            if sent_count == 0:
+                self.alert_state.rearm(self.alert_room(), 'low_balance')
             
             # 记录预警
+            conn = self.connect()
+            cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO alerts (alert_type, message, sent)
                 VALUES (?, ?, ?)
-            ''', ('low_balance', f'余额不足预警: {balance}元，已发送{sent_count}封邮件', 1))
+            ''', ('low_balance', f'余额不足预警: {balance}元，已发送{sent_count}封邮件', 1 if sent_count else 0))
             
             conn.commit()
             conn.close()
@@ -439,11 +634,71 @@ class ElectricMonitor:
             logging.info(f"预警邮件发送完成，成功发送{sent_count}封邮件，当前余额: {balance}元")
             
         except Exception as e:
+            self.alert_state.rearm(self.alert_room(), 'low_balance')
             logging.error(f"发送预警邮件时出现错误: {str(e)}")
     
+    def send_anomaly_alert(self, anomaly, record_id):
+        """
+        根据异常检测结果更新用电异常预警状态，需要时发送预警邮件
+        
+        Args:
+            anomaly: anomaly_detector.observe 的返回值，没有异常时为None
+            record_id: 对应的电费记录ID
+        """
+        if not settings.ANOMALY_ALERT_ENABLED:
+            return
+        if anomaly is not None:
+            logging.warning(f"检测到用电异常: {anomaly['start_time']} ~ {anomaly['end_time']} 用电速率{anomaly['rate']}元/小时，"
+                            f"基线{anomaly['expected_rate']}元/小时（z={anomaly['z_score']}）")
+        # 异常持续时冷却期内只发送一次
+        if not self.alert_state.observe(self.alert_room(), 'consumption_anomaly', record_id, anomaly is not None):
+            return
+        
+        try:
+            alert_emails = settings.ALERT_EMAILS
+            if not alert_emails:
+                logging.error("未配置预警邮箱")
+                self.alert_state.rearm(self.alert_room(), 'consumption_anomaly')
+                return
+            
+            body = f"""
+            您好！
+            
+            检测到用电量明显高于该时段的平时水平，请检查是否有电器（如空调、热水器）忘记关闭：
+            
+            时间段: {anomaly['start_time']} ~ {anomaly['end_time']}
+            消费金额: {anomaly['amount']:.2f} 元
+            用电速率: {anomaly['rate']:.2f} 元/小时
+            平时水平: {anomaly['expected_rate']:.2f} 元/小时
+            偏离程度: {anomaly['z_score']} 倍标准差
+            
+            ---
+            电费自动提醒系统
+            """
+            
+            sent_count = self.deliver_alert('consumption_anomaly', alert_emails, "⚡ 用电异常提醒", body)
+            
+            if sent_count == 0:
+                self.alert_state.rearm(self.alert_room(), 'consumption_anomaly')
+            
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO alerts (alert_type, message, sent)
+                VALUES (?, ?, ?)
+            ''', ('consumption_anomaly', f"用电异常: {anomaly['rate']}元/小时（平时{anomaly['expected_rate']}元/小时），已发送{sent_count}封邮件", 1 if sent_count else 0))
+            conn.commit()
+            conn.close()
+            
+            logging.info(f"用电异常提醒发送完成，成功发送{sent_count}封邮件")
+            
+        except Exception as e:
+            self.alert_state.rearm(self.alert_room(), 'consumption_anomaly')
+            logging.error(f"发送用电异常提醒时出现错误: {str(e)}")
+    
     def get_recent_records(self, limit=20):
         """获取最近的记录"""
-        conn = sqlite3.connect('electric_data.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -459,7 +714,7 @@ class ElectricMonitor:
     
     def get_statistics(self):
         """获取统计数据"""
-        conn = sqlite3.connect('electric_data.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         # 最新数据
@@ -471,71 +726,55 @@ class ElectricMonitor:
         ''')
         latest = cursor.fetchone()
         
-        # 今日用电量
-        cursor.execute('''
-            SELECT usage_today FROM electric_records
-            WHERE timestamp >= datetime('now', 'localtime', 'start of day')
-            AND usage_today IS NOT NULL
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''')
-        row = cursor.fetchone()
-        today_usage = row[0] if row else None
-        
-        # 本月用电量
-        cursor.execute('''
-            SELECT usage_month FROM electric_records
-            WHERE timestamp >= datetime('now', 'localtime', 'start of month')
-            AND usage_month IS NOT NULL
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''')
-        row = cursor.fetchone()
-        month_usage = row[0] if row else None
+        # 今日和本月用电量（直接读取用电量累加器）
+        usage = usage_accumulator.totals(cursor)
+        today_usage = usage['day']['kwh']
+        month_usage = usage['month']['kwh']
 
+        # 余额趋势按本地时间的整数时间键分组，时间范围比较整数时间戳
+        now = datetime.now()
+        
         # 余额趋势（最近24小时，按小时统计）
         cursor.execute('''
-            SELECT strftime('%Y-%m-%d %H:00:00', timestamp) as hour, AVG(balance) as avg_balance
+            SELECT hour_key, AVG(balance) as avg_balance
             FROM electric_records
-            WHERE timestamp > datetime('now', 'localtime', '-24 hours')
+            WHERE epoch > ?
             AND balance IS NOT NULL
-            GROUP BY strftime('%Y-%m-%d %H', timestamp)
-            ORDER BY hour
-        ''')
-        balance_trend_hourly = cursor.fetchall()
+            GROUP BY hour_key
+            ORDER BY hour_key
+        ''', (int((now - timedelta(hours=24)).timestamp()),))
+        balance_trend_hourly = [(time_keys.hour_label(key), balance) for key, balance in cursor.fetchall()]
         
         # 余额趋势（最近30天，按天统计）
         cursor.execute('''
-            SELECT date(timestamp) as date, AVG(balance) as avg_balance
+            SELECT day_key, AVG(balance) as avg_balance
             FROM electric_records
-            WHERE timestamp > datetime('now', 'localtime', '-30 days')
+            WHERE epoch > ?
             AND balance IS NOT NULL
-            GROUP BY date(timestamp)
-            ORDER BY date
-        ''')
-        balance_trend_daily = cursor.fetchall()
+            GROUP BY day_key
+            ORDER BY day_key
+        ''', (int((now - timedelta(days=30)).timestamp()),))
+        balance_trend_daily = [(time_keys.day_label(key), balance) for key, balance in cursor.fetchall()]
         
         # 余额趋势（最近12个月，按月统计）
+        try:
+            year_ago = now.replace(year=now.year - 1)
+        except ValueError:  # 2月29日
+            year_ago = now.replace(year=now.year - 1, day=28)
         cursor.execute('''
-            SELECT strftime('%Y-%m', timestamp) as month, AVG(balance) as avg_balance
+            SELECT day_key / 100 as month_key, AVG(balance) as avg_balance
             FROM electric_records
-            WHERE timestamp > datetime('now', 'localtime', '-12 months')
+            WHERE epoch > ?
             AND balance IS NOT NULL
-            GROUP BY strftime('%Y-%m', timestamp)
-            ORDER BY month
-        ''')
-        balance_trend_monthly = cursor.fetchall()
+            GROUP BY month_key
+            ORDER BY month_key
+        ''', (int(year_ago.timestamp()),))
+        balance_trend_monthly = [(time_keys.month_label(key), balance) for key, balance in cursor.fetchall()]
         
         conn.close()
         
         # 获取余额预测（使用配置的预测方法）
-        prediction_method = getattr(config, 'PREDICTION_METHOD', 'advanced')
-        prediction_threshold = getattr(config, 'PREDICTION_THRESHOLD', 10.0)
-        
-        if prediction_method == 'advanced':
-            prediction = self.predict_balance_advanced(prediction_threshold, use_pattern_analysis=True)
-        else:
-            prediction = self.predict_balance_depletion(prediction_threshold)
+        prediction = self.get_prediction()
         
         return {
             'latest': latest,
@@ -544,35 +783,97 @@ class ElectricMonitor:
             'balance_trend_hourly': balance_trend_hourly,
             'balance_trend_daily': balance_trend_daily,
             'balance_trend_monthly': balance_trend_monthly,
-            'prediction': prediction
+            'prediction': prediction,
+            'upstream': self.upstream_breaker.snapshot()
         }
 
-    def predict_balance_depletion(self, threshold=10.0):
+    def get_prediction(self, method=None, threshold=None):
         """
-        预测电费余额何时会降到指定阈值以下
+        获取余额预测，相同数据版本下的重复调用直接返回缓存结果
         
         Args:
+            method: 预测方法（predictors.REGISTRY 中注册的名称），默认使用配置值
+            threshold: 预警阈值，默认使用配置值
+            
+        Returns:
+            dict: 预测结果（副本，调用方可以修改）
+        """
+        method = method or settings.PREDICTION_METHOD
+        if method not in predictors.REGISTRY:
+            logging.warning(f"未知的预测方法: {method}，使用基础预测")
+            method = 'basic'
+        threshold = float(threshold if threshold is not None else settings.PREDICTION_THRESHOLD)
+        
+        # 预测日期基于当天计算，因此日期也是缓存键的一部分
+        version, _ = self.get_data_version()
+        key = (version, method, threshold, settings.PREDICTION_LOOKBACK_DAYS,
+               datetime.now().strftime('%Y-%m-%d'))
+        
+        with self._prediction_lock:
+            cached = self._prediction_cache.get(key)
+            if cached is not None:
+                self._prediction_cache.move_to_end(key)
+                return copy.deepcopy(cached)
+        
+        prediction = self.predict_balance(method, threshold)
+        
+        # 失败的预测可能是暂时性错误，不缓存
+        if prediction.get('success'):
+            with self._prediction_lock:
+                self._prediction_cache[key] = copy.deepcopy(prediction)
+                self._prediction_cache.move_to_end(key)
+                while len(self._prediction_cache) > PREDICTION_CACHE_SIZE:
+                    self._prediction_cache.popitem(last=False)
+        
+        return prediction
+
+    def load_snapshot(self, cursor):
+        """
+        构造当前时刻的预测数据快照
+        
+        Returns:
+            predictors.Snapshot | None: 没有余额记录时返回None
+        """
+        # 获取当前余额
+        cursor.execute('''
+            SELECT balance FROM electric_records 
+            WHERE balance IS NOT NULL 
+            ORDER BY timestamp DESC 
+            LIMIT 1
+        ''')
+        current_balance_row = cursor.fetchone()
+        if not current_balance_row or current_balance_row[0] is None:
+            return None
+        
+        return predictors.Snapshot(
+            now=datetime.now(),
+            balance=float(current_balance_row[0]),
+            daily=ledger.daily_usage(cursor, predictors.PATTERN_WINDOW_DAYS),
+            rate=ledger.consumption_rate(cursor, predictors.PATTERN_WINDOW_DAYS),
+            profile=usage_heatmap.load(cursor),
+            states=predictors.load_states(cursor)
+        )
+    
+    def predict_balance(self, method, threshold=10.0):
+        """
+        使用已注册的预测方法预测电费余额何时会降到指定阈值以下
+        
+        Args:
+            method: 预测方法名称
             threshold: 预警阈值，默认10元
             
         Returns:
-            dict: 包含预测结果的字典
+            dict: 包含预测结果的字典，非基础方法出错时回退到基础预测
         """
         try:
-            conn = sqlite3.connect('electric_data.db')
-            cursor = conn.cursor()
-            
-            # 获取当前余额
-            cursor.execute('''
-                SELECT balance FROM electric_records 
-                WHERE balance IS NOT NULL 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            ''')
-            current_balance_row = cursor.fetchone()
+            conn = self.connect()
+            try:
+                snapshot = self.load_snapshot(conn.cursor())
+            finally:
+                conn.close()
             
-            if not current_balance_row or current_balance_row[0] is None:
+            if snapshot is None:
                 logging.warning("无法获取当前余额，预测失败")
-                conn.close()
                 return {
                     'success': False,
                     'message': '无法获取当前余额',
@@ -584,99 +885,19 @@ class ElectricMonitor:
                     'prediction_confidence': 'low'
                 }
             
-            current_balance = float(current_balance_row[0])
-            
-            # 如果当前余额已经低于阈值
-            if current_balance <= threshold:
-                conn.close()
-                return {
-                    'success': True,
-                    'message': f'当前余额已低于{threshold}元',
-                    'current_balance': current_balance,
-                    'threshold': threshold,
-                    'days_remaining': 0,
-                    'predicted_date': datetime.now().strftime('%Y-%m-%d'),
-                    'daily_usage_avg': 0.0,
-                    'prediction_confidence': 'high'
-                }
-            
-            # 计算最近7天的每日平均用电费用
-            cursor.execute('''
-                SELECT date(timestamp) as date, 
-                       MIN(balance) as min_balance, 
-                       MAX(balance) as max_balance,
-                       COUNT(*) as record_count
-                FROM electric_records 
-                WHERE timestamp > datetime('now', '-7 days')
-                AND balance IS NOT NULL
-                GROUP BY date(timestamp)
-                HAVING record_count >= 2
-                ORDER BY date DESC
-            ''')
-            daily_usage_data = cursor.fetchall()
-            
-            if len(daily_usage_data) < 3:
-                # 数据不足，使用最近30天的数据计算平均值
-                cursor.execute('''
-                    SELECT 
-                        (MAX(balance) - MIN(balance)) / 
-                        CAST((julianday('now') - julianday(MIN(timestamp))) AS REAL) as daily_avg
-                    FROM electric_records 
-                    WHERE timestamp > datetime('now', '-30 days')
-                    AND balance IS NOT NULL
-                ''')
-                result = cursor.fetchone()
-                daily_usage_avg = abs(float(result[0])) if result and result[0] else 1.0
-                confidence = 'low'
-            else:
-                # 计算每日用电费用（取正值）
-                daily_usages = []
-                for i, (date, min_bal, max_bal, count) in enumerate(daily_usage_data):
-                    if max_bal and min_bal:
-                        daily_cost = abs(float(max_bal) - float(min_bal))
-                        # 如果当天有充值（余额增加很多），则跳过
-                        if daily_cost < 50:  # 假设单日用电不会超过50元
-                            daily_usages.append(daily_cost)
-                
-                if daily_usages:
-                    daily_usage_avg = sum(daily_usages) / len(daily_usages)
-                    confidence = 'high' if len(daily_usages) >= 5 else 'medium'
-                else:
-                    daily_usage_avg = 1.0
-                    confidence = 'low'
-            
-            # 如果平均用电费用太小，设置最小值
-            if daily_usage_avg < 0.1:
-                daily_usage_avg = 1.0
-                confidence = 'low'
-            
-            # 计算预计天数
-            remaining_amount = current_balance - threshold
-            if daily_usage_avg > 0:
-                days_remaining = remaining_amount / daily_usage_avg
-                predicted_date = (datetime.now() + timedelta(days=int(days_remaining))).strftime('%Y-%m-%d')
-            else:
-                days_remaining = None
-                predicted_date = None
-                confidence = 'low'
-            
-            conn.close()
-            
-            logging.info(f"余额预测完成: 当前余额={current_balance}元, 日均用电费用={daily_usage_avg}元, 预计{days_remaining:.1f}天后降到{threshold}元以下")
-            
-            return {
-                'success': True,
-                'message': '预测成功',
-                'current_balance': current_balance,
-                'threshold': threshold,
-                'days_remaining': round(days_remaining, 1) if days_remaining else None,
-                'predicted_date': predicted_date,
-                'daily_usage_avg': round(daily_usage_avg, 2),
-                'prediction_confidence': confidence
-            }
+            prediction = predictors.predict(method, snapshot, threshold)
+            if prediction.get('prediction_method') == 'basic_fallback':
+                logging.info(f"数据不足，{method}预测使用基础预测方法")
+            logging.info(f"余额预测完成({prediction.get('prediction_method', method)}): 当前余额={snapshot.balance}元, 日均用电费用={prediction['daily_usage_avg']}元, 预计{prediction['days_remaining']}天后降到{threshold}元以下")
+            return prediction
             
         except Exception as e:
-            logging.error(f"余额预测时出错: {str(e)}")
+            logging.error(f"余额预测时出错({method}): {str(e)}")
+            if method != 'basic':
+                # 回退到基础预测
+                basic_prediction = self.predict_balance('basic', threshold)
+                basic_prediction['prediction_method'] = 'basic_error_fallback'
+                return basic_prediction
             return {
                 'success': False,
                 'message': f'预测失败: {str(e)}',
@@ -688,45 +909,33 @@ class ElectricMonitor:
                 'prediction_confidence': 'low'
             }
     
-    def send_prediction_alert(self, prediction_data):
+    def send_prediction_alert(self, prediction_data, record_id=None):
         """
-        发送预测预警邮件
+        根据预测结果更新预测预警状态，需要时发送预测预警邮件
         
         Args:
             prediction_data: 预测数据字典
+            record_id: 预测所基于的电费记录ID（默认使用最新记录）
         """
+        if not prediction_data or not prediction_data.get('success'):
+            return
+        
+        # 只有预计在 PREDICTION_ALERT_DAYS 天内不足时才发送预警
+        days_remaining = prediction_data.get('days_remaining')
+        breached = days_remaining is not None and days_remaining <= settings.PREDICTION_ALERT_DAYS
+        if record_id is None:
+            record_id = self.latest_record_id()
+        if not self.alert_state.observe(self.alert_room(), 'prediction_warning', record_id, breached,
+                                        prediction_data.get('current_balance')):
+            return
+        
         try:
-            if not prediction_data or not prediction_data.get('success'):
-                return
-            
-            days_remaining = prediction_data.get('days_remaining')
-            if not days_remaining or days_remaining > 7:  # 只有7天内的预测才发送预警
-                return
-            
-            # 检查是否在24小时内已发送过预测预警
-            conn = sqlite3.connect('electric_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT COUNT(*) FROM alerts 
-                WHERE alert_type = 'prediction_warning' 
-                AND datetime(timestamp) > datetime('now', '-24 hours')
-            ''')
-            
-            recent_alerts = cursor.fetchone()[0]
-            if recent_alerts > 0:
-                logging.info("24小时内已发送过预测预警，跳过发送")
-                conn.close()
-                return
-            
             # 获取提醒邮箱列表
-            alert_emails = []
-            if hasattr(config, 'ALERT_EMAILS') and config.ALERT_EMAILS:
-                alert_emails = config.ALERT_EMAILS
+            alert_emails = settings.ALERT_EMAILS
             
             if not alert_emails:
                 logging.warning("未配置预警邮箱，无法发送预测预警")
-                conn.close()
+                self.alert_state.rearm(self.alert_room(), 'prediction_warning')
                 return
             
             current_balance = prediction_data.get('current_balance', 0)
@@ -772,35 +981,19 @@ https://app.bupt.edu.cn/buptdf/wap/default/chong
 电费自动提醒系统 - 智能预测服务
             """
             
-            # 连接SMTP服务器
-            server = smtplib.SMTP(config.EMAIL_SMTP_SERVER, config.EMAIL_SMTP_PORT)
-            server.starttls()
-            server.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
-            
-            # 发送给每个邮箱
-            sent_count = 0
-            for email in alert_emails:
-                try:
-                    msg = MIMEMultipart()
-                    msg['From'] = config.EMAIL_USERNAME
-                    msg['To'] = email
-                    msg['Subject'] = f"🔮 电费余额预测预警 - 预计{days_remaining:.1f}天后不足"
-                    msg.attach(MIMEText(body, 'plain', 'utf-8'))
-                    
-                    text = msg.as_string()
-                    server.sendmail(config.EMAIL_USERNAME, email, text)
-                    sent_count += 1
-                    logging.info(f"预测预警邮件已发送到: {email}")
-                except Exception as e:
-                    logging.error(f"发送预测预警邮件到 {email} 失败: {str(e)}")
+            subject = f"🔮 电费余额预测预警 - 预计{days_remaining:.1f}天后不足"
+            sent_count = self.deliver_alert('prediction_warning', alert_emails, subject, body)
             
-            server.quit()
+            if sent_count == 0:
+                self.alert_state.rearm(self.alert_room(), 'prediction_warning')
             
             # 记录预警
+            conn = self.connect()
+            cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO alerts (alert_type, message, sent)
                 VALUES (?, ?, ?)
-            ''', ('prediction_warning', f'预测预警: 预计{days_remaining:.1f}天后余额降到{threshold}元以下，已发送{sent_count}封邮件', 1))
+            ''', ('prediction_warning', f'预测预警: 预计{days_remaining:.1f}天后余额降到{threshold}元以下，已发送{sent_count}封邮件', 1 if sent_count else 0))
             
             conn.commit()
             conn.close()
@@ -808,238 +1001,67 @@ https://app.bupt.edu.cn/buptdf/wap/default/chong
             logging.info(f"预测预警邮件发送完成，成功发送{sent_count}封邮件，预计{days_remaining:.1f}天后余额不足")
             
         except Exception as e:
+            self.alert_state.rearm(self.alert_room(), 'prediction_warning')
             logging.error(f"发送预测预警失败: {str(e)}")
     
-    def predict_balance_advanced(self, threshold=10.0, use_pattern_analysis=True):
-        """
-        高级余额预测，考虑工作日/周末用电模式差异
-        
-        Args:
-            threshold: 预警阈值，默认10元
-            use_pattern_analysis: 是否使用模式分析，默认True
-            
-        Returns:
-            dict: 包含详细预测结果的字典
-        """
-        try:
-            conn = sqlite3.connect('electric_data.db')
-            cursor = conn.cursor()
-            
-            # 获取当前余额
-            cursor.execute('''
-                SELECT balance FROM electric_records 
-                WHERE balance IS NOT NULL 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            ''')
-            current_balance_row = cursor.fetchone()
-            
-            if not current_balance_row or current_balance_row[0] is None:
-                logging.warning("无法获取当前余额，高级预测失败")
-                conn.close()
-                return self.predict_balance_depletion(threshold)  # 回退到基础预测
-            
-            current_balance = float(current_balance_row[0])
-            
-            # 如果当前余额已经低于阈值
-            if current_balance <= threshold:
-                conn.close()
-                return {
-                    'success': True,
-                    'message': f'当前余额已低于{threshold}元',
-                    'current_balance': current_balance,
-                    'threshold': threshold,
-                    'days_remaining': 0,
-                    'predicted_date': datetime.now().strftime('%Y-%m-%d'),
-                    'daily_usage_avg': 0.0,
-                    'weekday_avg': 0.0,
-                    'weekend_avg': 0.0,
-                    'prediction_confidence': 'high',
-                    'prediction_method': 'advanced'
-                }
-            
-            if not use_pattern_analysis:
-                # 简单预测
-                basic_prediction = self.predict_balance_depletion(threshold)
-                basic_prediction['prediction_method'] = 'basic'
-                return basic_prediction
-            
-            # 获取最近30天的详细数据进行模式分析
-            cursor.execute('''
-                SELECT 
-                    date(timestamp) as date,
-                    strftime('%w', timestamp) as weekday,
-                    MIN(balance) as min_balance,
-                    MAX(balance) as max_balance,
-                    COUNT(*) as record_count
-                FROM electric_records 
-                WHERE timestamp > datetime('now', '-30 days')
-                AND balance IS NOT NULL
-                GROUP BY date(timestamp)
-                HAVING record_count >= 2
-                ORDER BY date DESC
-            ''')
-            
-            usage_data = cursor.fetchall()
-            
-            if len(usage_data) < 7:
-                logging.info("数据不足，使用基础预测方法")
-                conn.close()
-                basic_prediction = self.predict_balance_depletion(threshold)
-                basic_prediction['prediction_method'] = 'basic_fallback'
-                return basic_prediction
-            
-            # 分析工作日和周末的用电模式
-            weekday_usages = []  # 周一到周五
-            weekend_usages = []  # 周六周日
-            
-            for date, weekday, min_bal, max_bal, count in usage_data:
-                if max_bal and min_bal:
-                    daily_cost = abs(float(max_bal) - float(min_bal))
-                    # 过滤异常数据（充值等）
-                    if daily_cost < 50:
-                        weekday_num = int(weekday)  # 0=周日, 1=周一, ..., 6=周六
-                        if weekday_num == 0 or weekday_num == 6:  # 周末
-                            weekend_usages.append(daily_cost)
-                        else:  # 工作日
-                            weekday_usages.append(daily_cost)
-            
-            # 计算工作日和周末的平均用电费用
-            weekday_avg = sum(weekday_usages) / len(weekday_usages) if weekday_usages else 0
-            weekend_avg = sum(weekend_usages) / len(weekend_usages) if weekend_usages else 0
-            
-            # 如果某种模式数据不足，使用总体平均值
-            if not weekday_usages or not weekend_usages:
-                all_usages = weekday_usages + weekend_usages
-                if all_usages:
-                    overall_avg = sum(all_usages) / len(all_usages)
-                    weekday_avg = weekday_avg or overall_avg
-                    weekend_avg = weekend_avg or overall_avg
-                else:
-                    weekday_avg = weekend_avg = 1.0
-            
-            # 设置最小用电费用
-            weekday_avg = max(weekday_avg, 0.1)
-            weekend_avg = max(weekend_avg, 0.1)
-            
-            # 计算预测（考虑一周的循环）
-            current_date = datetime.now()
-            remaining_amount = current_balance - threshold
-            total_cost = 0
-            days_count = 0
-            prediction_date = current_date
-            
-            # 模拟未来的用电，直到余额低于阈值
-            while total_cost < remaining_amount and days_count < 365:  # 最多预测一年
-                prediction_date = current_date + timedelta(days=days_count)
-                weekday_num = prediction_date.weekday()  # 0=周一, 6=周日
-                
-                if weekday_num >= 5:  # 周末 (5=周六, 6=周日)
-                    daily_cost = weekend_avg
-                else:  # 工作日
-                    daily_cost = weekday_avg
-                
-                total_cost += daily_cost
-                days_count += 1
-            
-            # 计算置信度
-            data_quality = min(len(weekday_usages) + len(weekend_usages), 20) / 20
-            pattern_clarity = abs(weekday_avg - weekend_avg) / max(weekday_avg, weekend_avg)
-            confidence_score = (data_quality + pattern_clarity) / 2
-            
-            if confidence_score > 0.7:
-                confidence = 'high'
-            elif confidence_score > 0.4:
-                confidence = 'medium'
-            else:
-                confidence = 'low'
-            
-            # 计算整体日均用电费用（用于兼容性）
-            overall_daily_avg = (weekday_avg * 5 + weekend_avg * 2) / 7
-            
-            conn.close()
-            
-            logging.info(f"高级余额预测完成: 当前余额={current_balance}元, 工作日均={weekday_avg:.2f}元, 周末均={weekend_avg:.2f}元, 预计{days_count}天后降到{threshold}元以下")
-            
-            return {
-                'success': True,
-                'message': '高级预测成功',
-                'current_balance': current_balance,
-                'threshold': threshold,
-                'days_remaining': round(days_count, 1) if days_count > 0 else None,
-                'predicted_date': prediction_date.strftime('%Y-%m-%d') if days_count > 0 else None,
-                'daily_usage_avg': round(overall_daily_avg, 2),
-                'weekday_avg': round(weekday_avg, 2),
-                'weekend_avg': round(weekend_avg, 2),
-                'prediction_confidence': confidence,
-                'prediction_method': 'advanced',
-                'data_points': {
-                    'weekday_samples': len(weekday_usages),
-                    'weekend_samples': len(weekend_usages),
-                    'confidence_score': round(confidence_score, 2)
-                }
-            }
-            
-        except Exception as e:
-            logging.error(f"高级余额预测时出错: {str(e)}")
-            # 回退到基础预测
-            basic_prediction = self.predict_balance_depletion(threshold)
-            basic_prediction['prediction_method'] = 'basic_error_fallback'
-            return basic_prediction
-    
     def save_prediction_record(self, prediction_data):
         """
         保存预测记录用于后续准确性评估
         
+        每个新的电费数据点、预测方法和阈值只保存一条快照，
+        重复调用（如刷新页面）不会产生新记录
+        
         Args:
             prediction_data: 预测结果数据
         """
         try:
-            conn = sqlite3.connect('electric_data.db')
+            conn = self.connect()
             cursor = conn.cursor()
             
-            # 创建预测记录表（如果不存在）
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prediction_records (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    current_balance REAL NOT NULL,
-                    threshold REAL NOT NULL,
-                    predicted_days REAL,
-                    predicted_date TEXT,
-                    daily_avg REAL,
-                    weekday_avg REAL,
-                    weekend_avg REAL,
-                    prediction_method TEXT,
-                    confidence TEXT,
-                    actual_days REAL,
-                    accuracy_score REAL,
-                    is_evaluated INTEGER DEFAULT 0
-                )
-            ''')
+            # 预测快照对应的最新数据点
+            cursor.execute('SELECT MAX(id) FROM electric_records WHERE balance IS NOT NULL')
+            row = cursor.fetchone()
+            record_id = row[0] if row else None
+            if record_id is None:
+                conn.close()
+                return
+            
+            method = prediction_data.get('prediction_method', 'basic')
+            threshold = prediction_data.get('threshold', 10)
+            snapshot_key = (record_id, method, float(threshold))
+            if snapshot_key == self._last_snapshot_key:
+                conn.close()
+                return
             
-            # 插入预测记录
+            # 插入预测记录（同一数据点已有快照时忽略）
+            now = datetime.now().replace(microsecond=0)
             cursor.execute('''
                 INSERT INTO prediction_records 
-                (timestamp, current_balance, threshold, predicted_days, predicted_date, 
-                 daily_avg, weekday_avg, weekend_avg, prediction_method, confidence)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (timestamp, epoch, current_balance, threshold, predicted_days, predicted_date, 
+                 daily_avg, weekday_avg, weekend_avg, prediction_method, confidence, record_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (record_id, prediction_method, threshold) DO NOTHING
             ''', (
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                now.strftime('%Y-%m-%d %H:%M:%S'),
+                int(now.timestamp()),
                 prediction_data.get('current_balance', 0),
-                prediction_data.get('threshold', 10),
+                threshold,
                 prediction_data.get('days_remaining'),
                 prediction_data.get('predicted_date'),
                 prediction_data.get('daily_usage_avg', 0),
                 prediction_data.get('weekday_avg', 0),
                 prediction_data.get('weekend_avg', 0),
-                prediction_data.get('prediction_method', 'basic'),
-                prediction_data.get('prediction_confidence', 'low')
+                method,
+                prediction_data.get('prediction_confidence', 'low'),
+                record_id
             ))
+            inserted = cursor.rowcount > 0
             
             conn.commit()
             conn.close()
-            logging.info("预测记录已保存")
+            self._last_snapshot_key = snapshot_key
+            if inserted:
+                logging.info("预测记录已保存")
             
         except Exception as e:
             logging.error(f"保存预测记录失败: {str(e)}")
@@ -1052,114 +1074,73 @@ https://app.bupt.edu.cn/buptdf/wap/default/chong
             dict: 预测准确性统计信息
         """
         try:
-            conn = sqlite3.connect('electric_data.db')
+            conn = self.connect()
             cursor = conn.cursor()
             
             # 获取未评估的预测记录
             cursor.execute('''
-                SELECT id, timestamp, current_balance, threshold, predicted_days, 
+                SELECT id, epoch, current_balance, threshold, predicted_days, 
                        predicted_date, prediction_method
                 FROM prediction_records 
                 WHERE is_evaluated = 0 AND predicted_days IS NOT NULL
-                ORDER BY timestamp ASC
+                ORDER BY epoch ASC
             ''')
             
             unevaluated_predictions = cursor.fetchall()
-            evaluated_count = 0
             
-            for pred_id, pred_timestamp, pred_balance, threshold, predicted_days, predicted_date, method in unevaluated_predictions:
-                # 查找实际到达阈值的时间
+            # 每个阈值只查询一次余额不高于阈值的记录时间，再逐个预测二分查找第一次到达阈值的时间
+            crossings = {}
+            for threshold in {row[3] for row in unevaluated_predictions}:
+                earliest = min(row[1] for row in unevaluated_predictions if row[3] == threshold)
                 cursor.execute('''
-                    SELECT timestamp, balance
-                    FROM electric_records
-                    WHERE timestamp > ? AND balance <= ?
-                    ORDER BY timestamp ASC
-                    LIMIT 1
-                ''', (pred_timestamp, threshold))
+                    SELECT epoch FROM electric_records
+                    WHERE epoch > ? AND balance <= ?
+                    ORDER BY epoch ASC
+                ''', (earliest, threshold))
+                crossings[threshold] = [row[0] for row in cursor.fetchall()]
+            
+            updates = []
+            evaluations = []
+            for pred_id, pred_epoch, pred_balance, threshold, predicted_days, predicted_date, method in unevaluated_predictions:
+                # 查找实际到达阈值的时间
+                times = crossings[threshold]
+                index = bisect_right(times, pred_epoch)
+                if index == len(times):
+                    continue
                 
-                actual_result = cursor.fetchone()
+                # 计算实际天数
+                actual_days = (times[index] - pred_epoch) / (24 * 3600)
                 
-                if actual_result:
-                    actual_timestamp, actual_balance = actual_result
-                    
-                    # 计算实际天数
-                    pred_dt = datetime.strptime(pred_timestamp, '%Y-%m-%d %H:%M:%S')
-                    actual_dt = datetime.strptime(actual_timestamp, '%Y-%m-%d %H:%M:%S')
-                    actual_days = (actual_dt - pred_dt).total_seconds() / (24 * 3600)
-                    
-                    # 计算准确性分数 (0-100, 100为完全准确)
-                    if predicted_days > 0:
-                        error_ratio = abs(actual_days - predicted_days) / predicted_days
-                        accuracy_score = max(0, 100 - error_ratio * 100)
-                    else:
-                        accuracy_score = 0
-                    
-                    # 更新预测记录
-                    cursor.execute('''
-                        UPDATE prediction_records 
-                        SET actual_days = ?, accuracy_score = ?, is_evaluated = 1
-                        WHERE id = ?
-                    ''', (actual_days, accuracy_score, pred_id))
-                    
-                    evaluated_count += 1
-            
+                # 计算准确性分数 (0-100, 100为完全准确)
+                if predicted_days > 0:
+                    error_ratio = abs(actual_days - predicted_days) / predicted_days
+                    accuracy_score = max(0, 100 - error_ratio * 100)
+                else:
+                    accuracy_score = 0
+                
+                updates.append((actual_days, accuracy_score, pred_id))
+                evaluations.append((method, accuracy_score))
+            
+            # 更新预测记录，并累加到准确性统计
+            cursor.executemany('''
+                UPDATE prediction_records 
+                SET actual_days = ?, accuracy_score = ?, is_evaluated = 1
+                WHERE id = ?
+            ''', updates)
+            analytics.record_evaluations(cursor, evaluations)
             conn.commit()
             
-            # 获取准确性统计
-            cursor.execute('''
-                SELECT 
-                    prediction_method,
-                    COUNT(*) as total_predictions,
-                    AVG(accuracy_score) as avg_accuracy,
-                    MIN(accuracy_score) as min_accuracy,
-                    MAX(accuracy_score) as max_accuracy,
-                    COUNT(CASE WHEN accuracy_score >= 80 THEN 1 END) as high_accuracy_count
-                FROM prediction_records 
-                WHERE is_evaluated = 1 AND accuracy_score IS NOT NULL
-                GROUP BY prediction_method
-            ''')
-            
-            accuracy_stats = cursor.fetchall()
-            
-            # 获取总体统计
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_evaluated,
-                    AVG(accuracy_score) as overall_accuracy,
-                    COUNT(CASE WHEN accuracy_score >= 80 THEN 1 END) as high_accuracy_total
-                FROM prediction_records 
-                WHERE is_evaluated = 1 AND accuracy_score IS NOT NULL
-            ''')
-            
-            overall_stats = cursor.fetchone()
-            
+            summary = analytics.accuracy_summary(cursor)
             conn.close()
             
-            result = {
-                'success': True,
-                'evaluated_count': evaluated_count,
-                'overall_stats': {
-                    'total_predictions': overall_stats[0] if overall_stats else 0,
-                    'average_accuracy': round(overall_stats[1], 2) if overall_stats and overall_stats[1] else 0,
-                    'high_accuracy_rate': round((overall_stats[2] / overall_stats[0] * 100), 2) if overall_stats and overall_stats[0] > 0 else 0
-                },
-                'method_stats': []
-            }
-            
-            for method, total, avg_acc, min_acc, max_acc, high_acc_count in accuracy_stats:
-                result['method_stats'].append({
-                    'method': method,
-                    'total_predictions': total,
-                    'average_accuracy': round(avg_acc, 2) if avg_acc else 0,
-                    'min_accuracy': round(min_acc, 2) if min_acc else 0,
-                    'max_accuracy': round(max_acc, 2) if max_acc else 0,
-                    'high_accuracy_rate': round((high_acc_count / total * 100), 2) if total > 0 else 0
-                })
-            
+            evaluated_count = len(updates)
+            self._last_evaluated_count = evaluated_count
             if evaluated_count > 0:
+                with self._prediction_lock:
+                    self._aggregate_cache.pop('accuracy', None)
                 logging.info(f"预测准确性评估完成，评估了{evaluated_count}个预测记录")
             
-            return result
+            return dict(summary, success=True, evaluated_count=evaluated_count)
             
         except Exception as e:
             logging.error(f"评估预测准确性失败: {str(e)}")
@@ -1171,71 +1152,203 @@ https://app.bupt.edu.cn/buptdf/wap/default/chong
                 'method_stats': []
             }
     
-# 创建监控实例
+    def get_aggregate(self, name, build):
+        """
+        按数据版本缓存的分析汇总，数据版本或日期变化后重新计算
+        
+        Args:
+            name: 汇总名称
+            build: 接收数据库游标、返回汇总结果的函数
+        """
+        version, _ = self.get_data_version()
+        key = (version, datetime.now().strftime('%Y-%m-%d'))
+        with self._prediction_lock:
+            cached = self._aggregate_cache.get(name)
+            if cached is not None and cached[0] == key:
+                return copy.deepcopy(cached[1])
+        
+        conn = self.connect()
+        try:
+            result = build(conn.cursor())
+        finally:
+            conn.close()
+        
+        with self._prediction_lock:
+            self._aggregate_cache[name] = (key, copy.deepcopy(result))
+        return result
+    
+    def get_usage_analytics(self):
+        """最近30天工作日/周末用电模式"""
+        return self.get_aggregate('usage_pattern', analytics.usage_pattern)
+    
+    def get_accuracy_summary(self):
+        """各预测方法的准确性统计"""
+        result = self.get_aggregate('accuracy', analytics.accuracy_summary)
+        result['evaluated_count'] = self._last_evaluated_count
+        return result
+    
+# 创建监控实例（不访问数据库，首次使用时才初始化）
 monitor = ElectricMonitor()
 
+def scheduler_running():
+    """本进程是否负责运行定时任务"""
+    return scheduler is not None and scheduler.running
+
+# 健康检查（后台探测，请求时只读取缓存结果）
+health_probe = health.HealthProbe(
+    monitor, scheduler_running,
+    interval=getattr(config, 'HEALTH_PROBE_INTERVAL', 30),
+    max_data_age=getattr(config, 'READINESS_MAX_DATA_AGE_MINUTES', 180) * 60
+)
+
+def create_app(start_background=True):
+    """
+    创建Flask应用（也是WSGI服务器的入口）
+
+    Args:
+        start_background: 是否启动定时任务调度器和健康检查探测，基准测试等只处理请求的场景传False
+    """
+    error = check_config()
+    if error:
+        raise RuntimeError(error)
+
+    setup_logging()
+
+    app = Flask(__name__)
+    app.secret_key = 'electric_monitor_secret_key'
+    app.add_template_filter(to_json_filter, 'tojsonfilter')
+    app.register_blueprint(bp)
+
+    # 按需性能分析（PROFILING_ENABLED 或带签名的 ?_profile= 参数）
+    profiler.init_app(app, config)
+    # 条件请求、JSON压缩和静态文件长期缓存
+    http_cache.init_app(app, getattr(config, 'GZIP_MIN_SIZE', 1024))
+
+    if start_background:
+        start_background_tasks()
+    return app
+
+def api_data_version():
+    """
+    API响应的缓存版本：数据版本、设置版本、熔断器状态和当前小时（统计窗口随时间滑动），
+    最后修改时间取其中最晚的变更时间
+    """
+    version, latest_timestamp = monitor.get_data_version()
+    breaker = monitor.upstream_breaker
+    hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+    return (f"{version}|{settings.version}|{breaker.generation}|{hour.strftime('%Y%m%d%H')}",
+            http_cache.last_modified(latest_timestamp, settings.updated_at, breaker.changed_at, hour.timestamp()))
+
 # Web路由
-@app.route('/')
+@bp.route('/healthz')
+def healthz():
+    """存活检查"""
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz')
+def readyz():
+    """就绪检查，返回后台探测的缓存结果"""
+    health_probe.start()
+    ready, detail = health_probe.readiness()
+    return jsonify(detail), 200 if ready else 503
+
+@bp.route('/')
 def index():
     """主页"""
     stats = monitor.get_statistics()
     records = monitor.get_recent_records(10)
     return render_template('index.html', stats=stats, records=records)
 
-@app.route('/api/stats')
+@bp.route('/api/stats')
+@http_cache.conditional(api_data_version)
 def api_stats():
     """获取统计数据API"""
     stats = monitor.get_statistics()
     return jsonify(stats)
 
-@app.route('/api/records')
+@bp.route('/api/records')
+@http_cache.conditional(api_data_version)
 def api_records():
     """获取记录数据API"""
     limit = request.args.get('limit', 20, type=int)
     records = monitor.get_recent_records(limit)
     return jsonify({'records': records})
 
-@app.route('/api/check', methods=['POST'])
+@bp.route('/api/series')
+@http_cache.conditional(api_data_version)
+def api_series():
+    """余额曲线API，按时间范围返回降采样到指定点数的数据"""
+    try:
+        start = series.parse_time(request.args.get('from'))
+        end = series.parse_time(request.args.get('to'))
+        points = min(max(request.args.get('points', 500, type=int), 10), 5000)
+        
+        conn = monitor.connect()
+        try:
+            result = series.load_series(conn, start, end, points)
+        finally:
+            conn.close()
+        
+        result['success'] = True
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logging.error(f"获取余额曲线失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'获取余额曲线失败: {str(e)}'})
+
+@bp.route('/api/check', methods=['POST'])
 def api_check():
     """立即检查电费API"""
     try:
         # 直接获取电费数据，内部会智能检查是否需要登录
         data = monitor.get_electric_data()
         if data:
+            # 保存时会同时更新余额预警状态
             monitor.save_data(data)
-              # 检查是否需要发送传统余额预警
-            if float(data['balance']) < config.LOW_BALANCE_THRESHOLD:
-                monitor.send_alert(data['balance'])
             
             # 检查预测性预警
-            prediction_data = monitor.predict_balance_depletion(config.LOW_BALANCE_THRESHOLD)
-            if (prediction_data.get('success') and 
-                prediction_data.get('days_remaining') is not None and
-                prediction_data.get('days_remaining') <= 7):
-                monitor.send_prediction_alert(prediction_data)
+            prediction_data = monitor.get_prediction('basic', settings.LOW_BALANCE_THRESHOLD)
+            monitor.send_prediction_alert(prediction_data)
             
             return jsonify({
                 'success': True, 
                 'message': '检查完成',
                 'data': data
             })
+        elif monitor.upstream_breaker.state == circuit_breaker.OPEN:
+            return jsonify({
+                'success': False,
+                'message': f'上游服务暂时不可用，约{monitor.upstream_breaker.retry_after():.0f}秒后重试',
+                'upstream': monitor.upstream_breaker.snapshot()
+            })
         else:
             return jsonify({'success': False, 'message': '获取数据失败'})
     except Exception as e:
         logging.error(f"API检查失败: {str(e)}")
         return jsonify({'success': False, 'message': f'检查失败: {str(e)}'})
 
-@app.route('/api/records', methods=['DELETE'])
+@bp.route('/api/records', methods=['DELETE'])
 def api_clear_records():
     """清空所有记录API"""
     try:
-        conn = sqlite3.connect('electric_data.db')
+        conn = monitor.connect()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM electric_records')
         cursor.execute('DELETE FROM alerts')
         cursor.execute('DELETE FROM prediction_records')
+        cursor.execute('DELETE FROM balance_rollup')
+        cursor.execute('DELETE FROM alert_state')
+        cursor.execute('DELETE FROM usage_accumulator')
+        cursor.execute('DELETE FROM consumption_ledger')
+        cursor.execute('DELETE FROM usage_profile')
+        cursor.execute('DELETE FROM consumption_daily')
+        cursor.execute('DELETE FROM prediction_accuracy_stats')
+        cursor.execute('DELETE FROM predictor_state')
+        cursor.execute('DELETE FROM anomaly_baseline')
         conn.commit()
         conn.close()
+        monitor.mark_data_changed()
         
         logging.info("用户清空了所有记录")
         return jsonify({'success': True, 'message': '记录已清空'})
@@ -1243,17 +1356,27 @@ def api_clear_records():
         logging.error(f"清空记录失败: {str(e)}")
         return jsonify({'success': False, 'message': f'清空失败: {str(e)}'})
 
-@app.route('/api/records/<int:record_id>', methods=['DELETE'])
+@bp.route('/api/records/<int:record_id>', methods=['DELETE'])
 def api_delete_record(record_id):
     """删除单条记录API"""
     try:
-        conn = sqlite3.connect('electric_data.db')
+        conn = monitor.connect()
         cursor = conn.cursor()
+        cursor.execute('SELECT timestamp FROM electric_records WHERE id = ?', (record_id,))
+        row = cursor.fetchone()
         cursor.execute('DELETE FROM electric_records WHERE id = ?', (record_id,))
         
         if cursor.rowcount > 0:
+            # 重新计算被删除记录所在时间桶的预聚合
+            series.rebuild_rollup(cursor, datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S'))
+            usage_accumulator.rebuild(cursor)
+            ledger.rebuild(cursor, since=row[0])
+            usage_heatmap.rebuild(cursor)
+            predictors.rebuild_states(cursor)
+            anomaly_detector.rebuild(cursor)
             conn.commit()
             conn.close()
+            monitor.mark_data_changed()
             logging.info(f"用户删除了记录ID: {record_id}")
             return jsonify({'success': True, 'message': '记录已删除'})
         else:
@@ -1263,24 +1386,22 @@ def api_delete_record(record_id):
         logging.error(f"删除记录失败: {str(e)}")
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'})
 
-@app.route('/api/prediction', methods=['GET'])
+@bp.route('/api/prediction', methods=['GET'])
+@http_cache.conditional(api_data_version)
 def api_get_prediction():
     """获取余额预测API"""
     try:
         # 获取阈值参数，默认使用配置值
-        threshold = float(request.args.get('threshold', getattr(config, 'PREDICTION_THRESHOLD', 10.0)))
+        threshold = float(request.args.get('threshold', settings.PREDICTION_THRESHOLD))
         
         # 获取预测方法参数
-        method = request.args.get('method', getattr(config, 'PREDICTION_METHOD', 'advanced'))
+        method = request.args.get('method', settings.PREDICTION_METHOD)
         
         # 获取预测数据
-        if method == 'advanced':
-            prediction = monitor.predict_balance_advanced(threshold, use_pattern_analysis=True)
-        else:
-            prediction = monitor.predict_balance_depletion(threshold)
+        prediction = monitor.get_prediction(method, threshold)
         
         # 保存预测记录（如果启用）
-        if getattr(config, 'PREDICTION_ACCURACY_EVALUATION', True) and prediction.get('success'):
+        if settings.PREDICTION_ACCURACY_EVALUATION and prediction.get('success'):
             monitor.save_prediction_record(prediction)
         
         return jsonify(prediction)
@@ -1297,22 +1418,24 @@ def api_get_prediction():
             'prediction_confidence': 'low'
         })
 
-@app.route('/api/config', methods=['GET'])
+@bp.route('/api/config', methods=['GET'])
 def api_get_config():
     """获取系统配置API"""
     try:
         # 读取当前配置
         config_data = {
-            'threshold': getattr(config, 'LOW_BALANCE_THRESHOLD', 10.0),
-            'emails': getattr(config, 'ALERT_EMAILS', [config.ALERT_EMAIL] if hasattr(config, 'ALERT_EMAIL') else []), # type: ignore
-            'check_frequency': getattr(config, 'CHECK_FREQUENCY_MINUTES', 60)
+            'threshold': settings.LOW_BALANCE_THRESHOLD,
+            'emails': settings.ALERT_EMAILS,
+            'check_frequency': settings.CHECK_FREQUENCY_MINUTES,
+            'digest_enabled': settings.ALERT_DIGEST_ENABLED,
+            'digest_minutes': settings.ALERT_DIGEST_MINUTES
         }
         return jsonify({'success': True, 'config': config_data})
     except Exception as e:
         logging.error(f"获取配置失败: {str(e)}")
         return jsonify({'success': False, 'message': f'获取配置失败: {str(e)}'})
 
-@app.route('/api/config', methods=['POST'])
+@bp.route('/api/config', methods=['POST'])
 def api_save_config():
     """保存系统配置API"""
     try:
@@ -1327,7 +1450,6 @@ def api_save_config():
         check_frequency = data.get('check_frequency', 60)
         
         # 验证邮箱格式
-        import re
         email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
         valid_emails = []
         for email in emails:
@@ -1338,49 +1460,20 @@ def api_save_config():
         if not valid_emails:
             return jsonify({'success': False, 'message': '请至少配置一个有效的邮箱地址'})
         
-        # 更新配置文件
-        config_content = f'''#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-电费自动提醒系统配置文件
-"""
-
-# 北邮统一身份认证账号
-BUPT_USERNAME = "{getattr(config, 'BUPT_USERNAME', '')}"
-BUPT_PASSWORD = "{getattr(config, 'BUPT_PASSWORD', '')}"
-
-# 邮箱配置
-EMAIL_USERNAME = "{getattr(config, 'EMAIL_USERNAME', '')}"
-EMAIL_PASSWORD = "{getattr(config, 'EMAIL_PASSWORD', '')}"
-EMAIL_SMTP_SERVER = "{getattr(config, 'EMAIL_SMTP_SERVER', 'smtp.qq.com')}"
-EMAIL_SMTP_PORT = {getattr(config, 'EMAIL_SMTP_PORT', 587)}
-
-# 提醒邮箱列表
-ALERT_EMAILS = {repr(valid_emails)}
-
-# 余额阈值（元）
-LOW_BALANCE_THRESHOLD = {threshold}
-
-# 检查频率（分钟）
-CHECK_FREQUENCY_MINUTES = {check_frequency}
-
-# Web服务配置
-WEB_HOST = "{getattr(config, 'WEB_HOST', '0.0.0.0')}"
-WEB_PORT = {getattr(config, 'WEB_PORT', 5000)}
-DEBUG_MODE = {getattr(config, 'DEBUG_MODE', False)}
-'''
-        
-        # 备份原配置文件
-        import shutil
-        shutil.copy('config.py', 'config.py.backup')
-        
-        # 写入新配置
-        with open('config.py', 'w', encoding='utf-8') as f:
-            f.write(config_content)
-        
-        # 重新加载配置模块
-        import importlib
-        importlib.reload(config)
+        # 写入设置文件，其他进程会在下次读取设置时自动加载
+        changes = {
+            'LOW_BALANCE_THRESHOLD': threshold,
+            'ALERT_EMAILS': valid_emails,
+            'CHECK_FREQUENCY_MINUTES': check_frequency
+        }
+        if 'digest_enabled' in data:
+            changes['ALERT_DIGEST_ENABLED'] = data['digest_enabled']
+        if 'digest_minutes' in data:
+            changes['ALERT_DIGEST_MINUTES'] = data['digest_minutes']
+        try:
+            settings.update(changes)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
         logging.info(f"配置已更新 - 阈值: {threshold}, 邮箱数量: {len(valid_emails)}, 检查频率: {check_frequency}分钟")
         return jsonify({'success': True, 'message': '配置保存成功'})
@@ -1389,7 +1482,7 @@ DEBUG_MODE = {getattr(config, 'DEBUG_MODE', False)}
         logging.error(f"保存配置失败: {str(e)}")
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'})
 
-@app.route('/api/logs', methods=['GET'])
+@bp.route('/api/logs', methods=['GET'])
 def api_get_logs():
     """获取系统日志API"""
     try:
@@ -1397,7 +1490,7 @@ def api_get_logs():
         level = request.args.get('level', 'all')
         
         # 读取日志文件
-        log_file_path = 'electric_monitor.log'
+        log_file_path = log_queue.LOG_FILE
         logs = []
         
         if os.path.exists(log_file_path):
@@ -1438,11 +1531,11 @@ def api_get_logs():
         logging.error(f"获取日志失败: {str(e)}")
         return jsonify({'success': False, 'message': f'获取日志失败: {str(e)}'})
 
-@app.route('/api/logs', methods=['DELETE'])
+@bp.route('/api/logs', methods=['DELETE'])
 def api_clear_logs():
     """清空系统日志API"""
     try:
-        log_file_path = 'electric_monitor.log'
+        log_file_path = log_queue.LOG_FILE
         
         # 清空日志文件
         if os.path.exists(log_file_path):
@@ -1456,49 +1549,91 @@ def api_clear_logs():
         logging.error(f"清空日志失败: {str(e)}")
         return jsonify({'success': False, 'message': f'清空日志失败: {str(e)}'})
 
-@app.route('/api/prediction/analytics')
+@bp.route('/api/analytics/heatmap')
+@http_cache.conditional(api_data_version)
+def api_usage_heatmap():
+    """用电热力图API，返回星期×小时的平均用电速率（元/小时）"""
+    try:
+        conn = monitor.connect()
+        try:
+            profile = usage_heatmap.load(conn.cursor())
+        finally:
+            conn.close()
+        
+        matrix = [[round(value, 4) if value is not None else None for value in row] for row in profile.matrix()]
+        return jsonify({
+            'success': True,
+            'heatmap': {
+                'weekdays': ['周一', '周二', '周三', '周四', '周五', '周六', '周日'],
+                'hours': list(range(24)),
+                'matrix': matrix,
+                'mean_rate': round(profile.mean_rate(), 4),
+                'coverage_hours': round(profile.coverage_hours(), 1),
+                'half_life_days': usage_heatmap.HALF_LIFE_DAYS,
+                'updated_at': profile.updated_at.strftime('%Y-%m-%d %H:%M:%S') if profile.updated_at else None
+            }
+        })
+    except Exception as e:
+        logging.error(f"获取用电热力图失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'获取用电热力图失败: {str(e)}'})
+
+@bp.route('/api/prediction/analytics')
+@http_cache.conditional(api_data_version)
 def api_prediction_analytics():
     """预测分析API"""
     try:
-        # 示例数据结构，后续可替换为真实分析
-        analytics = {
-            "analysis_period": 30,
-            "usage_pattern": {
-                "weekday_avg": 2.35,
-                "weekday_samples": 20,
-                "weekend_avg": 1.85,
-                "weekend_samples": 8,
-                "overall_avg": 2.15,
-                "pattern_difference": 0.5
-            }
-        }
-        return jsonify({"success": True, "analytics": analytics})
+        return jsonify({"success": True, "analytics": monitor.get_usage_analytics()})
     except Exception as e:
+        logging.error(f"获取预测分析失败: {str(e)}")
         return jsonify({"success": False, "message": str(e)})
 
-@app.route('/api/prediction/accuracy')
+@bp.route('/api/prediction/accuracy')
 def api_prediction_accuracy():
     """预测准确性统计API"""
     try:
-        # 示例数据结构，后续可替换为真实统计
-        data = {
-            "success": True,
-            "overall_stats": {
-                "total_predictions": 12,
-                "average_accuracy": 92.3,
-                "high_accuracy_rate": 75.0
-            },
-            "method_stats": [
-                {"method": "advanced", "total_predictions": 7, "average_accuracy": 95.1},
-                {"method": "basic", "total_predictions": 5, "average_accuracy": 88.0}
-            ],
-            "evaluated_count": 2
-        }
-        return jsonify(data)
+        return jsonify(dict(monitor.get_accuracy_summary(), success=True))
     except Exception as e:
+        logging.error(f"获取预测准确性失败: {str(e)}")
         return jsonify({"success": False, "message": str(e)})
 
+@bp.route('/api/admin/profiles')
+def api_list_profiles():
+    """性能分析结果列表API"""
+    if not profiler.is_admin_request(request):
+        return jsonify({'success': False, 'message': '无权访问'}), 403
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'success': True, 'profiles': profiler.list_profiles(limit)})
+
+@bp.route('/api/admin/profiles/<name>')
+def api_download_profile(name):
+    """下载性能分析结果API"""
+    if not profiler.is_admin_request(request):
+        return jsonify({'success': False, 'message': '无权访问'}), 403
+    if not name.endswith(profiler.PROFILE_SUFFIXES):
+        return jsonify({'success': False, 'message': '文件不存在'}), 404
+    return send_from_directory(os.path.abspath(profiler.profile_dir()), name, as_attachment=True)
+
+@bp.route('/api/admin/export')
+def api_export():
+    """流式导出历史数据API（table、format=csv/jsonl/emcb、compress=gzip/lzma）"""
+    if not profiler.is_admin_request(request):
+        return jsonify({'success': False, 'message': '无权访问'}), 403
+    
+    table = request.args.get('table', 'electric_records')
+    fmt = request.args.get('format', 'csv')
+    compression = request.args.get('compress') or None
+    if table not in history_io.TABLES or fmt not in history_io.FORMATS or compression not in (None, 'gzip', 'lzma'):
+        return jsonify({'success': False, 'message': '不支持的表、格式或压缩方式'}), 400
+    
+    filename = history_io.export_filename(table, fmt, compression)
+    return Response(
+        stream_with_context(history_io.stream_export(monitor.connect, table, fmt, compression)),
+        mimetype='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 # 定时任务
+@profiler.profiled('scheduled_check')
 def scheduled_check():
     """定时检查电费"""
     logging.info("开始定时检查电费...")
@@ -1506,35 +1641,23 @@ def scheduled_check():
         # 直接获取电费数据，内部会智能检查是否需要登录
         data = monitor.get_electric_data()
         if data:
+            # 保存时会同时更新余额预警状态
             monitor.save_data(data)
             logging.info(f"定时检查完成 - 余额: {data['balance']}元")
             
-            # 检查是否需要发送传统余额预警
-            if float(data['balance']) < config.LOW_BALANCE_THRESHOLD:
-                monitor.send_alert(data['balance'])
-            
             # 检查预测性预警
-            prediction_threshold = getattr(config, 'PREDICTION_THRESHOLD', config.LOW_BALANCE_THRESHOLD)
-            alert_days = getattr(config, 'PREDICTION_ALERT_DAYS', 7)
-            prediction_method = getattr(config, 'PREDICTION_METHOD', 'advanced')
-            
-            if prediction_method == 'advanced':
-                prediction_data = monitor.predict_balance_advanced(prediction_threshold, use_pattern_analysis=True)
-            else:
-                prediction_data = monitor.predict_balance_depletion(prediction_threshold)
+            prediction_threshold = settings.PREDICTION_THRESHOLD
+            prediction_data = monitor.get_prediction(threshold=prediction_threshold)
             
             # 保存预测记录（如果启用）
-            if getattr(config, 'PREDICTION_ACCURACY_EVALUATION', True) and prediction_data.get('success'):
+            if settings.PREDICTION_ACCURACY_EVALUATION and prediction_data.get('success'):
                 monitor.save_prediction_record(prediction_data)
             
-            # 发送预测预警
-            if (prediction_data.get('success') and 
-                prediction_data.get('days_remaining') is not None and
-                prediction_data.get('days_remaining') <= alert_days):
-                monitor.send_prediction_alert(prediction_data)
+            # 更新预测预警状态，预计在 PREDICTION_ALERT_DAYS 天内不足时发送
+            monitor.send_prediction_alert(prediction_data)
             
             # 定期评估预测准确性
-            if getattr(config, 'PREDICTION_ACCURACY_EVALUATION', True):
+            if settings.PREDICTION_ACCURACY_EVALUATION:
                 monitor.evaluate_prediction_accuracy()
                 
         else:
@@ -1544,6 +1667,16 @@ def scheduled_check():
 
 
 
+# 定时任务调度器（由start_scheduler创建）
+scheduler = None
+
+def flush_alert_digests():
+    """发送到期的汇总邮件（关闭汇总模式后立即发送剩余的预警）"""
+    try:
+        monitor.mailer.flush_digests(settings.ALERT_DIGEST_MINUTES * 60, force=not settings.ALERT_DIGEST_ENABLED)
+    except Exception as e:
+        logging.error(f"发送汇总邮件失败: {str(e)}")
+
 def setup_scheduler():
     """设置调度器，防止重复添加任务"""
     # 清除可能存在的旧任务
@@ -1562,20 +1695,76 @@ def setup_scheduler():
         misfire_grace_time=300  # 允许5分钟的延迟执行
     )
     
+    # 汇总邮件：定期检查发件箱，最早的预警等待满汇总窗口后发送
+    if scheduler.get_job('alert_digest'):
+        scheduler.remove_job('alert_digest')
+    scheduler.add_job(
+        func=flush_alert_digests,
+        trigger="interval",
+        minutes=DIGEST_CHECK_MINUTES,
+        id='alert_digest',
+        max_instances=1,
+        coalesce=True
+    )
+    
     logging.info("定时任务已设置：每小时整点检查电费")
 
     # 注册退出时关闭调度器
     atexit.register(lambda: scheduler.shutdown())
 
-if __name__ == '__main__':
-    # 创建模板目录
-    os.makedirs('templates', exist_ok=True)
-    
-    # 启动定时任务调度器
+# 调度器文件锁（进程存活期间保持打开）
+_scheduler_lock = None
+
+def acquire_scheduler_lock(path):
+    """获取调度器文件锁（非阻塞），同一台机器上只有一个进程能持有，进程退出时自动释放"""
+    global _scheduler_lock
+    handle = open(path, 'a+')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _scheduler_lock = handle
+    return True
+
+def start_background_tasks():
+    """
+    启动后台任务：健康检查探测在每个进程中运行；定时任务调度器只在取得文件锁的一个进程中运行，
+    多个WSGI工作进程不会重复检查电费和发送预警
+    """
+    if scheduler is None and getattr(config, 'SCHEDULER_ENABLED', True):
+        if acquire_scheduler_lock(getattr(config, 'SCHEDULER_LOCK_FILE', 'electric_monitor.scheduler.lock')):
+            start_scheduler()
+        else:
+            logging.info("其他进程已在运行定时任务调度器，本进程只处理Web请求")
+    health_probe.start()
+
+def start_scheduler():
+    """启动定时任务调度器"""
+    global scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+
     scheduler = BackgroundScheduler()
     setup_scheduler()
     if not scheduler.running:
         scheduler.start()
         logging.info("定时任务调度器已启动")
+
+if __name__ == '__main__':
+    config_error = check_config()
+    if config_error:
+        print(config_error)
+        exit(1)
+
+    # 创建模板目录
+    os.makedirs('templates', exist_ok=True)
+
+    # create_app 同时启动定时任务调度器和健康检查探测
+    app = create_app()
     debug_mode = getattr(config, 'DEBUG_MODE', False)
     app.run(host=getattr(config, 'WEB_HOST', '0.0.0.0'), port=getattr(config, 'WEB_PORT', 5100), debug=debug_mode)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预测方法回测 - 在历史数据的每个时间点重放预测，并与实际到达阈值的时间对比
+
+在每个回测时间点只使用该时刻之前的电费记录构造预测快照（每日汇总、日均消费、用电热力图、
+有状态预测方法的模型状态），
+运行所有已注册的预测方法（predictors.REGISTRY），再用之后第一次余额不高于阈值的记录计算准确率，
+评分方式与 evaluate_prediction_accuracy 相同。时间点按连续区段分给多个进程并行计算，
+历史数据在进程启动时传入一次，各进程只读共享。
+
+使用方法:
+    python backtest.py
+    python backtest.py --db electric_data.db --threshold 10 --step-hours 24 --workers 4
+    python backtest.py --methods basic,holt_winters --json backtest.json
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import statistics
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import predictors
+import usage_heatmap
+import usage_accumulator
+
+WARMUP_DAYS = 7           # 数据开始后多少天才开始回测
+PROFILE_HISTORY_DAYS = usage_heatmap.HALF_LIFE_DAYS * 10  # 更早的流水在热力图中的权重可以忽略
+HIGH_ACCURACY_SCORE = 80
+
+# 工作进程中的只读历史数据（由 _init_worker 设置）
+_data = None
+
+
+def load_history(db_path):
+    """读取全部有余额的电费记录，返回 (时间戳数组, 余额数组, 电价数组)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT timestamp, balance, raw_data FROM electric_records
+            WHERE balance IS NOT NULL
+            ORDER BY timestamp, id
+        ''')
+        times, balances, prices = array('d'), array('d'), array('d')
+        for timestamp, balance, raw_data in cursor:
+            times.append(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').timestamp())
+            balances.append(balance)
+            prices.append(usage_accumulator.record_price(raw_data))
+    finally:
+        conn.close()
+    return times, balances, prices
+
+
+def next_crossings(balances, threshold):
+    """每条记录之后（含自身）第一条余额不高于阈值的记录下标，没有时为-1"""
+    result = array('l', [-1]) * (len(balances) + 1)
+    following = -1
+    for index in range(len(balances) - 1, -1, -1):
+        if balances[index] <= threshold:
+            following = index
+        result[index] = following
+    return result
+
+
+def _init_worker(times, balances, prices, crossings):
+    """在工作进程中预先计算每个区间的日期和消费金额"""
+    global _data
+    days = []
+    weekdays = array('b')
+    for value in times:
+        moment = datetime.fromtimestamp(value)
+        days.append(moment.strftime('%Y-%m-%d'))
+        weekdays.append(int(moment.strftime('%w')))
+
+    # 区间 i 为记录 i-1 到记录 i，与用电流水相同
+    consumed = array('d', [0.0])
+    recharged = array('d', [0.0])
+    for index in range(1, len(balances)):
+        delta = balances[index - 1] - balances[index]
+        consumed.append(delta if delta >= 0 else 0.0)
+        recharged.append(-delta if delta < 0 else 0.0)
+
+    _data = {
+        'times': times, 'balances': balances, 'prices': prices, 'crossings': crossings,
+        'days': days, 'weekdays': weekdays, 'consumed': consumed, 'recharged': recharged,
+    }
+
+
+def _daily(index, now):
+    """截至记录 index 的最近30天每日汇总，格式同 ledger.daily_usage"""
+    d = _data
+    since = (now - timedelta(days=predictors.PATTERN_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    first_day = datetime.strptime(since, '%Y-%m-%d') + timedelta(days=1)
+    start = max(bisect_left(d['times'], first_day.timestamp()), 1)
+
+    first = first_day.strftime('%Y-%m-%d')
+    rows = {}
+    for i in range(start, index + 1):
+        # 长区间与每日汇总一样按时长分摊到覆盖的各日期
+        seconds = d['times'][i] - d['times'][i - 1]
+        if d['consumed'][i] > 0 and seconds > usage_accumulator.MAX_INTERVAL_HOURS * 3600:
+            shares = usage_accumulator.day_shares(_text(d['times'][i - 1]), _text(d['times'][i]), seconds)
+        else:
+            shares = ((d['days'][i], 1.0),)
+        for day, share in shares:
+            if day < first:
+                continue
+            row = rows.get(day)
+            if row is None:
+                weekday = d['weekdays'][i] if day == d['days'][i] else int(datetime.strptime(day, '%Y-%m-%d').strftime('%w'))
+                row = rows[day] = [day, weekday, 0.0, 0.0, 0.0, 0]
+            row[2] += d['consumed'][i] * share
+            row[3] += d['consumed'][i] * share / d['prices'][i]
+            row[4] += d['recharged'][i]
+            row[5] += 1
+    return [tuple(row) for row in sorted(rows.values(), reverse=True)]
+
+
+def _text(value):
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _rate(index, cut):
+    """截至记录 index 的最近30天按覆盖时长计算的日均消费金额"""
+    d = _data
+    start = max(bisect_right(d['times'], cut - predictors.PATTERN_WINDOW_DAYS * 86400), 1)
+    if start > index:
+        return None
+    seconds = d['times'][index] - d['times'][start - 1]
+    amount = sum(d['consumed'][start:index + 1])
+    return amount / (seconds / 86400) if seconds > 0 else None
+
+
+def _run_chunk(cuts, methods, threshold):
+    """
+    回测一段连续的时间点
+
+    Returns:
+        dict: {方法名: [(预测天数, 实际天数, 耗时秒, 实际使用的方法)]}，以及跳过的时间点数
+    """
+    d = _data
+    times, balances = d['times'], d['balances']
+    results = {method: [] for method in methods}
+    skipped = 0
+
+    # 热力图只需要从较早的一段流水开始累积，之后随时间点增量更新
+    profile = usage_heatmap.UsageProfile()
+    fed = max(bisect_right(times, cuts[0] - PROFILE_HISTORY_DAYS * 86400), 1)
+
+    # 有状态预测方法从第一条流水开始重放，与应用中逐条更新的状态一致
+    models = [predictors.get(method) for method in methods if predictors.get(method).stateful]
+    states = {model.name: model.initial_state() for model in models}
+    replayed = 1
+
+    for cut in cuts:
+        index = bisect_right(times, cut) - 1
+        if index < 1 or balances[index] <= threshold:
+            skipped += 1
+            continue
+
+        while fed <= index:
+            if balances[fed - 1] >= balances[fed]:
+                profile.add_interval(datetime.fromtimestamp(times[fed - 1]), datetime.fromtimestamp(times[fed]),
+                                     d['consumed'][fed])
+            fed += 1
+
+        while models and replayed <= index:
+            consumed = d['consumed'][replayed]
+            entry = (None, 'consumption' if consumed or not d['recharged'][replayed] else 'recharge', None,
+                     datetime.fromtimestamp(times[replayed]).strftime('%Y-%m-%d %H:%M:%S'),
+                     times[replayed] - times[replayed - 1], None, None, consumed or d['recharged'][replayed])
+            for model in models:
+                states[model.name] = model.update(states[model.name], entry)
+            replayed += 1
+
+        now = datetime.fromtimestamp(cut)
+        snapshot = predictors.Snapshot(now=now, balance=balances[index], daily=_daily(index, now),
+                                       rate=_rate(index, cut), profile=profile, states=states)
+
+        crossing = d['crossings'][index + 1]
+        actual_days = (times[crossing] - cut) / 86400 if crossing >= 0 else None
+
+        for method in methods:
+            started = time.perf_counter()
+            prediction = predictors.predict(method, snapshot, threshold)
+            elapsed = time.perf_counter() - started
+            results[method].append((prediction.get('days_remaining'), actual_days, elapsed,
+                                    prediction.get('prediction_method', method)))
+    return results, skipped
+
+
+def _score(predicted_days, actual_days):
+    """与 evaluate_prediction_accuracy 相同的准确率分数 (0-100)"""
+    if predicted_days > 0:
+        return max(0, 100 - abs(actual_days - predicted_days) / predicted_days * 100)
+    return 0
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0
+
+
+def summarize(results):
+    """汇总每个方法的准确率和耗时"""
+    report = {}
+    for method, rows in results.items():
+        scored = [(predicted, actual) for predicted, actual, _, _ in rows if predicted is not None and actual is not None]
+        scores = [_score(predicted, actual) for predicted, actual in scored]
+        errors = [abs(predicted - actual) for predicted, actual in scored]
+        latencies = [elapsed * 1000 for _, _, elapsed, _ in rows]
+        report[method] = {
+            'predictions': len(rows),
+            'scored': len(scored),
+            'fallbacks': sum(1 for *_, used in rows if used != method),
+            'average_accuracy': round(statistics.mean(scores), 2) if scores else None,
+            'median_accuracy': round(statistics.median(scores), 2) if scores else None,
+            'high_accuracy_rate': round(sum(1 for score in scores if score >= HIGH_ACCURACY_SCORE) / len(scores) * 100, 2) if scores else None,
+            'mean_abs_error_days': round(statistics.mean(errors), 2) if errors else None,
+            'median_abs_error_days': round(statistics.median(errors), 2) if errors else None,
+            'latency_mean_ms': round(statistics.mean(latencies), 3) if latencies else None,
+            'latency_p95_ms': round(_percentile(latencies, 0.95), 3) if latencies else None,
+        }
+    return report
+
+
+def run_backtest(db_path, methods=None, threshold=10.0, step_hours=24, workers=None, warmup_days=WARMUP_DAYS):
+    """
+    运行回测
+
+    Returns:
+        dict: 回测参数和每个方法的报告
+    """
+    methods = list(methods or predictors.REGISTRY)
+    for method in methods:
+        if method not in predictors.REGISTRY:
+            raise ValueError(f'未知的预测方法: {method}')
+
+    times, balances, prices = load_history(db_path)
+    if len(times) < 2:
+        raise ValueError('电费记录不足，无法回测')
+
+    cuts = []
+    cut = times[0] + warmup_days * 86400
+    while cut <= times[-1]:
+        cuts.append(cut)
+        cut += step_hours * 3600
+    if not cuts:
+        raise ValueError(f'电费记录不足{warmup_days}天，无法回测')
+
+    workers = workers or os.cpu_count() or 1
+    # 每个区段开始时要先累积热力图，区段数取进程数的两倍以平衡负载
+    chunk_count = min(len(cuts), workers * 2)
+    size = -(-len(cuts) // chunk_count)
+    chunks = [cuts[start:start + size] for start in range(0, len(cuts), size)]
+
+    started = time.perf_counter()
+    results = {method: [] for method in methods}
+    skipped = 0
+    initargs = (times, balances, prices, next_crossings(balances, threshold))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        futures = [executor.submit(_run_chunk, chunk, methods, threshold) for chunk in chunks]
+        for future in futures:
+            chunk_results, chunk_skipped = future.result()
+            skipped += chunk_skipped
+            for method, rows in chunk_results.items():
+                results[method].extend(rows)
+
+    return {
+        'records': len(times),
+        'from': datetime.fromtimestamp(times[0]).strftime('%Y-%m-%d %H:%M:%S'),
+        'to': datetime.fromtimestamp(times[-1]).strftime('%Y-%m-%d %H:%M:%S'),
+        'threshold': threshold,
+        'step_hours': step_hours,
+        'cut_points': len(cuts),
+        'skipped': skipped,
+        'workers': workers,
+        'elapsed_seconds': round(time.perf_counter() - started, 2),
+        'methods': summarize(results),
+    }
+
+
+def print_report(result):
+    print(f"回测数据: {result['records']} 条记录（{result['from']} ~ {result['to']}）")
+    print(f"时间点: {result['cut_points']} 个（每{result['step_hours']}小时，余额已低于阈值跳过{result['skipped']}个），"
+          f"阈值 {result['threshold']} 元，{result['workers']} 个进程，耗时 {result['elapsed_seconds']} 秒")
+    print()
+    header = f"{'方法':<12}{'预测数':>8}{'已评分':>8}{'回退':>6}{'平均准确率':>12}{'中位准确率':>12}{'高准确率%':>10}{'平均误差(天)':>14}{'平均耗时ms':>12}{'P95耗时ms':>11}"
+    print(header)
+    for method, stats in result['methods'].items():
+        def fmt(value):
+            return '-' if value is None else value
+        print(f"{method:<12}{stats['predictions']:>8}{stats['scored']:>8}{stats['fallbacks']:>6}"
+              f"{fmt(stats['average_accuracy']):>12}{fmt(stats['median_accuracy']):>12}{fmt(stats['high_accuracy_rate']):>10}"
+              f"{fmt(stats['mean_abs_error_days']):>14}{fmt(stats['latency_mean_ms']):>12}{fmt(stats['latency_p95_ms']):>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预测方法回测')
+    parser.add_argument('--db', default='electric_data.db', help='数据库文件路径')
+    parser.add_argument('--methods', help='逗号分隔的预测方法（默认全部已注册方法）')
+    parser.add_argument('--threshold', type=float, default=10.0, help='预警阈值（元）')
+    parser.add_argument('--step-hours', type=float, default=24, help='回测时间点间隔（小时）')
+    parser.add_argument('--warmup-days', type=float, default=WARMUP_DAYS, help='数据开始后多少天才开始回测')
+    parser.add_argument('--workers', type=int, help='进程数（默认CPU核数）')
+    parser.add_argument('--json', help='把报告保存为JSON文件')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f'数据库文件不存在: {args.db}')
+
+    methods = [name.strip() for name in args.methods.split(',')] if args.methods else None
+    try:
+        result = run_backtest(args.db, methods, args.threshold, args.step_hours, args.workers, args.warmup_days)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存到 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+generate_data: 生成多年的模拟电费历史数据
+run_benchmarks: 在不同数据规模下测量统计、预测和主要接口的耗时
+"""
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟数据生成器 - 生成多年的逐小时电费余额历史
+包含工作日/周末差异、昼夜曲线、冬夏空调季、寒暑假和不定期充值
+使用方法:
+    python -m benchmarks.generate_data --days 1095                 # 填充 electric_data.db
+    python -m benchmarks.generate_data --days 730 --rooms 20 --out-dir bench_rooms
+"""
+
+import os
+import json
+import random
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+# 一天中各小时的相对用电量（夜间低，晚间高）
+WEEKDAY_SHAPE = [0.3, 0.25, 0.2, 0.2, 0.2, 0.25, 0.5, 0.9, 0.7, 0.4, 0.4, 0.5,
+                 0.8, 0.6, 0.4, 0.4, 0.5, 0.8, 1.2, 1.5, 1.6, 1.6, 1.4, 0.8]
+WEEKEND_SHAPE = [0.5, 0.4, 0.3, 0.25, 0.2, 0.2, 0.25, 0.4, 0.7, 0.9, 1.0, 1.1,
+                 1.1, 1.0, 1.0, 1.0, 1.0, 1.1, 1.3, 1.5, 1.6, 1.5, 1.3, 0.9]
+
+RECHARGE_AMOUNTS = (30, 50, 100, 200)
+PREDICTION_THRESHOLD = 10.0
+
+
+def make_room_profile(rng, index):
+    """为每个房间随机生成用电习惯"""
+    building = rng.randint(1, 10)
+    floor = rng.randint(1, 12)
+    return {
+        'room_number': f"{building}-{floor}{index + 1:02d}",
+        'apartment': f"学{building}楼",
+        'floor': f"{floor}层",
+        'base_kwh': rng.uniform(2.5, 8.0),
+        'weekend_factor': rng.uniform(0.7, 1.5),
+        'summer_ac_kwh': rng.uniform(0.0, 10.0),
+        'winter_ac_kwh': rng.uniform(0.0, 6.0),
+        'price': rng.choice([0.48, 0.5, 0.52]),
+        'recharge_floor': rng.uniform(3.0, 20.0)
+    }
+
+
+def is_vacation(ts):
+    """寒暑假期间宿舍几乎不用电"""
+    if (ts.month == 1 and ts.day >= 20) or (ts.month == 2 and ts.day <= 20):
+        return True
+    if (ts.month == 7 and ts.day >= 10) or (ts.month == 8 and ts.day <= 25):
+        return True
+    return False
+
+
+def hourly_kwh(rng, profile, ts):
+    """计算某一小时的用电量（度）"""
+    weekend = ts.weekday() >= 5
+    daily = profile['base_kwh'] * (profile['weekend_factor'] if weekend else 1.0)
+    if ts.month in (6, 7, 8, 9):
+        daily += profile['summer_ac_kwh']
+    elif ts.month in (12, 1, 2):
+        daily += profile['winter_ac_kwh']
+    if is_vacation(ts):
+        daily *= 0.1
+
+    shape = WEEKEND_SHAPE if weekend else WEEKDAY_SHAPE
+    return daily * shape[ts.hour] / sum(shape) * rng.lognormvariate(0, 0.25)
+
+
+def generate_rows(profile, days, seed=None, end=None, missing_rate=0.01):
+    """
+    生成一个房间的历史数据
+
+    Returns:
+        tuple: (电费记录列表, 预测记录列表, 预警记录列表)
+    """
+    rng = random.Random(seed)
+    end = (end or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    ts = end - timedelta(days=days)
+
+    balance = rng.choice(RECHARGE_AMOUNTS)
+    total_kwh = rng.uniform(1000, 5000)
+    usage_today = usage_month = 0.0
+    last_alert = None
+    daily_costs = []
+    day_cost = 0.0
+
+    records, predictions, alerts = [], [], []
+
+    while ts <= end:
+        if ts.hour == 0:
+            daily_costs = (daily_costs + [day_cost])[-7:]
+            usage_today = day_cost = 0.0
+            if ts.day == 1:
+                usage_month = 0.0
+
+        kwh = hourly_kwh(rng, profile, ts)
+        cost = min(kwh * profile['price'], balance)
+        balance -= cost
+        total_kwh += kwh
+        usage_today += kwh
+        usage_month += kwh
+        day_cost += cost
+
+        # 余额偏低时有一定概率充值，余额耗尽时一定充值
+        if balance <= 0.5 or (balance < profile['recharge_floor'] and rng.random() < 0.15):
+            balance += rng.choice(RECHARGE_AMOUNTS)
+
+        timestamp = ts.strftime('%Y-%m-%d %H:%M:%S')
+        if rng.random() >= missing_rate:
+            raw = {
+                'e': 0,
+                'm': '操作成功',
+                'd': {'data': {
+                    'surplus': round(balance, 2),
+                    'vTotal': round(total_kwh, 2),
+                    'price': profile['price'],
+                    'time': timestamp,
+                    'parName': profile['apartment'],
+                    'floorName': profile['floor'],
+                    'dromNum': profile['room_number']
+                }}
+            }
+            records.append((
+                timestamp, round(balance, 2), round(usage_today, 3), round(usage_month, 3),
+                'success', json.dumps(raw, ensure_ascii=False)
+            ))
+
+        if balance < PREDICTION_THRESHOLD and (last_alert is None or ts - last_alert >= timedelta(hours=24)):
+            alerts.append((timestamp, 'low_balance', f'余额不足预警: {balance:.2f}元，已发送1封邮件', 1))
+            last_alert = ts
+
+        # 每天中午保存一条预测快照，用于准确性评估
+        if ts.hour == 12 and daily_costs:
+            daily_avg = max(sum(daily_costs) / len(daily_costs), 0.1)
+            predicted_days = max(balance - PREDICTION_THRESHOLD, 0) / daily_avg
+            predictions.append((
+                timestamp, round(balance, 2), PREDICTION_THRESHOLD, round(predicted_days, 1),
+                (ts + timedelta(days=int(predicted_days))).strftime('%Y-%m-%d'),
+                round(daily_avg, 2), round(daily_avg, 2), round(daily_avg, 2),
+                'advanced' if ts.toordinal() % 2 else 'basic', 'medium'
+            ))
+
+        ts += timedelta(hours=1)
+
+    return records, predictions, alerts
+
+
+def generate_database(db_path, days, seed=None, profile=None, end=None):
+    """生成数据并写入指定的数据库文件，返回写入的电费记录数"""
+    from app import ElectricMonitor
+
+    rng = random.Random(seed)
+    profile = profile or make_room_profile(rng, 0)
+    records, predictions, alerts = generate_rows(profile, days, seed=rng.random(), end=end)
+
+    ElectricMonitor(db_path).init_database()
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany('''
+            INSERT INTO electric_records (timestamp, balance, usage_today, usage_month, status, raw_data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', records)
+        conn.executemany('''
+            INSERT INTO prediction_records
+            (timestamp, current_balance, threshold, predicted_days, predicted_date,
+             daily_avg, weekday_avg, weekend_avg, prediction_method, confidence)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', predictions)
+        conn.executemany('''
+            INSERT INTO alerts (timestamp, alert_type, message, sent)
+            VALUES (?, ?, ?, ?)
+        ''', alerts)
+    conn.close()
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成模拟电费历史数据')
+    parser.add_argument('--days', type=int, default=365 * 3, help='生成多少天的历史（默认3年）')
+    parser.add_argument('--db', default='electric_data.db', help='目标数据库文件')
+    parser.add_argument('--rooms', type=int, default=1, help='房间数量，大于1时每个房间生成一个数据库')
+    parser.add_argument('--out-dir', default='bench_rooms', help='多房间模式下数据库的输出目录')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    if args.rooms <= 1:
+        count = generate_database(args.db, args.days, seed=args.seed)
+        print(f"✅ 已向 {args.db} 写入 {count} 条记录（{args.days} 天）")
+        return
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    total = 0
+    for i in range(args.rooms):
+        profile = make_room_profile(rng, i)
+        db_path = os.path.join(args.out_dir, f"{i:03d}_{profile['room_number']}.db")
+        total += generate_database(db_path, args.days, seed=rng.random(), profile=profile)
+        print(f"  房间 {profile['room_number']}: {db_path}")
+    print(f"✅ 已为 {args.rooms} 个房间写入 {total} 条记录（{args.days} 天）")
+
+
+if __name__ == "__main__":
+    main()
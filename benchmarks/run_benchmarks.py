@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试 - 在不同数据规模下测量统计、预测、日志和主要页面的耗时
+结果保存为JSON，可用 --compare 与之前的结果对比
+使用方法:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 30,365,1825 --compare benchmarks/results/旧结果.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+# 没有config.py时使用的基准测试配置（不会发送邮件、不会访问网络）
+BENCH_CONFIG = '''
+BUPT_USERNAME = "benchmark"
+BUPT_PASSWORD = "benchmark"
+EMAIL_SMTP_SERVER = "localhost"
+EMAIL_SMTP_PORT = 25
+EMAIL_USERNAME = "benchmark@localhost"
+EMAIL_PASSWORD = ""
+ALERT_EMAILS = []
+LOW_BALANCE_THRESHOLD = 10.0
+PREDICTION_THRESHOLD = 10.0
+PREDICTION_METHOD = "advanced"
+PREDICTION_ACCURACY_EVALUATION = True
+'''
+
+LOG_LEVELS = ('INFO', 'INFO', 'INFO', 'INFO', 'WARNING', 'ERROR')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def prepare_environment(workdir):
+    """准备导入app所需的环境：仓库路径和配置文件"""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        with open(os.path.join(workdir, 'config.py'), 'w', encoding='utf-8') as f:
+            f.write(BENCH_CONFIG)
+        sys.path.insert(0, workdir)
+
+
+def write_log_file(path, lines, seed=0):
+    """生成与运行日志格式一致的模拟日志文件"""
+    rng = random.Random(seed)
+    ts = datetime.now() - timedelta(seconds=lines * 60)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            ts += timedelta(seconds=60)
+            level = rng.choice(LOG_LEVELS)
+            f.write(f"{ts.strftime('%Y-%m-%d %H:%M:%S')},{i % 1000:03d} - {level} - 模拟日志消息 {i}\n")
+
+
+def measure(func, repeat, setup=None):
+    """多次运行并统计耗时（毫秒），先运行一次预热（不计时）"""
+    if setup:
+        setup()
+    func()
+
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': repeat,
+        'min_ms': round(min(times), 3),
+        'median_ms': round(statistics.median(times), 3),
+        'mean_ms': round(statistics.mean(times), 3)
+    }
+
+
+def run_size(app_module, workdir, days, repeat, seed):
+    """在指定数据规模下运行所有基准测试"""
+    from benchmarks.generate_data import generate_database
+
+    size_dir = os.path.join(workdir, f'days_{days}')
+    os.makedirs(size_dir, exist_ok=True)
+    os.chdir(size_dir)
+
+    db_path = os.path.join(size_dir, 'electric_data.db')
+    started = time.perf_counter()
+    record_count = generate_database(db_path, days, seed=seed)
+    generate_seconds = time.perf_counter() - started
+    write_log_file(os.path.join(size_dir, 'electric_monitor.log'), record_count * 5, seed)
+
+    monitor = app_module.ElectricMonitor(db_path)
+    app_module.monitor = monitor
+    # 首次连接时初始化数据库并回填派生表，属于一次性开销，不计入各用例
+    monitor.connect().close()
+    client = app_module.create_app(start_background=False).test_client()
+
+    def reset_evaluations():
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute('UPDATE prediction_records SET is_evaluated = 0, actual_days = NULL, accuracy_score = NULL')
+        conn.close()
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, f"{url} 返回 {response.status_code}"
+        return request
+
+    cases = {
+        'get_statistics': (monitor.get_statistics, None),
+        'predict_balance_depletion': (lambda: monitor.predict_balance('basic', 10.0), None),
+        'predict_balance_advanced': (lambda: monitor.predict_balance('advanced', 10.0), None),
+        'predict_balance_holt_winters': (lambda: monitor.predict_balance('holt_winters', 10.0), None),
+        'evaluate_prediction_accuracy': (monitor.evaluate_prediction_accuracy, reset_evaluations),
+        'api_get_logs': (get('/api/logs?limit=50'), None),
+        'api_get_logs_filtered': (get('/api/logs?limit=500&level=ERROR'), None),
+        'route_index': (get('/'), None),
+        'route_api_stats': (get('/api/stats'), None),
+        'route_api_records': (get('/api/records?limit=100'), None),
+        'route_api_prediction': (get('/api/prediction'), None),
+    }
+
+    results = {}
+    for name, (func, setup) in cases.items():
+        results[name] = measure(func, repeat, setup)
+        print(f"  {name:<32} 中位数 {results[name]['median_ms']:>10.2f} ms")
+
+    return {
+        'days': days,
+        'records': record_count,
+        'generate_seconds': round(generate_seconds, 2),
+        'benchmarks': results
+    }
+
+
+def compare(current, baseline_path, max_regression):
+    """与之前的结果对比，返回是否存在超出阈值的性能退化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    old = {(r['days'], name): bench for r in baseline['results'] for name, bench in r['benchmarks'].items()}
+    regressed = False
+
+    print(f"\n与 {baseline_path}（{baseline['meta'].get('commit')}）对比:")
+    for result in current['results']:
+        for name, bench in result['benchmarks'].items():
+            previous = old.get((result['days'], name))
+            if not previous or not previous['median_ms']:
+                continue
+            change = (bench['median_ms'] / previous['median_ms'] - 1) * 100
+            flag = ''
+            if change > max_regression:
+                flag = '  ⚠️ 退化'
+                regressed = True
+            print(f"  [{result['days']:>5}天] {name:<32} {previous['median_ms']:>10.2f} -> {bench['median_ms']:>10.2f} ms ({change:+.1f}%){flag}")
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电费监控系统性能基准测试')
+    parser.add_argument('--sizes', default='30,365,1095', help='数据规模（天数），逗号分隔')
+    parser.add_argument('--repeat', type=int, default=5, help='每项测试的运行次数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--output', help='结果文件路径（默认保存到benchmarks/results/）')
+    parser.add_argument('--compare', help='用于对比的历史结果文件')
+    parser.add_argument('--max-regression', type=float, default=20.0, help='允许的最大退化百分比')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    original_cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix='electric_bench_') as workdir:
+        os.chdir(workdir)
+        prepare_environment(workdir)
+        import app as app_module
+        # 预测等函数每次调用都会输出INFO日志，测试期间只保留警告以上
+        app_module.setup_logging()
+        logging.getLogger().setLevel(logging.WARNING)
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'sqlite': sqlite3.sqlite_version,
+                'repeat': args.repeat
+            },
+            'results': []
+        }
+
+        for days in sizes:
+            print(f"\n📊 数据规模: {days} 天")
+            report['results'].append(run_size(app_module, workdir, days, args.repeat, args.seed))
+
+        os.chdir(original_cwd)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{report['meta']['commit']}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 结果已保存到 {output}")
+
+    if args.compare and compare(report, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准 - 测量导入app模块的耗时，并检查导入过程没有副作用
+超出预算、提前加载了重量级模块或在导入时创建了文件都会返回非零退出码
+使用方法:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 200 --repeat 10
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只应在登录、解析页面、发邮件和启动调度器时才加载的模块
+LAZY_MODULES = ('requests', 'bs4', 'apscheduler', 'smtplib', 'email.mime.text', 'email.mime.multipart')
+
+PROBE = '''
+import sys, json, time
+started = time.perf_counter()
+import app
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({"ms": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+''' % (LAZY_MODULES,)
+
+
+def run_probe(workdir, importtime=False):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PYTHONDONTWRITEBYTECODE='1')
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', PROBE]
+    result = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def top_imports(stderr, count):
+    """解析 -X importtime 输出，返回累计耗时最高的模块"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative_us), name.strip()))
+    return sorted(entries, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='app模块导入耗时基准')
+    parser.add_argument('--budget-ms', type=float, default=300.0, help='导入耗时预算（毫秒，取中位数）')
+    parser.add_argument('--repeat', type=int, default=5, help='测量次数')
+    parser.add_argument('--top', type=int, default=10, help='显示累计耗时最高的模块数量')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix='electric_startup_') as workdir:
+        # 预热一次，避免首次读取文件的开销影响结果
+        run_probe(workdir)
+        timings = []
+        loaded = []
+        for _ in range(args.repeat):
+            result, _ = run_probe(workdir)
+            timings.append(result['ms'])
+            loaded = result['loaded']
+
+        _, stderr = run_probe(workdir, importtime=True)
+        created = os.listdir(workdir)
+
+    median = statistics.median(timings)
+    print(f"导入app耗时: 中位数 {median:.1f} ms，最小 {min(timings):.1f} ms（预算 {args.budget_ms:.0f} ms）")
+
+    print(f"\n累计耗时最高的{args.top}个模块:")
+    for cumulative_us, name in top_imports(stderr, args.top):
+        print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    if median > args.budget_ms:
+        print(f"\n❌ 导入耗时超出预算: {median:.1f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    if loaded:
+        print(f"\n❌ 导入时加载了应延迟加载的模块: {', '.join(loaded)}")
+        failed = True
+    if created:
+        print(f"\n❌ 导入时创建了文件: {', '.join(created)}")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("\n✅ 启动耗时检查通过")
+
+
+if __name__ == "__main__":
+    main()
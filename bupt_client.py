@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+北邮电费系统客户端 - ElectricMonitor 和 RoomFinder 共用的上游访问层
+
+AsyncBuptClient 基于 asyncio，在有限大小的线程池中复用同一个 requests.Session
+（连接池复用TCP/TLS连接），提供并发上限、指数退避加随机抖动的重试和单次请求的总截止时间。
+BuptClient 在后台线程中运行事件循环，供现有的同步代码调用；给定熔断器时每次调用先经过熔断器，
+上游故障期间直接抛出 CircuitOpen 而不再等待超时或重复登录。
+"""
+
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+LOGIN_URL = "https://auth.bupt.edu.cn/authserver/login"
+BASE_URL = "https://app.bupt.edu.cn/buptdf/wap/default/"
+CHONG_URL = BASE_URL + "chong"
+SEARCH_URL = BASE_URL + "search"
+
+# 需要重试的HTTP状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class UpstreamError(Exception):
+    """上游接口访问失败"""
+
+
+class TransportError(UpstreamError):
+    """连接失败、超时或5xx/429响应（重试后仍失败），只有这类错误计入熔断器"""
+
+
+class LoginFailed(UpstreamError):
+    """统一身份认证登录失败"""
+
+    def __init__(self, message, page=None):
+        super().__init__(message)
+        self.page = page  # 登录页面内容，用于排查页面结构变化
+
+
+class SessionExpired(UpstreamError):
+    """会话已失效（被重定向到登录页或返回了非JSON内容），需要重新登录"""
+
+
+class CircuitOpen(UpstreamError):
+    """熔断器已打开，请求未发出"""
+
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AsyncBuptClient:
+    def __init__(self, username, password, concurrency=4, retries=3, backoff=0.5,
+                 max_backoff=8.0, timeout=10, deadline=30):
+        """
+        Args:
+            username, password: 统一身份认证账号
+            concurrency: 同时进行的请求数上限
+            retries: 连接错误、超时或5xx/429响应时的最大重试次数
+            backoff: 第一次重试前的基础等待时间（秒），之后每次翻倍
+            max_backoff: 单次等待时间上限（秒）
+            timeout: 单次HTTP请求的连接/读取超时（秒）
+            deadline: 一个请求包括所有重试在内的总截止时间（秒）
+        """
+        self.username = username
+        self.password = password
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.deadline = deadline
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bupt-client')
+        self._semaphores = {}
+
+    @property
+    def session(self):
+        """共享的requests会话，连接池大小与并发上限一致"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.concurrency)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _semaphore(self):
+        # 信号量绑定到事件循环，每个循环单独创建
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    def _retry_delay(self, attempt):
+        """指数退避加完全随机抖动"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    async def request(self, method, url, deadline=None, **kwargs):
+        """
+        发送HTTP请求，失败时按指数退避重试
+
+        Args:
+            deadline: 包括重试在内的总截止时间（秒），默认使用客户端配置
+
+        Returns:
+            requests.Response
+        """
+        import requests
+
+        loop = asyncio.get_running_loop()
+        end = loop.time() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                raise TransportError(f"请求超过截止时间: {url}")
+
+            timeout = min(self.timeout, remaining)
+            try:
+                async with self._semaphore():
+                    call = lambda: self.session.request(method, url, timeout=timeout, **kwargs)
+                    response = await asyncio.wait_for(loop.run_in_executor(self._executor, call), remaining)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                error = TransportError(f"上游返回状态码 {response.status_code}: {url}")
+            except (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError) as e:
+                error = TransportError(f"请求失败: {url}: {str(e) or e.__class__.__name__}")
+
+            if attempt >= self.retries:
+                raise error
+            delay = min(self._retry_delay(attempt), max(end - loop.time(), 0))
+            attempt += 1
+            logging.warning(f"{str(error)}，{delay:.1f}秒后第{attempt}次重试")
+            await asyncio.sleep(delay)
+
+    async def login(self):
+        """登录统一身份认证，失败时抛出LoginFailed"""
+        from bs4 import BeautifulSoup
+
+        response = await self.request('GET', LOGIN_URL)
+        soup = BeautifulSoup(response.text, 'html.parser')
+
+        # 提取登录表单中的隐藏字段
+        fields = {}
+        for name in ('type', 'execution', '_eventId'):
+            field = soup.find('input', {'name': name})
+            if not field:
+                raise LoginFailed("无法找到登录所需的隐藏字段，页面结构可能已变化", page=response.text)
+            fields[name] = field.get('value', '')  # type: ignore
+
+        login_data = dict(fields, username=self.username, password=self.password)
+        response = await self.request('POST', LOGIN_URL, data=login_data)
+        if 'CAS Login' in response.text or '统一身份认证' in response.text:
+            raise LoginFailed("登录失败，请检查用户名和密码")
+        return True
+
+    async def chong(self):
+        """访问充值页面（用于检查会话是否有效），返回响应"""
+        return await self.request('GET', CHONG_URL, allow_redirects=True)
+
+    async def _list(self, endpoint, data):
+        response = await self.request('POST', BASE_URL + endpoint, data=data)
+        if response.status_code != 200:
+            raise UpstreamError(f"{endpoint}接口访问失败，状态码: {response.status_code}")
+        payload = response.json()
+        if payload.get('e') != 0:
+            raise UpstreamError(f"{endpoint}接口返回错误: {payload.get('m', '未知错误')}")
+        return payload['d']['data']
+
+    async def list_apartments(self, area_id):
+        """获取校区的公寓列表"""
+        return await self._list('part', {'areaid': area_id})
+
+    async def list_floors(self, area_id, apartment_id):
+        """获取公寓的楼层列表"""
+        return await self._list('floor', {'partmentId': apartment_id, 'areaid': area_id})
+
+    async def list_rooms(self, area_id, apartment_id, floor_id):
+        """获取楼层的房间列表"""
+        return await self._list('drom', {'partmentId': apartment_id, 'floorId': floor_id, 'areaid': area_id})
+
+    async def search(self, area_id, apartment_id, floor_id, room_number, **kwargs):
+        """查询房间电费，返回响应"""
+        return await self.request('POST', SEARCH_URL, data={
+            'partmentId': apartment_id,
+            'floorId': floor_id,
+            'dromNumber': room_number,
+            'areaid': area_id
+        }, **kwargs)
+
+    async def query(self, area_id, apartment_id, floor_id, room_number):
+        """
+        直接使用当前会话查询房间电费，不预先访问充值页面
+
+        Returns:
+            dict: 查询接口返回的JSON
+
+        Raises:
+            SessionExpired: 被重定向（通常是跳转到统一身份认证）或响应不是JSON
+        """
+        response = await self.search(area_id, apartment_id, floor_id, room_number, allow_redirects=False)
+        if response.is_redirect:
+            raise SessionExpired(f"查询接口被重定向到 {response.headers.get('Location', '')}")
+        if response.status_code != 200:
+            raise UpstreamError(f"电费查询接口访问失败，状态码: {response.status_code}")
+        try:
+            return response.json()
+        except ValueError:
+            raise SessionExpired("查询接口返回的不是JSON，会话可能已失效")
+
+    async def walk_rooms(self, area_ids):
+        """
+        并行获取多个校区的全部公寓、楼层和房间
+
+        Returns:
+            list: [(校区ID, 公寓, 楼层, 房间)]，获取失败的公寓或楼层会被跳过并记录日志
+        """
+        async def apartments_of(area_id):
+            return [(area_id, apartment) for apartment in await self.list_apartments(area_id)]
+
+        async def floors_of(area_id, apartment):
+            floors = await self.list_floors(area_id, apartment['partmentId'])
+            return [(area_id, apartment, floor) for floor in floors]
+
+        async def rooms_of(area_id, apartment, floor):
+            rooms = await self.list_rooms(area_id, apartment['partmentId'], floor['floorId'])
+            return [(area_id, apartment, floor, room) for room in rooms]
+
+        apartments = await _gather_flat([apartments_of(area_id) for area_id in area_ids])
+        floors = await _gather_flat([floors_of(*item) for item in apartments])
+        return await _gather_flat([rooms_of(*item) for item in floors])
+
+
+async def _gather_flat(coroutines):
+    results = []
+    for result in await asyncio.gather(*coroutines, return_exceptions=True):
+        if isinstance(result, Exception):
+            logging.error(f"获取列表失败: {str(result)}")
+            continue
+        results.extend(result)
+    return results
+
+
+class BuptClient:
+    """AsyncBuptClient 的同步包装，协程在后台线程的事件循环中执行"""
+
+    def __init__(self, *args, breaker=None, **kwargs):
+        """
+        Args:
+            breaker: circuit_breaker.CircuitBreaker，为None时不熔断
+            其余参数同 AsyncBuptClient
+        """
+        self.async_client = AsyncBuptClient(*args, **kwargs)
+        self.breaker = breaker
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        return self.async_client.session
+
+    def _ensure_loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='bupt-client-loop', daemon=True)
+                    thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coroutine):
+        """
+        在后台事件循环中执行协程并等待结果
+
+        只有传输层错误（TransportError：连接失败、超时、5xx/429）计入熔断器；会话失效说明上游可以访问，
+        计为成功；登录失败、业务错误和本地异常与上游是否可用无关，不改变熔断器状态
+        """
+        breaker = self.breaker
+        if breaker is None:
+            return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+        permit = breaker.allow()
+        if permit is None:
+            coroutine.close()
+            retry_after = breaker.retry_after()
+            raise CircuitOpen(f"上游服务暂时不可用，{retry_after:.0f}秒后重试（{breaker.last_error}）", retry_after)
+        try:
+            result = asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+        except TransportError as e:
+            breaker.record_failure(e, permit)
+            raise
+        except SessionExpired:
+            breaker.record_success(permit)
+            raise
+        except BaseException:
+            breaker.release(permit)
+            raise
+        breaker.record_success(permit)
+        return result
+
+    def login(self):
+        return self.run(self.async_client.login())
+
+    def chong(self):
+        return self.run(self.async_client.chong())
+
+    def list_apartments(self, area_id):
+        return self.run(self.async_client.list_apartments(area_id))
+
+    def list_floors(self, area_id, apartment_id):
+        return self.run(self.async_client.list_floors(area_id, apartment_id))
+
+    def list_rooms(self, area_id, apartment_id, floor_id):
+        return self.run(self.async_client.list_rooms(area_id, apartment_id, floor_id))
+
+    def search(self, area_id, apartment_id, floor_id, room_number, **kwargs):
+        return self.run(self.async_client.search(area_id, apartment_id, floor_id, room_number, **kwargs))
+
+    def query(self, area_id, apartment_id, floor_id, room_number):
+        return self.run(self.async_client.query(area_id, apartment_id, floor_id, room_number))
+
+    def walk_rooms(self, area_ids):
+        return self.run(self.async_client.walk_rooms(area_ids))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+熔断器 - 上游服务故障时快速失败，避免每次请求都等待超时
+
+状态:
+    closed     正常放行，连续失败达到 failure_threshold 次后熔断
+    open       熔断中，冷却期内的请求直接失败
+    half_open  冷却期结束，只放行一个试探请求：成功则恢复，失败则再次熔断
+
+冷却时间从 cooldown 开始，连续熔断时每次翻倍，最长 max_cooldown；恢复后重新从 cooldown 开始。
+allow() 返回的许可记录放行时的状态代数，状态已经变化后才结束的请求（例如熔断前放行、熔断后才成功的慢请求）
+不改变状态，避免把熔断中的熔断器恢复正常或重复熔断。
+状态只保存在内存中，进程重启后从 closed 开始
+"""
+
+import time
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 一次放行的许可：generation 为放行时的状态代数，trial 表示是否为 half_open 下的试探请求
+Permit = namedtuple('Permit', ['generation', 'trial'])
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, cooldown=60, max_cooldown=3600, clock=time.monotonic):
+        """
+        Args:
+            name: 名称（用于日志）
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 第一次熔断的冷却时间（秒）
+            max_cooldown: 冷却时间上限（秒）
+            clock: 单调时钟，便于测试替换
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0           # 连续失败次数
+        self.open_count = 0         # 连续熔断次数（决定冷却时间）
+        self.generation = 0         # 状态变化计数
+        self.changed_at = None      # 最近一次状态变化的墙上时间
+        self.last_error = None
+        self.last_failure_at = None  # 以下为墙上时间，用于展示
+        self.opened_at = None
+        self.retry_at = None
+        self._retry_clock = None
+        self._trial = False         # half_open 下是否已有试探请求
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            logging.info(f"熔断器[{self.name}]: {self.state} -> {state}")
+            self.state = state
+            self.generation += 1
+            self.changed_at = time.time()
+
+    def current_cooldown(self):
+        return min(self.cooldown * (2 ** max(self.open_count - 1, 0)), self.max_cooldown)
+
+    def _open(self):
+        self.open_count += 1
+        cooldown = self.current_cooldown()
+        now = time.time()
+        self.opened_at = now
+        self.retry_at = now + cooldown
+        self._retry_clock = self.clock() + cooldown
+        self._trial = False
+        self._transition(OPEN)
+        logging.warning(f"熔断器[{self.name}]已熔断，{cooldown:.0f}秒内的请求直接失败: {self.last_error}")
+
+    def allow(self):
+        """
+        是否放行一次请求，放行的请求结束后必须带着许可调用 record_success、record_failure 或 release
+
+        Returns:
+            Permit | None: 放行时返回许可，熔断中返回None
+        """
+        with self._lock:
+            if self.state == OPEN and self.clock() >= self._retry_clock:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return Permit(self.generation, False)
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return Permit(self.generation, True)
+            return None
+
+    def _stale(self, permit):
+        """许可是否在状态变化之前发放（结果已不能反映当前状态）"""
+        return permit is not None and permit.generation != self.generation
+
+    def _release(self, permit):
+        if permit is None or permit.trial:
+            self._trial = False
+
+    def record_success(self, permit=None):
+        with self._lock:
+            if self._stale(permit):
+                self._release(permit)
+                return
+            if self.state != CLOSED:
+                logging.info(f"熔断器[{self.name}]试探请求成功，恢复正常")
+            self.failures = 0
+            self.open_count = 0
+            self._trial = False
+            self.retry_at = None
+            self._transition(CLOSED)
+
+    def release(self, permit=None):
+        """放行的请求结束但结果不能说明上游是否可用时调用：不改变状态，试探请求结束后允许下一个试探请求"""
+        with self._lock:
+            self._release(permit)
+
+    def record_failure(self, error=None, permit=None):
+        with self._lock:
+            if self._stale(permit):
+                self._release(permit)
+                return
+            self.failures += 1
+            self.last_error = str(error) if error is not None else None
+            self.last_failure_at = time.time()
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._open()
+
+    def retry_after(self):
+        """熔断中距离下一次试探的秒数，未熔断时为0"""
+        if self.state != OPEN:
+            return 0.0
+        return max(self._retry_clock - self.clock(), 0.0)
+
+    def snapshot(self):
+        """当前状态（可JSON序列化）"""
+        def fmt(value):
+            return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'open_count': self.open_count,
+                'cooldown_seconds': self.current_cooldown() if self.open_count else 0,
+                'retry_at': fmt(self.retry_at) if self.state == OPEN else None,
+                'opened_at': fmt(self.opened_at) if self.state != CLOSED else None,
+                'last_error': self.last_error,
+                'last_failure_at': fmt(self.last_failure_at)
+            }
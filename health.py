@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+健康检查 - 后台定期探测系统状态，/healthz 和 /readyz 直接返回缓存的探测结果
+探测只访问本地数据库和内存状态，不会访问北邮服务器
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+
+
+class HealthProbe:
+    def __init__(self, monitor, scheduler_status, interval=30, max_data_age=3 * 3600):
+        """
+        Args:
+            monitor: ElectricMonitor实例
+            scheduler_status: 返回本进程是否运行定时任务调度器的函数
+            interval: 探测间隔（秒）
+            max_data_age: 最近一次成功获取数据超过该时间（秒）视为数据过期
+        """
+        self.monitor = monitor
+        self.scheduler_status = scheduler_status
+        self.interval = interval
+        self.max_data_age = max_data_age
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """启动后台探测线程（重复调用无副作用），启动前先同步探测一次"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.run_once()
+            self._thread = threading.Thread(target=self._run, name='health-probe', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # 单次探测出错不能结束线程，否则就绪状态会停留在最后一次结果
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"健康检查：探测失败: {str(e)}")
+
+    def run_once(self):
+        """执行一次探测并替换缓存结果"""
+        database_ok, database_error, latest_record = self._probe_database()
+
+        # 优先使用本进程最近一次成功获取数据的时间，其次使用数据库中最新记录的时间
+        last_success = self.monitor.last_success_at
+        if last_success is None and latest_record:
+            try:
+                last_success = datetime.strptime(latest_record, '%Y-%m-%d %H:%M:%S').timestamp()
+            except ValueError:
+                last_success = None
+
+        try:
+            scheduler_leader = bool(self.scheduler_status())
+        except Exception:
+            scheduler_leader = False
+
+        self._snapshot = {
+            'probed_at': time.time(),
+            'database_ok': database_ok,
+            'database_error': database_error,
+            'scheduler_leader': scheduler_leader,
+            'last_success_at': last_success,
+            'session_valid': self.monitor.session_valid,
+            'upstream_circuit': self.monitor.upstream_breaker.snapshot()
+        }
+
+    def _probe_database(self):
+        try:
+            conn = self.monitor.connect()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT MAX(timestamp) FROM electric_records WHERE status = 'success'")
+                row = cursor.fetchone()
+            finally:
+                conn.close()
+            return True, None, row[0] if row else None
+        except Exception as e:
+            logging.error(f"健康检查：数据库探测失败: {str(e)}")
+            return False, str(e), None
+
+    def readiness(self):
+        """根据缓存的探测结果生成就绪状态，返回 (是否就绪, 详情)"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False, {'status': 'starting'}
+
+        now = time.time()
+        last_success = snapshot['last_success_at']
+        data_age = round(now - last_success, 1) if last_success is not None else None
+        data_fresh = data_age is not None and data_age <= self.max_data_age
+
+        circuit = snapshot['upstream_circuit']
+        ready = snapshot['database_ok']
+        if not ready:
+            status = 'unavailable'
+        elif not data_fresh or circuit['state'] != 'closed':
+            status = 'degraded'
+        else:
+            status = 'ok'
+
+        return ready, {
+            'status': status,
+            'checks': {
+                'database': {'ok': snapshot['database_ok'], 'error': snapshot['database_error']},
+                'scheduler': {'leader': snapshot['scheduler_leader']},
+                'upstream_data': {'ok': data_fresh, 'last_success_age_seconds': data_age},
+                'cas_session': {'valid': snapshot['session_valid']},
+                'upstream_circuit': {'state': circuit['state'], 'retry_at': circuit['retry_at'],
+                                     'last_error': circuit['last_error']}
+            },
+            'probe_age_seconds': round(now - snapshot['probed_at'], 1)
+        }
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史数据批量导入导出 - 支持 electric_records 和 prediction_records 表
+
+格式:
+    csv    带表头的CSV，空字段表示NULL
+    jsonl  每行一个JSON对象
+    emcb   紧凑的列式二进制格式（见下文），体积小、读写快
+
+可选 gzip（.gz）或 lzma（.xz）压缩。导出按块读取游标，导入按批 executemany 并分批提交事务，
+内存占用与数据总量无关。
+
+emcb 格式（小端序）:
+    文件头  b'EMCB1' | 表名长度 u16 | 表名 | 列数 u16 | 每列: 列名长度 u16 | 列名 | 类型 1字节(i/f/s)
+    数据块  行数 u32 | 每列: NULL位图 ceil(行数/8)字节 | 列数据
+            i: int64数组  f: float64数组  s: u32长度数组 + UTF-8字节
+    结束    行数为0的数据块
+
+使用方法:
+    python history_io.py export electric_records records.emcb.xz
+    python history_io.py export prediction_records predictions.csv.gz
+    python history_io.py import records.emcb.xz
+    python history_io.py import predictions.csv.gz --table prediction_records
+"""
+
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import lzma
+import time
+import struct
+import sqlite3
+import argparse
+from array import array
+
+MAGIC = b'EMCB1'
+CHUNK_SIZE = 5000          # 导出时每次从游标读取的行数
+BATCH_SIZE = 5000          # 导入时每次executemany的行数
+COMMIT_EVERY = 50000       # 导入时每个事务包含的行数
+
+# 可导入导出的表: 表名 -> [(列名, 类型)]，类型 i=整数 f=浮点数 s=文本
+TABLES = {
+    'electric_records': [
+        ('id', 'i'), ('timestamp', 's'), ('balance', 'f'), ('usage_today', 'f'),
+        ('usage_month', 'f'), ('status', 's'), ('raw_data', 's'),
+    ],
+    'prediction_records': [
+        ('id', 'i'), ('timestamp', 's'), ('current_balance', 'f'), ('threshold', 'f'),
+        ('predicted_days', 'f'), ('predicted_date', 's'), ('daily_avg', 'f'),
+        ('weekday_avg', 'f'), ('weekend_avg', 'f'), ('prediction_method', 's'),
+        ('confidence', 's'), ('actual_days', 'f'), ('accuracy_score', 'f'),
+        ('is_evaluated', 'i'), ('record_id', 'i'),
+    ],
+}
+
+FORMATS = ('csv', 'jsonl', 'emcb')
+COMPRESSIONS = {'gz': 'gzip', 'xz': 'lzma'}
+
+_CONVERTERS = {'i': int, 'f': float, 's': str}
+_ARRAY_CODES = {'i': 'q', 'f': 'd'}
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def detect_format(path):
+    """根据文件名推断 (格式, 压缩方式)，例如 records.csv.gz -> ('csv', 'gzip')"""
+    parts = os.path.basename(path).lower().split('.')
+    compression = COMPRESSIONS.get(parts[-1]) if len(parts) > 1 else None
+    if compression:
+        parts = parts[:-1]
+    fmt = parts[-1] if len(parts) > 1 and parts[-1] in FORMATS else None
+    return fmt, compression
+
+
+def open_compressed(fileobj, mode, compression):
+    """在二进制文件对象外包装压缩层"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode=mode)
+    if compression == 'lzma':
+        return lzma.LZMAFile(fileobj, mode=mode)
+    return fileobj
+
+
+def _convert(value, kind):
+    if value is None:
+        return None
+    return _CONVERTERS[kind](value)
+
+
+# ---------- 写入 ----------
+
+class CsvWriter:
+    def __init__(self, stream, table, columns):
+        self.text = io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+        self.writer = csv.writer(self.text)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write_rows(self, rows):
+        self.writer.writerows(['' if value is None else value for value in row] for row in rows)
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+
+
+class JsonlWriter:
+    def __init__(self, stream, table, columns):
+        self.stream = stream
+        self.names = [name for name, _ in columns]
+
+    def write_rows(self, rows):
+        lines = [json.dumps(dict(zip(self.names, row)), ensure_ascii=False) for row in rows]
+        self.stream.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+class BinaryWriter:
+    def __init__(self, stream, table, columns):
+        self.stream = stream
+        self.columns = columns
+        header = [MAGIC, _pack_text(table), struct.pack('<H', len(columns))]
+        for name, kind in columns:
+            header.append(_pack_text(name) + kind.encode('ascii'))
+        stream.write(b''.join(header))
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        parts = [struct.pack('<I', len(rows))]
+        for index, (_, kind) in enumerate(self.columns):
+            values = [row[index] for row in rows]
+            parts.append(_null_bitmap(values))
+            if kind == 's':
+                encoded = [b'' if value is None else str(value).encode('utf-8') for value in values]
+                lengths = array('I', [len(item) for item in encoded])
+                parts.append(_array_bytes(lengths))
+                parts.append(b''.join(encoded))
+            else:
+                convert = _CONVERTERS[kind]
+                data = array(_ARRAY_CODES[kind], [0 if value is None else convert(value) for value in values])
+                parts.append(_array_bytes(data))
+        self.stream.write(b''.join(parts))
+
+    def close(self):
+        self.stream.write(struct.pack('<I', 0))
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'emcb': BinaryWriter}
+
+
+def _pack_text(text):
+    data = text.encode('utf-8')
+    return struct.pack('<H', len(data)) + data
+
+
+def _null_bitmap(values):
+    bitmap = bytearray((len(values) + 7) // 8)
+    for index, value in enumerate(values):
+        if value is None:
+            bitmap[index >> 3] |= 1 << (index & 7)
+    return bytes(bitmap)
+
+
+def _array_bytes(data):
+    if _BIG_ENDIAN:
+        data.byteswap()
+    return data.tobytes()
+
+
+# ---------- 读取 ----------
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError('文件不完整或格式错误')
+    return data
+
+
+def _read_text(stream):
+    size = struct.unpack('<H', _read_exact(stream, 2))[0]
+    return _read_exact(stream, size).decode('utf-8')
+
+
+def read_binary(stream):
+    """读取emcb文件，依次返回 (表名, 列定义, 行列表)"""
+    if _read_exact(stream, len(MAGIC)) != MAGIC:
+        raise ValueError('不是有效的emcb文件')
+    table = _read_text(stream)
+    count = struct.unpack('<H', _read_exact(stream, 2))[0]
+    columns = []
+    for _ in range(count):
+        name = _read_text(stream)
+        columns.append((name, _read_exact(stream, 1).decode('ascii')))
+
+    while True:
+        rows_count = struct.unpack('<I', _read_exact(stream, 4))[0]
+        if rows_count == 0:
+            return
+        column_values = []
+        for _, kind in columns:
+            bitmap = _read_exact(stream, (rows_count + 7) // 8)
+            if kind == 's':
+                lengths = array('I')
+                lengths.frombytes(_read_exact(stream, rows_count * lengths.itemsize))
+                if _BIG_ENDIAN:
+                    lengths.byteswap()
+                blob = _read_exact(stream, sum(lengths))
+                values, offset = [], 0
+                for length in lengths:
+                    values.append(blob[offset:offset + length].decode('utf-8'))
+                    offset += length
+            else:
+                data = array(_ARRAY_CODES[kind])
+                data.frombytes(_read_exact(stream, rows_count * data.itemsize))
+                if _BIG_ENDIAN:
+                    data.byteswap()
+                values = data.tolist()
+            for index in range(rows_count):
+                if bitmap[index >> 3] & (1 << (index & 7)):
+                    values[index] = None
+            column_values.append(values)
+        yield table, columns, list(zip(*column_values))
+
+
+def read_csv(stream, table, batch_size=BATCH_SIZE):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if not header:
+        return
+    kinds = dict(TABLES[table])
+    columns = [(name, kinds[name]) for name in header if name in kinds]
+    positions = [header.index(name) for name, _ in columns]
+
+    batch = []
+    for record in reader:
+        batch.append(tuple(_convert(record[pos], kind) if record[pos] != '' else None
+                           for pos, (_, kind) in zip(positions, columns)))
+        if len(batch) >= batch_size:
+            yield table, columns, batch
+            batch = []
+    if batch:
+        yield table, columns, batch
+
+
+def read_jsonl(stream, table, batch_size=BATCH_SIZE):
+    columns = TABLES[table]
+    batch = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        batch.append(tuple(_convert(item.get(name), kind) for name, kind in columns))
+        if len(batch) >= batch_size:
+            yield table, columns, batch
+            batch = []
+    if batch:
+        yield table, columns, batch
+
+
+# ---------- 导入导出 ----------
+
+def export_table(conn, table, stream, fmt, chunk_size=CHUNK_SIZE):
+    """
+    把表导出到二进制流，每写完一块返回一次已导出的行数（生成器）
+
+    调用方可以在每次返回后取走已写入的数据，用于流式HTTP响应
+    """
+    if table not in TABLES:
+        raise ValueError(f'不支持的表: {table}')
+    if fmt not in WRITERS:
+        raise ValueError(f'不支持的格式: {fmt}')
+
+    columns = TABLES[table]
+    writer = WRITERS[fmt](stream, table, columns)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(name for name, _ in columns)} FROM {table} ORDER BY id")
+    total = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        writer.write_rows(rows)
+        total += len(rows)
+        yield total
+    writer.close()
+    yield total
+
+
+class _Buffer(io.RawIOBase):
+    """收集写入数据的内存缓冲区，流式导出时每块取走一次"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export(connect, table, fmt, compression=None, chunk_size=CHUNK_SIZE):
+    """
+    流式导出，按块返回文件内容（用于HTTP响应）
+
+    Args:
+        connect: 返回数据库连接的函数
+        compression: None、'gzip' 或 'lzma'
+    """
+    buffer = _Buffer()
+    stream = open_compressed(buffer, 'wb', compression)
+    conn = connect()
+    try:
+        for _ in export_table(conn, table, stream, fmt, chunk_size):
+            data = buffer.drain()
+            if data:
+                yield data
+        if stream is not buffer:
+            stream.close()
+        data = buffer.drain()
+        if data:
+            yield data
+    finally:
+        conn.close()
+
+
+def export_filename(table, fmt, compression=None):
+    suffix = {'gzip': '.gz', 'lzma': '.xz'}.get(compression, '')
+    return f'{table}.{fmt}{suffix}'
+
+
+def import_batches(conn, batches, commit_every=COMMIT_EVERY):
+    """
+    导入数据批次（主键已存在的行会被忽略）
+
+    Returns:
+        dict: 表名 -> (读取行数, 新增行数)
+    """
+    stats = {}
+    pending = 0
+    conn.execute('BEGIN')
+    try:
+        for table, columns, rows in batches:
+            if table not in TABLES:
+                raise ValueError(f'不支持的表: {table}')
+            names = [name for name, _ in columns if name in dict(TABLES[table])]
+            if len(names) != len(columns):
+                positions = [i for i, (name, _) in enumerate(columns) if name in names]
+                rows = [tuple(row[i] for i in positions) for row in rows]
+
+            # rowcount只统计INSERT本身，不包含插入触发器（补齐时间列）的更新
+            cursor = conn.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                rows
+            )
+            read, inserted = stats.get(table, (0, 0))
+            stats[table] = (read + len(rows), inserted + max(cursor.rowcount, 0))
+
+            pending += len(rows)
+            if pending >= commit_every:
+                conn.commit()
+                conn.execute('BEGIN')
+                pending = 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return stats
+
+
+def read_file(stream, fmt, table=None):
+    """按格式读取文件，返回数据批次生成器"""
+    if fmt == 'emcb':
+        return read_binary(stream)
+    if table not in TABLES:
+        raise ValueError(f'导入{fmt}格式需要指定表名: {", ".join(TABLES)}')
+    if fmt == 'csv':
+        return read_csv(stream, table)
+    if fmt == 'jsonl':
+        return read_jsonl(stream, table)
+    raise ValueError(f'不支持的格式: {fmt}')
+
+
+def after_import(conn, stats):
+    """导入后重建派生数据：电费记录对应余额曲线预聚合、用电量累加器、用电流水、用电热力图、预测模型状态
+    和异常检测基线，预测记录对应准确性统计"""
+    # 命令行使用自动提交模式的连接，显式开启事务，否则重建写入的每一行都是一次单独的提交
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    try:
+        cursor = conn.cursor()
+        if stats.get('electric_records', (0, 0))[1]:
+            import series
+            import ledger
+            import predictors
+            import usage_heatmap
+            import anomaly_detector
+            import usage_accumulator
+            series.rebuild_rollup(cursor)
+            usage_accumulator.rebuild(cursor)
+            ledger.rebuild(cursor)
+            usage_heatmap.rebuild(cursor)
+            predictors.rebuild_states(cursor)
+            anomaly_detector.rebuild(cursor)
+        if stats.get('prediction_records', (0, 0))[1]:
+            import analytics
+            analytics.rebuild_accuracy(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史数据批量导入导出')
+    parser.add_argument('--db', default='electric_data.db', help='数据库文件路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='导出表数据')
+    export_parser.add_argument('table', choices=sorted(TABLES))
+    export_parser.add_argument('output', help='输出文件，扩展名决定格式和压缩方式，例如 records.emcb.xz')
+    export_parser.add_argument('--format', choices=FORMATS, help='文件格式（默认根据扩展名）')
+    export_parser.add_argument('--compress', choices=sorted(set(COMPRESSIONS.values())), help='压缩方式（默认根据扩展名）')
+
+    import_parser = subparsers.add_parser('import', help='导入表数据')
+    import_parser.add_argument('input', help='输入文件')
+    import_parser.add_argument('--table', choices=sorted(TABLES), help='目标表（csv/jsonl格式必填）')
+    import_parser.add_argument('--format', choices=FORMATS, help='文件格式（默认根据扩展名）')
+    import_parser.add_argument('--compress', choices=sorted(set(COMPRESSIONS.values())), help='压缩方式（默认根据扩展名）')
+
+    args = parser.parse_args()
+    path = args.output if args.command == 'export' else args.input
+    detected_format, detected_compression = detect_format(path)
+    fmt = args.format or detected_format
+    compression = args.compress or detected_compression
+    if fmt is None:
+        parser.error('无法根据扩展名判断文件格式，请使用 --format 指定')
+
+    # 确保表结构存在（导入到新数据库时）
+    from app import ElectricMonitor
+    ElectricMonitor(args.db).init_database()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.command == 'export':
+            with open(path, 'wb') as raw:
+                stream = open_compressed(raw, 'wb', compression)
+                total = 0
+                for total in export_table(conn, args.table, stream, fmt):
+                    pass
+                if stream is not raw:
+                    stream.close()
+            size = os.path.getsize(path)
+            print(f"已导出 {args.table} {total} 行到 {path}（{size / 1024:.1f} KB，"
+                  f"{time.perf_counter() - started:.2f} 秒）")
+        else:
+            with open(path, 'rb') as raw:
+                stream = open_compressed(raw, 'rb', compression)
+                stats = import_batches(conn, read_file(stream, fmt, args.table))
+            after_import(conn, stats)
+            for table, (read, inserted) in stats.items():
+                print(f"{table}: 读取 {read} 行，新增 {inserted} 行（已存在的ID被跳过）")
+            print(f"导入完成，耗时 {time.perf_counter() - started:.2f} 秒")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
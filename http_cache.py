@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP缓存 - API的ETag/Last-Modified条件请求、JSON响应gzip压缩和静态文件指纹
+"""
+
+import os
+import gzip
+import hashlib
+import functools
+from datetime import datetime, timezone
+
+from flask import request, make_response, url_for, current_app
+
+# 静态文件指纹缓存: 文件路径 -> (修改时间, 指纹)
+_static_hashes = {}
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def conditional(version_func):
+    """
+    API条件请求装饰器
+
+    Args:
+        version_func: 返回 (数据版本字符串, 最后修改时间datetime或None) 的函数，
+                      数据版本不变时客户端会收到304响应
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version, last_modified = version_func()
+            digest = hashlib.sha1(f"{version}|{request.full_path}".encode('utf-8')).hexdigest()[:20]
+            etag = f'W/"{digest}"'
+
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'no-cache'
+            # 200响应可能按Accept-Encoding压缩，304也要带上相同的Vary
+            response.vary.add('Accept-Encoding')
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def _not_modified(etag, last_modified):
+    # 同时带有两个条件头时只按ETag判断
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+    # 删除最新记录后最后修改时间会变早，因此要求与客户端保存的时间完全一致
+    if_modified_since = request.if_modified_since
+    if if_modified_since is not None and last_modified is not None:
+        return last_modified.replace(microsecond=0) == if_modified_since
+    return False
+
+
+def static_url(filename):
+    """生成带内容指纹的静态文件URL，文件内容变化时URL随之变化"""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return url_for('static', filename=filename)
+
+    cached = _static_hashes.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        _static_hashes[path] = cached
+    return url_for('static', filename=filename, v=cached[1])
+
+
+def init_app(app, min_gzip_size=1024):
+    """注册静态文件缓存策略和JSON压缩"""
+    app.add_template_global(static_url, 'static_url')
+
+    @app.after_request
+    def _cache_and_compress(response):
+        # 带指纹的静态文件内容不会变化，可以长期缓存
+        if request.endpoint == 'static' and request.args.get('v'):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.expires = None
+            return response
+
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.mimetype != 'application/json'
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        # 是否压缩取决于请求头，未压缩的响应也要带Vary，共享缓存才不会把两种响应互相混用
+        response.vary.add('Accept-Encoding')
+        if 'gzip' not in request.headers.get('Accept-Encoding', '').lower():
+            return response
+
+        data = response.get_data()
+        if len(data) < min_gzip_size:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+
+def last_modified(*moments):
+    """
+    取多个变更时间中最晚的一个，转换为UTC时间用于Last-Modified
+
+    Args:
+        moments: Unix时间戳或数据库中的本地时间字符串，None表示没有该项
+    """
+    values = []
+    for moment in moments:
+        if isinstance(moment, str):
+            try:
+                moment = datetime.strptime(moment, '%Y-%m-%d %H:%M:%S').timestamp()
+            except ValueError:
+                moment = None
+        if moment:
+            values.append(moment)
+    return datetime.fromtimestamp(int(max(values)), timezone.utc) if values else None
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用电流水账 - 由相邻两条余额记录推导出的消费和充值事件
+
+每条有余额的电费记录与上一条记录组成一个区间，写入 consumption_ledger 表:
+    consumption  余额下降或不变，amount 为消费金额（元），kwh 按原始响应中的电价换算
+    recharge     余额上升，amount 为充值金额（元）
+区间按结束时间所在的日期归属。保存电费记录时增量追加一行，并同时累加到按日汇总的
+consumption_daily 表，分析和预测直接读取每日汇总，不再从余额快照中反复推算用电量。
+长时间未采集形成的长区间在每日汇总中按时长分摊到覆盖的各日期（usage_accumulator.day_shares）。
+
+使用方法:
+    python ledger.py rebuild             # 根据全部电费记录重建流水（同时重建用电热力图、预测模型状态和异常检测基线）
+    python ledger.py --db other.db rebuild
+"""
+
+import time
+import logging
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+import usage_accumulator
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+INSERT_BATCH = 5000  # 重建时每次executemany的行数
+
+
+def _entry(previous, current):
+    """根据相邻两条记录 (id, 时间, 余额, 电价) 生成一行流水"""
+    _, start_time, start_balance, _ = previous
+    record_id, end_time, end_balance, price = current
+    seconds = (datetime.strptime(end_time, TIME_FORMAT) - datetime.strptime(start_time, TIME_FORMAT)).total_seconds()
+    delta = start_balance - end_balance
+    if delta >= 0:
+        kind, amount, kwh = 'consumption', delta, delta / price
+    else:
+        kind, amount, kwh = 'recharge', -delta, 0.0
+    return (record_id, kind, start_time, end_time, seconds, start_balance, end_balance, amount, kwh, price)
+
+
+def _insert(cursor, entries):
+    cursor.executemany('''
+        INSERT OR REPLACE INTO consumption_ledger
+            (record_id, kind, start_time, end_time, seconds, start_balance, end_balance, amount, kwh, price)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', entries)
+
+
+def append(cursor, record_id, timestamp, balance, price=usage_accumulator.DEFAULT_PRICE):
+    """
+    为新保存的电费记录追加一行流水（在调用方的事务中执行）
+
+    Returns:
+        tuple | None: 追加的流水行，没有上一条记录时返回None
+    """
+    price = price if price and price > 0 else usage_accumulator.DEFAULT_PRICE
+    stamp = timestamp.strftime(TIME_FORMAT) if isinstance(timestamp, datetime) else timestamp
+    cursor.execute('''
+        SELECT id, timestamp, balance FROM electric_records
+        WHERE balance IS NOT NULL AND (timestamp < ? OR (timestamp = ? AND id < ?))
+        ORDER BY timestamp DESC, id DESC
+        LIMIT 1
+    ''', (stamp, stamp, record_id))
+    previous = cursor.fetchone()
+    if previous is None:
+        return None
+
+    entry = _entry(previous + (None,), (record_id, stamp, balance, price))
+    _insert(cursor, [entry])
+
+    # 累加到每日汇总
+    cursor.executemany('''
+        INSERT INTO consumption_daily (day, weekday, consumed, kwh, recharged, intervals)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            consumed = consumed + excluded.consumed,
+            kwh = kwh + excluded.kwh,
+            recharged = recharged + excluded.recharged,
+            intervals = intervals + excluded.intervals
+    ''', _daily_rows(_daily_totals([entry[1:5] + entry[7:9]])))
+    return entry
+
+
+def _daily_totals(entries, since=''):
+    """
+    把流水 (类型, 开始时间, 结束时间, 时长, 金额, 度数) 汇总到日期，早于since的日期不汇总
+
+    Returns:
+        dict: 日期 -> [消费金额, 用电度数, 充值金额, 区间数]
+    """
+    totals = {}
+    for kind, start_time, end_time, seconds, amount, kwh in entries:
+        if kind == 'consumption':
+            shares = usage_accumulator.day_shares(start_time, end_time, seconds)
+        else:
+            shares = ((end_time[:10], 1.0),)
+        for day, share in shares:
+            if day < since:
+                continue
+            row = totals.get(day)
+            if row is None:
+                row = totals[day] = [0.0, 0.0, 0.0, 0]
+            if kind == 'consumption':
+                row[0] += amount * share
+            else:
+                row[2] += amount
+            row[1] += kwh * share
+            row[3] += 1
+    return totals
+
+
+def _daily_rows(totals):
+    return [(day, int(datetime.strptime(day, '%Y-%m-%d').strftime('%w')), *row) for day, row in totals.items()]
+
+
+def refresh_daily(cursor, since=None):
+    """根据流水重新计算每日汇总，since给定时只重算该时间所在日期及之后的汇总"""
+    day = since[:10] if since else ''
+    cursor.execute('DELETE FROM consumption_daily WHERE day >= ?', (day,))
+    # 跨越多天的区间可能有一部分落在day之后，结束时间不早于day的流水都要读取
+    cursor.execute('''
+        SELECT kind, start_time, end_time, seconds, amount, kwh
+        FROM consumption_ledger
+        WHERE end_time >= ?
+    ''', (day,))
+    cursor.executemany('''
+        INSERT INTO consumption_daily (day, weekday, consumed, kwh, recharged, intervals)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', _daily_rows(_daily_totals(cursor.fetchall(), day)))
+
+
+def rebuild(cursor, since=None):
+    """
+    根据电费记录重建流水
+
+    Args:
+        since: 只重建结束时间不早于该时间（字符串）的流水，默认全部重建
+
+    Returns:
+        int: 写入的流水行数
+    """
+    daily_since = since
+    if since is None:
+        cursor.execute('DELETE FROM consumption_ledger')
+        previous = None
+        cursor.execute('''
+            SELECT id, timestamp, balance, raw_data FROM electric_records
+            WHERE balance IS NOT NULL
+            ORDER BY timestamp, id
+        ''')
+    else:
+        cursor.execute('DELETE FROM consumption_ledger WHERE end_time >= ?', (since,))
+        cursor.execute('''
+            SELECT id, timestamp, balance FROM electric_records
+            WHERE balance IS NOT NULL AND timestamp < ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT 1
+        ''', (since,))
+        row = cursor.fetchone()
+        previous = row + (None,) if row else None
+        # 重建的第一个区间从上一条记录开始，可能覆盖since之前的日期，每日汇总要从那一天开始重算
+        if previous is not None:
+            daily_since = previous[1]
+        cursor.execute('''
+            SELECT id, timestamp, balance, raw_data FROM electric_records
+            WHERE balance IS NOT NULL AND timestamp >= ?
+            ORDER BY timestamp, id
+        ''', (since,))
+
+    # 先读出全部记录再写入，避免在同一游标上边读边写
+    rows = cursor.fetchall()
+    entries = []
+    total = 0
+    for record_id, timestamp, balance, raw_data in rows:
+        current = (record_id, timestamp, balance, usage_accumulator.record_price(raw_data))
+        if previous is not None:
+            entries.append(_entry(previous, current))
+            if len(entries) >= INSERT_BATCH:
+                _insert(cursor, entries)
+                total += len(entries)
+                entries = []
+        previous = current
+    _insert(cursor, entries)
+    total += len(entries)
+    refresh_daily(cursor, daily_since)
+    logging.info(f"用电流水已重建，写入{total}行")
+    return total
+
+
+def daily_usage(cursor, days, now=None):
+    """
+    读取最近若干天（包括今天）的每日汇总
+
+    Returns:
+        list: [(日期, 星期(0=周日), 消费金额, 用电度数, 充值金额, 区间数)]，按日期倒序
+    """
+    now = now or datetime.now()
+    since = (now - timedelta(days=days)).strftime('%Y-%m-%d')
+    cursor.execute('''
+        SELECT day, weekday, consumed, kwh, recharged, intervals
+        FROM consumption_daily
+        WHERE day > ?
+        ORDER BY day DESC
+    ''', (since,))
+    return cursor.fetchall()
+
+
+def consumption_rate(cursor, days, now=None):
+    """最近若干天的平均每日消费金额（按流水覆盖的时长计算），没有流水时返回None"""
+    now = now or datetime.now()
+    since = (now - timedelta(days=days)).strftime(TIME_FORMAT)
+    cursor.execute('''
+        SELECT SUM(CASE WHEN kind = 'consumption' THEN amount ELSE 0 END), SUM(seconds)
+        FROM consumption_ledger
+        WHERE end_time > ?
+    ''', (since,))
+    amount, seconds = cursor.fetchone()
+    if not seconds:
+        return None
+    return amount / (seconds / 86400)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用电流水维护')
+    parser.add_argument('--db', default='electric_data.db', help='数据库文件路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help='根据全部电费记录重建流水')
+    args = parser.parse_args()
+
+    # 确保表结构存在
+    from app import ElectricMonitor
+    ElectricMonitor(args.db).init_database()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    try:
+        import predictors
+        import usage_heatmap
+        import anomaly_detector
+
+        cursor = conn.cursor()
+        total = rebuild(cursor)
+        # 热力图、预测模型状态和异常检测基线由流水推导，一并重建
+        usage_heatmap.rebuild(cursor)
+        predictors.rebuild_states(cursor)
+        anomaly_detector.rebuild(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"已重建 {total} 行流水，耗时 {time.perf_counter() - started:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
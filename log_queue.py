@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步日志 - 请求处理线程和定时任务只把日志记录放入内存队列，由后台线程写入日志文件和控制台
+
+队列有长度上限，写入跟不上时丢弃新记录并计数，不会阻塞调用方或无限占用内存。
+上游响应等大段调试内容通过 payload() 以DEBUG级别写入单独的 electric_monitor_debug.log
+（按大小轮转，总大小有上限），每个类别每 PAYLOAD_INTERVAL 秒最多记录一条并截断到
+PAYLOAD_MAX_CHARS 个字符，日志量不随查询频率和房间数增长
+"""
+
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+LOG_FILE = 'electric_monitor.log'
+DEBUG_LOG_FILE = 'electric_monitor_debug.log'
+DEBUG_LOG_MAX_BYTES = 1024 * 1024
+DEBUG_LOG_BACKUPS = 1
+QUEUE_SIZE = 10000
+PAYLOAD_INTERVAL = 3600
+PAYLOAD_MAX_CHARS = 4000
+PAYLOAD_LOGGER = 'electric_monitor.payload'
+FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+_handler = None
+_payload_last = {}       # 类别 -> 最近一次记录的时间
+_payload_suppressed = {}  # 类别 -> 此后省略的条数
+_payload_lock = threading.Lock()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时丢弃记录（计数），不阻塞调用方"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _is_payload(record):
+    return record.name == PAYLOAD_LOGGER
+
+
+def setup(level=logging.INFO, log_file=LOG_FILE, debug_log_file=DEBUG_LOG_FILE):
+    """
+    配置根日志：根日志和调试日志只挂一个队列处理器，文件和控制台输出由后台线程完成
+
+    重复调用或根日志已有处理器时不做任何事
+    """
+    global _listener, _handler
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    formatter = logging.Formatter(FORMAT)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    console_handler = logging.StreamHandler()
+    debug_handler = logging.handlers.RotatingFileHandler(
+        debug_log_file, maxBytes=DEBUG_LOG_MAX_BYTES, backupCount=DEBUG_LOG_BACKUPS,
+        encoding='utf-8', delay=True
+    )
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+        handler.addFilter(lambda record: not _is_payload(record))
+    debug_handler.setFormatter(formatter)
+    debug_handler.addFilter(_is_payload)
+
+    _handler = _DroppingQueueHandler(queue.Queue(QUEUE_SIZE))
+    _listener = logging.handlers.QueueListener(_handler.queue, file_handler, console_handler, debug_handler)
+    _listener.start()
+    atexit.register(stop)
+
+    root.setLevel(level)
+    root.addHandler(_handler)
+
+    # 调试内容不进入主日志，单独以DEBUG级别写入调试日志
+    payload_logger = logging.getLogger(PAYLOAD_LOGGER)
+    payload_logger.setLevel(logging.DEBUG)
+    payload_logger.propagate = False
+    payload_logger.addHandler(_handler)
+
+
+def stop():
+    """停止后台线程并写完队列中剩余的记录"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped():
+    """因队列已满丢弃的记录数"""
+    return _handler.dropped if _handler is not None else 0
+
+
+def payload(category, content):
+    """
+    记录大段调试内容（限流、截断，写入调试日志）
+
+    Args:
+        category: 类别，每个类别单独限流
+        content: 字符串或可JSON序列化的对象，只有实际记录时才序列化
+    """
+    logger = logging.getLogger(PAYLOAD_LOGGER)
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    now = time.monotonic()
+    with _payload_lock:
+        last = _payload_last.get(category)
+        if last is not None and now - last < PAYLOAD_INTERVAL:
+            _payload_suppressed[category] = _payload_suppressed.get(category, 0) + 1
+            return
+        _payload_last[category] = now
+        suppressed = _payload_suppressed.pop(category, 0)
+
+    text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+    if len(text) > PAYLOAD_MAX_CHARS:
+        text = text[:PAYLOAD_MAX_CHARS] + f'...（共{len(text)}个字符，已截断）'
+    note = f'（上次记录后省略了{suppressed}条）' if suppressed else ''
+    logger.debug(f'[{category}]{note} {text}')
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+邮件发送 - 立即发送和汇总（digest）两种模式
+
+汇总模式下预警先写入 alert_outbox 表，定时任务在最早一条预警等待满汇总窗口后，
+按收件人合并为一封邮件，所有汇总邮件通过同一个SMTP连接发送。
+已发送的预警保留 OUTBOX_RETENTION_DAYS 天后删除
+"""
+
+import time
+import logging
+import textwrap
+from datetime import datetime
+
+OUTBOX_RETENTION_DAYS = 30
+
+ALERT_TYPE_NAMES = {
+    'low_balance': '余额不足',
+    'prediction_warning': '预测预警',
+    'consumption_anomaly': '用电异常',
+}
+
+
+class Mailer:
+    def __init__(self, config, connect):
+        """
+        Args:
+            config: 包含SMTP服务器和账号的配置模块
+            connect: 返回数据库连接的函数
+        """
+        self.config = config
+        self.connect = connect
+
+    def send_messages(self, messages):
+        """
+        通过同一个SMTP连接发送多封邮件
+
+        Args:
+            messages: [(收件人, 主题, 正文)] 列表
+
+        Returns:
+            list: 发送成功的邮件在messages中的下标
+        """
+        if not messages:
+            return []
+
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
+        server = smtplib.SMTP(self.config.EMAIL_SMTP_SERVER, self.config.EMAIL_SMTP_PORT)
+        delivered = []
+        try:
+            server.starttls()
+            server.login(self.config.EMAIL_USERNAME, self.config.EMAIL_PASSWORD)
+
+            for index, (recipient, subject, body) in enumerate(messages):
+                try:
+                    msg = MIMEMultipart()
+                    msg['From'] = self.config.EMAIL_USERNAME
+                    msg['To'] = recipient
+                    msg['Subject'] = subject
+                    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+
+                    server.sendmail(self.config.EMAIL_USERNAME, recipient, msg.as_string())
+                    delivered.append(index)
+                    logging.info(f"邮件已发送到: {recipient}（{subject}）")
+                except Exception as e:
+                    logging.error(f"发送邮件到 {recipient} 失败: {str(e)}")
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                pass
+        return delivered
+
+    def send(self, recipients, subject, body):
+        """立即把同一封邮件发送给多个收件人，返回成功发送的数量"""
+        return len(self.send_messages([(recipient, subject, body) for recipient in recipients]))
+
+    def queue(self, recipients, room, alert_type, subject, body):
+        """把预警加入汇总发件箱，返回加入的收件人数量"""
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.executemany('''
+                INSERT INTO alert_outbox (created_at, recipient, room, alert_type, subject, body)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(now, recipient, room, alert_type, subject, body) for recipient in recipients])
+            conn.commit()
+        finally:
+            conn.close()
+        logging.info(f"预警已加入汇总发件箱: {subject}，收件人{len(recipients)}个")
+        return len(recipients)
+
+    def flush_digests(self, window, force=False):
+        """
+        发送汇总邮件
+
+        Args:
+            window: 汇总窗口（秒），最早一条待发送预警等待满该时间后才发送
+            force: 忽略汇总窗口，立即发送所有待发送预警
+
+        Returns:
+            int: 发送成功的汇总邮件数量
+        """
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            # 清理超过保留期限的已发送预警（按 sent_at 索引范围删除）
+            cursor.execute('DELETE FROM alert_outbox WHERE sent_at IS NOT NULL AND sent_at < ?',
+                           (time.time() - OUTBOX_RETENTION_DAYS * 86400,))
+            purged = cursor.rowcount
+            if purged:
+                conn.commit()
+                logging.info(f"已清理{purged}条过期的已发送预警")
+
+            cursor.execute('SELECT MIN(created_at) FROM alert_outbox WHERE sent_at IS NULL')
+            oldest = cursor.fetchone()[0]
+            if oldest is None or (not force and time.time() - oldest < window):
+                return 0
+
+            cursor.execute('''
+                SELECT id, created_at, recipient, room, alert_type, subject, body
+                FROM alert_outbox WHERE sent_at IS NULL
+                ORDER BY recipient, created_at
+            ''')
+            groups = {}
+            for row in cursor.fetchall():
+                groups.setdefault(row[2], []).append(row)
+        finally:
+            conn.close()
+
+        recipients = list(groups)
+        messages = [self.render_digest(recipient, groups[recipient]) for recipient in recipients]
+        delivered = self.send_messages(messages)
+
+        sent_ids = [(row[0],) for index in delivered for row in groups[recipients[index]]]
+        if sent_ids:
+            conn = self.connect()
+            try:
+                now = time.time()
+                conn.executemany('UPDATE alert_outbox SET sent_at = ? WHERE id = ?',
+                                 [(now, row_id) for (row_id,) in sent_ids])
+                conn.commit()
+            finally:
+                conn.close()
+
+        logging.info(f"汇总邮件发送完成：{len(delivered)}/{len(messages)}封，包含{len(sent_ids)}条预警")
+        return len(delivered)
+
+    @staticmethod
+    def render_digest(recipient, rows):
+        """把一个收件人的多条预警合并为一封邮件，返回 (收件人, 主题, 正文)"""
+        rooms = sorted({row[3] for row in rows if row[3]})
+        subject = f"⚡ 电费提醒汇总：{len(rows)}条预警"
+        if rooms:
+            subject += f"（{'、'.join(rooms)}）"
+
+        sections = []
+        for index, (_, created_at, _, room, alert_type, alert_subject, body) in enumerate(rows, 1):
+            created = datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S')
+            title = ALERT_TYPE_NAMES.get(alert_type, alert_type)
+            header = f"[{index}] {title}" + (f" - {room}" if room else '') + f" - {created}"
+            sections.append(f"{header}\n{alert_subject}\n{_strip_envelope(body)}")
+
+        body = "您好！\n\n以下是汇总时间段内的电费预警：\n\n" + \
+               "\n\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n".join(sections) + \
+               "\n\n---\n电费自动提醒系统"
+        return recipient, subject, body
+
+
+def _strip_envelope(body):
+    """去掉单条预警正文中的问候语和签名，只保留内容部分"""
+    text = textwrap.dedent(body).strip()
+    if text.startswith('您好'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+    if '\n---\n' in text:
+        text = text.rsplit('\n---\n', 1)[0]
+    return text.strip()
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+余额预测算法 - 不访问数据库的纯计算实现
+
+每个预测方法是一个 Predictor 子类，接收某一时刻的数据快照（Snapshot）和预警阈值，返回预测结果字典。
+应用从数据库构造快照后调用，回测工具（backtest.py）则在历史上的每个时间点重放数据构造快照，
+两者使用同一份算法。新的预测方法用 @register 注册后即可被应用（PREDICTION_METHOD）和回测使用。
+
+有状态的预测方法（stateful = True）另外实现 initial_state() 和 update(state, entry)：
+每追加一行用电流水调用一次 update，状态以JSON保存在 predictor_state 表中（见 update_states），
+预测时从 snapshot.states 读取，不需要重新扫描历史记录拟合
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+import usage_heatmap
+
+BASIC_WINDOW_DAYS = 7
+PATTERN_WINDOW_DAYS = 30
+MIN_DAILY_INTERVALS = 2  # 至少有两个流水区间的日期才作为样本
+
+# Holt-Winters 参数（按天，周季节性）
+HW_ALPHA = 0.2    # 水平平滑系数
+HW_BETA = 0.02    # 趋势平滑系数
+HW_GAMMA = 0.15   # 季节项平滑系数
+HW_PHI = 0.9      # 趋势阻尼，避免长期外推时趋势无限放大
+HW_SEASON = 7
+HW_MIN_COVERAGE = 12 * 3600   # 一天中流水覆盖不足该时长时不作为观测
+HW_MIN_DAYS = 14              # 观测满两周后才用于预测
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 预测方法名 -> 预测方法实例
+REGISTRY = {}
+
+
+class Snapshot(NamedTuple):
+    """某一时刻可用于预测的数据"""
+    now: object                 # 预测时间（datetime）
+    balance: float              # 当前余额
+    daily: list                 # 最近30天的每日汇总，格式同 ledger.daily_usage，按日期倒序
+    rate: Optional[float] = None  # 最近30天按流水覆盖时长计算的日均消费金额
+    profile: object = None      # 用电热力图（usage_heatmap.UsageProfile），没有时为None
+    states: Optional[dict] = None  # 有状态预测方法的当前状态 {方法名: 状态}
+
+
+class Predictor:
+    """预测方法接口"""
+    name = None
+    label = None        # 界面上显示的名称
+    stateful = False
+
+    def predict(self, snapshot, threshold):
+        """返回预测结果字典（字段见 basic）"""
+        raise NotImplementedError
+
+    def initial_state(self):
+        """有状态方法的初始状态（可JSON序列化）"""
+        return None
+
+    def update(self, state, entry):
+        """把一行用电流水（ledger.append 的返回值）计入状态，返回新状态，必须是O(1)的"""
+        return state
+
+    def state(self, snapshot):
+        states = snapshot.states or {}
+        return states.get(self.name) or self.initial_state()
+
+
+def register(cls):
+    """注册预测方法（类装饰器）"""
+    REGISTRY[cls.name] = cls()
+    return cls
+
+
+def get(name):
+    if name not in REGISTRY:
+        raise ValueError(f'未知的预测方法: {name}')
+    return REGISTRY[name]
+
+
+def predict(name, snapshot, threshold):
+    return get(name).predict(snapshot, threshold)
+
+
+def stateful():
+    return [predictor for predictor in REGISTRY.values() if predictor.stateful]
+
+
+def load_states(cursor):
+    """读取全部有状态预测方法的状态"""
+    cursor.execute('SELECT name, state FROM predictor_state')
+    return {name: json.loads(state) for name, state in cursor.fetchall()}
+
+
+def _save_state(cursor, name, state):
+    cursor.execute('''
+        INSERT INTO predictor_state (name, state, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+    ''', (name, json.dumps(state), datetime.now().strftime(TIME_FORMAT)))
+
+
+def update_states(cursor, entry):
+    """把一行新的用电流水计入全部有状态预测方法（在调用方的事务中执行）"""
+    if entry is None:
+        return
+    states = load_states(cursor)
+    for predictor in stateful():
+        state = states.get(predictor.name) or predictor.initial_state()
+        _save_state(cursor, predictor.name, predictor.update(state, entry))
+
+
+def rebuild_states(cursor):
+    """根据全部用电流水重新计算有状态预测方法的状态，返回重放的流水行数"""
+    cursor.execute('''
+        SELECT record_id, kind, start_time, end_time, seconds, start_balance, end_balance, amount, kwh, price
+        FROM consumption_ledger
+        ORDER BY end_time, id
+    ''')
+    entries = cursor.fetchall()
+    # 没有流水时不保存，以便之后写入记录的数据库在初始化时重新回填
+    cursor.execute('DELETE FROM predictor_state')
+    if entries:
+        for predictor in stateful():
+            state = predictor.initial_state()
+            for entry in entries:
+                state = predictor.update(state, entry)
+            _save_state(cursor, predictor.name, state)
+    return len(entries)
+
+
+def _samples(snapshot, days):
+    """最近若干天（包括今天）中样本充足的每日汇总"""
+    since = (snapshot.now - timedelta(days=days)).strftime('%Y-%m-%d')
+    return [row for row in snapshot.daily if row[0] > since and row[5] >= MIN_DAILY_INTERVALS]
+
+
+def _already_below(snapshot, threshold, **extra):
+    return dict({
+        'success': True,
+        'message': f'当前余额已低于{threshold}元',
+        'current_balance': snapshot.balance,
+        'threshold': threshold,
+        'days_remaining': 0,
+        'predicted_date': snapshot.now.strftime('%Y-%m-%d'),
+        'daily_usage_avg': 0.0,
+        'prediction_confidence': 'high'
+    }, **extra)
+
+
+@register
+class Basic(Predictor):
+    """最近7天日均消费金额的线性外推"""
+    name = 'basic'
+    label = '基础模式'
+
+    def predict(self, snapshot, threshold):
+        return basic(snapshot, threshold)
+
+
+def basic(snapshot, threshold):
+    if snapshot.balance <= threshold:
+        return _already_below(snapshot, threshold)
+
+    daily_usage_data = _samples(snapshot, BASIC_WINDOW_DAYS)
+    if len(daily_usage_data) < 3:
+        # 数据不足，使用最近30天流水覆盖时长内的平均值
+        daily_usage_avg = float(snapshot.rate) if snapshot.rate else 1.0
+        confidence = 'low'
+    else:
+        # 每日消费金额，充值已单独记为充值流水，不会混入
+        daily_usages = [float(row[2]) for row in daily_usage_data]
+        daily_usage_avg = sum(daily_usages) / len(daily_usages)
+        confidence = 'high' if len(daily_usages) >= 5 else 'medium'
+
+    # 如果平均用电费用太小，设置最小值
+    if daily_usage_avg < 0.1:
+        daily_usage_avg = 1.0
+        confidence = 'low'
+
+    # 计算预计天数
+    days_remaining = (snapshot.balance - threshold) / daily_usage_avg
+    predicted_date = (snapshot.now + timedelta(days=int(days_remaining))).strftime('%Y-%m-%d')
+
+    return {
+        'success': True,
+        'message': '预测成功',
+        'current_balance': snapshot.balance,
+        'threshold': threshold,
+        'days_remaining': round(days_remaining, 1) if days_remaining else None,
+        'predicted_date': predicted_date,
+        'daily_usage_avg': round(daily_usage_avg, 2),
+        'prediction_confidence': confidence
+    }
+
+
+@register
+class Advanced(Predictor):
+    """区分工作日/周末的日均消费，热力图足够时按小时模拟消耗"""
+    name = 'advanced'
+    label = '高级模式'
+
+    def predict(self, snapshot, threshold):
+        return advanced(snapshot, threshold)
+
+
+def advanced(snapshot, threshold):
+    if snapshot.balance <= threshold:
+        return _already_below(snapshot, threshold, weekday_avg=0.0, weekend_avg=0.0, prediction_method='advanced')
+
+    usage_data = _samples(snapshot, PATTERN_WINDOW_DAYS)
+    if len(usage_data) < 7:
+        prediction = basic(snapshot, threshold)
+        prediction['prediction_method'] = 'basic_fallback'
+        return prediction
+
+    # 分析工作日和周末的用电模式
+    weekday_usages = []  # 周一到周五
+    weekend_usages = []  # 周六周日
+    for day, weekday, consumed, kwh, recharged, intervals in usage_data:
+        weekday_num = int(weekday)  # 0=周日, 1=周一, ..., 6=周六
+        if weekday_num == 0 or weekday_num == 6:
+            weekend_usages.append(float(consumed))
+        else:
+            weekday_usages.append(float(consumed))
+
+    weekday_avg = sum(weekday_usages) / len(weekday_usages) if weekday_usages else 0
+    weekend_avg = sum(weekend_usages) / len(weekend_usages) if weekend_usages else 0
+
+    # 如果某种模式数据不足，使用总体平均值
+    if not weekday_usages or not weekend_usages:
+        all_usages = weekday_usages + weekend_usages
+        overall_avg = sum(all_usages) / len(all_usages)
+        weekday_avg = weekday_avg or overall_avg
+        weekend_avg = weekend_avg or overall_avg
+
+    # 设置最小用电费用
+    weekday_avg = max(weekday_avg, 0.1)
+    weekend_avg = max(weekend_avg, 0.1)
+
+    current_date = snapshot.now
+    remaining_amount = snapshot.balance - threshold
+    total_cost = 0
+    days_count = 0
+    prediction_date = current_date
+
+    # 热力图已覆盖足够时长时按小时模拟消耗，否则按工作日/周末日均模拟
+    hours = None
+    profile = snapshot.profile
+    if profile is not None and profile.coverage_hours() >= usage_heatmap.MIN_PROFILE_HOURS:
+        hours = profile.simulate(current_date, remaining_amount)
+
+    if hours is not None:
+        days_count = hours / 24
+        prediction_date = current_date + timedelta(hours=hours)
+
+    # 模拟未来的用电，直到余额低于阈值
+    while hours is None and total_cost < remaining_amount and days_count < 365:  # 最多预测一年
+        prediction_date = current_date + timedelta(days=days_count)
+        daily_cost = weekend_avg if prediction_date.weekday() >= 5 else weekday_avg
+        total_cost += daily_cost
+        days_count += 1
+
+    # 计算置信度
+    data_quality = min(len(weekday_usages) + len(weekend_usages), 20) / 20
+    pattern_clarity = abs(weekday_avg - weekend_avg) / max(weekday_avg, weekend_avg)
+    confidence_score = (data_quality + pattern_clarity) / 2
+    if confidence_score > 0.7:
+        confidence = 'high'
+    elif confidence_score > 0.4:
+        confidence = 'medium'
+    else:
+        confidence = 'low'
+
+    # 计算整体日均用电费用（用于兼容性）
+    overall_daily_avg = (weekday_avg * 5 + weekend_avg * 2) / 7
+
+    return {
+        'success': True,
+        'message': '高级预测成功',
+        'current_balance': snapshot.balance,
+        'threshold': threshold,
+        'days_remaining': round(days_count, 1) if days_count > 0 else None,
+        'predicted_date': prediction_date.strftime('%Y-%m-%d') if days_count > 0 else None,
+        'daily_usage_avg': round(overall_daily_avg, 2),
+        'weekday_avg': round(weekday_avg, 2),
+        'weekend_avg': round(weekend_avg, 2),
+        'prediction_confidence': confidence,
+        'prediction_method': 'advanced',
+        'data_points': {
+            'weekday_samples': len(weekday_usages),
+            'weekend_samples': len(weekend_usages),
+            'confidence_score': round(confidence_score, 2),
+            'hourly_simulation': hours is not None
+        }
+    }
+
+
+def _damped(steps):
+    """阻尼趋势在steps天后的累计系数 φ + φ² + … + φ^steps"""
+    return HW_PHI * (1 - HW_PHI ** steps) / (1 - HW_PHI)
+
+
+@register
+class HoltWinters(Predictor):
+    """
+    按天的加法 Holt-Winters 模型（阻尼趋势 + 周季节性）
+
+    状态只包含水平、趋势、7个季节项和当天尚未结束的累计值。每行流水按结束时间归入当天，
+    日期变化时用前一天的消费速率（按流水覆盖时长折算为整天）更新一次模型，
+    流水覆盖不足 HW_MIN_COVERAGE 的日期（长时间未采集）不作为观测。
+    前 HW_SEASON 个观测日只收集数据，之后用其均值和各星期的偏差初始化
+    """
+    name = 'holt_winters'
+    label = '季节性平滑'
+    stateful = True
+
+    def initial_state(self):
+        return {
+            'day': None, 'consumed': 0.0, 'covered': 0.0,
+            'last_day': None, 'days': 0, 'warmup': [],
+            'level': None, 'trend': 0.0, 'season': [0.0] * HW_SEASON, 'mae': 0.0
+        }
+
+    def update(self, state, entry):
+        _, kind, _, end_time, seconds, _, _, amount = entry[:8]
+        day = end_time[:10]
+        if state['day'] is None:
+            state['day'] = day
+        elif day < state['day']:
+            # 早于当前日期的流水（乱序写入）不再计入，重建时会按顺序重放
+            return state
+        elif day > state['day']:
+            self._close_day(state)
+            state['day'] = day
+            state['consumed'] = state['covered'] = 0.0
+
+        if kind == 'consumption' and 0 < seconds <= usage_heatmap.MAX_INTERVAL_HOURS * 3600:
+            state['consumed'] += amount
+            state['covered'] += seconds
+        return state
+
+    def _close_day(self, state):
+        """用当天的消费速率更新模型"""
+        if state['covered'] < HW_MIN_COVERAGE:
+            return
+        value = state['consumed'] / state['covered'] * 86400
+        day = datetime.strptime(state['day'], '%Y-%m-%d')
+        weekday = day.weekday()
+        season = state['season']
+
+        if state['level'] is None:
+            state['warmup'].append([weekday, value])
+            state['days'] += 1
+            state['last_day'] = state['day']
+            if len(state['warmup']) >= HW_SEASON:
+                level = sum(v for _, v in state['warmup']) / len(state['warmup'])
+                offsets = {}
+                for w, v in state['warmup']:
+                    offsets.setdefault(w, []).append(v - level)
+                for w, values in offsets.items():
+                    season[w] = sum(values) / len(values)
+                state['level'] = level
+                state['mae'] = sum(abs(v - level - season[w]) for w, v in state['warmup']) / len(state['warmup'])
+                state['warmup'] = []
+            return
+
+        steps = max((day - datetime.strptime(state['last_day'], '%Y-%m-%d')).days, 1)
+        level, trend = state['level'], state['trend']
+        prior = level + _damped(steps) * trend
+        error = value - (prior + season[weekday])
+
+        new_level = HW_ALPHA * (value - season[weekday]) + (1 - HW_ALPHA) * prior
+        state['trend'] = HW_BETA * (new_level - level) / steps + (1 - HW_BETA) * HW_PHI * trend
+        season[weekday] = HW_GAMMA * (value - new_level) + (1 - HW_GAMMA) * season[weekday]
+        state['level'] = new_level
+        state['mae'] = 0.9 * state['mae'] + 0.1 * abs(error)
+        state['days'] += 1
+        state['last_day'] = state['day']
+
+    def forecast(self, state, day):
+        """某一天（date）的预计消费金额"""
+        steps = max((day - datetime.strptime(state['last_day'], '%Y-%m-%d').date()).days, 0)
+        value = state['level'] + _damped(steps) * state['trend'] + state['season'][day.weekday()]
+        return max(value, 0.1)
+
+    def predict(self, snapshot, threshold):
+        if snapshot.balance <= threshold:
+            return _already_below(snapshot, threshold, weekday_avg=0.0, weekend_avg=0.0, prediction_method=self.name)
+
+        state = self.state(snapshot)
+        if state['level'] is None or state['days'] < HW_MIN_DAYS:
+            prediction = basic(snapshot, threshold)
+            prediction['prediction_method'] = 'basic_fallback'
+            return prediction
+
+        # 从现在起逐日扣减预计消费，今天只剩下部分时长
+        now = snapshot.now
+        today = now.date()
+        remaining = snapshot.balance - threshold
+        fraction = 1 - (now.hour * 3600 + now.minute * 60 + now.second) / 86400
+        days_count = None
+        elapsed = 0.0
+        for offset in range(366):
+            daily_cost = self.forecast(state, today + timedelta(days=offset))
+            cost = daily_cost * fraction
+            if cost >= remaining:
+                days_count = elapsed + remaining / daily_cost
+                break
+            remaining -= cost
+            elapsed += fraction
+            fraction = 1.0
+
+        week = [(today + timedelta(days=offset)) for offset in range(1, 8)]
+        weekday_costs = [self.forecast(state, day) for day in week if day.weekday() < 5]
+        weekend_costs = [self.forecast(state, day) for day in week if day.weekday() >= 5]
+        daily_usage_avg = (sum(weekday_costs) + sum(weekend_costs)) / 7
+
+        # 一步预测误差相对日均消费越小、观测天数越多，置信度越高
+        relative_error = state['mae'] / max(state['level'], 0.1)
+        if state['days'] >= 4 * HW_SEASON and relative_error < 0.25:
+            confidence = 'high'
+        elif relative_error < 0.5:
+            confidence = 'medium'
+        else:
+            confidence = 'low'
+
+        return {
+            'success': True,
+            'message': '季节性平滑预测成功',
+            'current_balance': snapshot.balance,
+            'threshold': threshold,
+            'days_remaining': round(days_count, 1) if days_count else None,
+            'predicted_date': (now + timedelta(days=days_count)).strftime('%Y-%m-%d') if days_count else None,
+            'daily_usage_avg': round(daily_usage_avg, 2),
+            'weekday_avg': round(sum(weekday_costs) / len(weekday_costs), 2),
+            'weekend_avg': round(sum(weekend_costs) / len(weekend_costs), 2),
+            'prediction_confidence': confidence,
+            'prediction_method': self.name,
+            'data_points': {
+                'observed_days': state['days'],
+                'level': round(state['level'], 3),
+                'trend': round(state['trend'], 4),
+                'season': [round(value, 3) for value in state['season']],
+                'mean_abs_error': round(state['mae'], 3)
+            }
+        }
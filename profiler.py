@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能分析工具 - 按需对Web请求和定时任务进行性能分析
+支持cProfile（输出pstats）和采样分析（输出可直接用于火焰图的折叠栈）
+使用方法: python profiler.py sign /api/stats   # 生成带签名的分析链接
+"""
+
+import os
+import re
+import sys
+import hmac
+import time
+import hashlib
+import logging
+import threading
+import functools
+from collections import Counter
+from datetime import datetime
+
+# 配置对象（由init_app注入，默认为config模块）
+_config = None
+
+PROFILE_SUFFIXES = ('.pstats', '.folded')
+
+
+SIGNATURE_TTL = 3600  # 签名链接默认有效期（秒）
+
+
+def _setting(name, default):
+    """读取性能分析相关配置"""
+    return getattr(_config, name, default) if _config is not None else default
+
+
+def profile_dir():
+    return _setting('PROFILING_DIR', 'profiles')
+
+
+def sign(path, expires, secret=None):
+    """
+    计算请求路径和过期时间的签名，用于 ?_profile=<签名>&_profile_exp=<过期时间> 按需开启分析
+
+    Args:
+        path: 请求路径
+        expires: 过期时间（Unix时间戳，整数），签名在此之后失效
+    """
+    secret = secret if secret is not None else _setting('PROFILING_SECRET', '')
+    if not secret:
+        return None
+    message = f"{path}|{int(expires)}"
+    return hmac.new(secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def should_profile(request):
+    """判断当前请求是否需要进行性能分析"""
+    if _setting('PROFILING_ENABLED', False):
+        return True
+
+    signature = request.args.get('_profile')
+    expires = request.args.get('_profile_exp', type=int)
+    if not signature or expires is None or expires <= time.time():
+        return False
+
+    expected = sign(request.path, expires)
+    return expected is not None and hmac.compare_digest(signature.encode('utf-8'), expected.encode('utf-8'))
+
+
+class SamplingProfiler:
+    """采样分析器：定期采集目标线程的调用栈，输出折叠栈格式"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enable(self):
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CProfileProfiler:
+    """cProfile分析器，输出pstats文件"""
+
+    def __init__(self):
+        import cProfile
+        self._profile = cProfile.Profile()
+
+    def enable(self):
+        self._profile.enable()
+
+    def disable(self):
+        self._profile.disable()
+
+    def dump(self, path):
+        self._profile.dump_stats(path)
+
+
+def start_profiler():
+    """按配置的模式创建并启动分析器"""
+    if _setting('PROFILING_MODE', 'cprofile') == 'sampling':
+        profiler = SamplingProfiler(_setting('PROFILING_SAMPLE_INTERVAL', 0.005))
+        suffix = '.folded'
+    else:
+        profiler = CProfileProfiler()
+        suffix = '.pstats'
+    profiler.enable()
+    return profiler, suffix, time.perf_counter()
+
+
+def stop_profiler(state, label):
+    """停止分析器并保存结果，返回文件名"""
+    profiler, suffix, started = state
+    profiler.disable()
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    safe_label = re.sub(r'[^A-Za-z0-9_-]+', '_', label).strip('_') or 'root'
+    filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{safe_label}_{duration_ms:.0f}ms{suffix}"
+
+    try:
+        profiler.dump(os.path.join(directory, filename))
+        rotate_profiles()
+        logging.info(f"性能分析已保存: {filename}")
+        return filename
+    except Exception as e:
+        logging.error(f"保存性能分析结果失败: {str(e)}")
+        return None
+
+
+def rotate_profiles():
+    """只保留最近的若干份分析结果"""
+    keep = int(_setting('PROFILING_KEEP', 50))
+    directory = profile_dir()
+    files = sorted(
+        (f for f in os.listdir(directory) if f.endswith(PROFILE_SUFFIXES)),
+        reverse=True
+    )
+    for name in files[keep:]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def list_profiles(limit=50):
+    """列出最近的分析结果"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(PROFILE_SUFFIXES):
+            continue
+        match = re.match(r'(\d{8}-\d{6}-\d{6})_(.+)_(\d+)ms\.(\w+)$', name)
+        stat = os.stat(os.path.join(directory, name))
+        profiles.append({
+            'name': name,
+            'created_at': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            'label': match.group(2) if match else name,
+            'duration_ms': int(match.group(3)) if match else None,
+            'format': 'pstats' if name.endswith('.pstats') else 'folded',
+            'size': stat.st_size
+        })
+        if len(profiles) >= limit:
+            break
+    return profiles
+
+
+def profiled(label):
+    """定时任务装饰器：开启PROFILING_ENABLED时对整个任务进行分析"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _setting('PROFILING_ENABLED', False):
+                return func(*args, **kwargs)
+            state = start_profiler()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stop_profiler(state, label)
+        return wrapper
+    return decorator
+
+
+def is_admin_request(request):
+    """
+    管理接口鉴权：校验ADMIN_TOKEN，未配置令牌时拒绝所有请求
+
+    不按来源地址放行：部署在同机反向代理之后时，所有请求的来源地址都是本机
+    """
+    token = _setting('ADMIN_TOKEN', '')
+    if not token:
+        return False
+    provided = request.headers.get('X-Admin-Token') or request.args.get('token', '')
+    # 按字节比较，请求头中的非ASCII字符不会引发TypeError
+    return hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8'))
+
+
+def init_app(app, config):
+    """为Flask应用注册请求级性能分析钩子"""
+    global _config
+    _config = config
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_profile():
+        if should_profile(request):
+            g._profile_state = start_profiler()
+
+    @app.after_request
+    def _stop_request_profile(response):
+        state = g.pop('_profile_state', None)
+        if state:
+            filename = stop_profiler(state, f"{request.method}_{request.path}")
+            if filename:
+                response.headers['X-Profile'] = filename
+        return response
+
+    @app.teardown_request
+    def _cleanup_request_profile(exc):
+        # 请求异常中断时确保分析器被关闭
+        state = g.pop('_profile_state', None)
+        if state:
+            state[0].disable()
+
+
+def main():
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != 'sign':
+        print(f"使用方法: python profiler.py sign <请求路径> [有效期秒数，默认{SIGNATURE_TTL}]")
+        return
+
+    global _config
+    import config
+    _config = config
+
+    path = sys.argv[2]
+    expires = int(time.time()) + (int(sys.argv[3]) if len(sys.argv) == 4 else SIGNATURE_TTL)
+    signature = sign(path, expires)
+    if not signature:
+        print("❌ 请先在config.py中配置PROFILING_SECRET")
+        return
+    print(f"{path}?_profile={signature}&_profile_exp={expires}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,50 +5,29 @@
 使用方法: python room_finder.py
 """
 
-import requests
-from bs4 import BeautifulSoup
 import config
-import json
+import bupt_client
 
 class RoomFinder:
     def __init__(self):
-        self.session = requests.Session()
+        # 浏览和搜索时会并行获取大量列表，使用较高的并发上限
+        self.client = bupt_client.BuptClient(
+            config.BUPT_USERNAME,
+            config.BUPT_PASSWORD,
+            concurrency=getattr(config, 'ROOM_FINDER_CONCURRENCY', 8),
+            retries=getattr(config, 'UPSTREAM_RETRIES', 3),
+            deadline=getattr(config, 'UPSTREAM_DEADLINE', 30)
+        )
     
     def login(self):
         """登录系统"""
         try:
             print("正在登录...")
-            login_url = "https://auth.bupt.edu.cn/authserver/login"
-            response = self.session.get(login_url, timeout=10)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            type_input = soup.find('input', {'name': 'type'})
-            execution_input = soup.find('input', {'name': 'execution'})
-            _eventId_input = soup.find('input', {'name': '_eventId'})
-            
-            if not type_input or not execution_input or not _eventId_input:
-                print("❌ 登录页面结构异常")
-                return False
-            
-            login_data = {
-                'username': config.BUPT_USERNAME,
-                'password': config.BUPT_PASSWORD,
-                'type': type_input.get('value', ''), # type: ignore
-                'execution': execution_input.get('value', ''), # type: ignore
-                '_eventId': _eventId_input.get('value', '') # type: ignore
-            }
-            
-            response = self.session.post(login_url, data=login_data, timeout=10)
-            
-            if 'CAS Login' in response.text:
-                print("❌ 登录失败，请检查用户名和密码")
-                return False
-            
+            self.client.login()
             print("✅ 登录成功")
             
             # 访问电费页面
-            electric_url = "https://app.bupt.edu.cn/buptdf/wap/default/chong"
-            response = self.session.get(electric_url, timeout=10)
+            response = self.client.chong()
             
             if response.status_code == 200:
                 print("✅ 电费页面访问成功")
@@ -57,6 +36,9 @@ class RoomFinder:
                 print(f"❌ 电费页面访问失败: {response.status_code}")
                 return False
             
+        except bupt_client.LoginFailed as e:
+            print(f"❌ {e}")
+            return False
         except Exception as e:
             print(f"❌ 登录过程出错: {e}")
             return False
@@ -72,14 +54,7 @@ class RoomFinder:
     def get_apartments(self, area_id):
         """获取公寓列表"""
         try:
-            url = "https://app.bupt.edu.cn/buptdf/wap/default/part"
-            response = self.session.post(url, data={'areaid': area_id}, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('e') == 0:
-                    return data['d']['data']
-            return []
+            return self.client.list_apartments(area_id)
         except Exception as e:
             print(f"获取公寓数据出错: {e}")
             return []
@@ -87,17 +62,7 @@ class RoomFinder:
     def get_floors(self, area_id, apartment_id):
         """获取楼层列表"""
         try:
-            url = "https://app.bupt.edu.cn/buptdf/wap/default/floor"
-            response = self.session.post(url, data={
-                'partmentId': apartment_id,
-                'areaid': area_id
-            }, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('e') == 0:
-                    return data['d']['data']
-            return []
+            return self.client.list_floors(area_id, apartment_id)
         except Exception as e:
             print(f"获取楼层数据出错: {e}")
             return []
@@ -105,18 +70,7 @@ class RoomFinder:
     def get_rooms(self, area_id, apartment_id, floor_id):
         """获取房间列表"""
         try:
-            url = "https://app.bupt.edu.cn/buptdf/wap/default/drom"
-            response = self.session.post(url, data={
-                'partmentId': apartment_id,
-                'floorId': floor_id,
-                'areaid': area_id
-            }, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('e') == 0:
-                    return data['d']['data']
-            return []
+            return self.client.list_rooms(area_id, apartment_id, floor_id)
         except Exception as e:
             print(f"获取房间数据出错: {e}")
             return []
@@ -125,34 +79,27 @@ class RoomFinder:
         """通过房间名搜索房间信息"""
         print(f"\n🔍 正在搜索房间: {target_room_name}")
         
-        areas = self.get_areas()
+        areas = {area['id']: area['name'] for area in self.get_areas()}
         found_rooms = []
         
-        for area in areas:
-            print(f"\n检查校区: {area['name']}")
-            apartments = self.get_apartments(area['id'])
-            
-            for apartment in apartments:
-                print(f"  检查公寓: {apartment['partmentName']}")
-                floors = self.get_floors(area['id'], apartment['partmentId'])
-                
-                for floor in floors:
-                    print(f"    检查楼层: {floor['floorName']}")
-                    rooms = self.get_rooms(area['id'], apartment['partmentId'], floor['floorId'])
-                    
-                    for room in rooms:
-                        if target_room_name.lower() in room['dromName'].lower():
-                            found_rooms.append({
-                                'area_id': area['id'],
-                                'area_name': area['name'],
-                                'apartment_id': apartment['partmentId'],
-                                'apartment_name': apartment['partmentName'],
-                                'floor_id': floor['floorId'],
-                                'floor_name': floor['floorName'],
-                                'room_number': room['dromNum'],
-                                'room_name': room['dromName']
-                            })
-                            print(f"      ✅ 找到匹配房间: {room['dromName']} (编号: {room['dromNum']})")
+        # 并行获取所有校区的公寓、楼层和房间列表
+        print("正在获取全部房间列表...")
+        all_rooms = self.client.walk_rooms(list(areas))
+        print(f"共获取 {len(all_rooms)} 个房间")
+        
+        for area_id, apartment, floor, room in all_rooms:
+            if target_room_name.lower() in room['dromName'].lower():
+                found_rooms.append({
+                    'area_id': area_id,
+                    'area_name': areas[area_id],
+                    'apartment_id': apartment['partmentId'],
+                    'apartment_name': apartment['partmentName'],
+                    'floor_id': floor['floorId'],
+                    'floor_name': floor['floorName'],
+                    'room_number': room['dromNum'],
+                    'room_name': room['dromName']
+                })
+                print(f"  ✅ 找到匹配房间: {apartment['partmentName']} {room['dromName']} (编号: {room['dromNum']})")
         
         return found_rooms
     
@@ -236,13 +183,12 @@ class RoomFinder:
         try:
             print(f"\n🔍 测试查询 {room_info['room_name']} 的电费数据...")
             
-            url = "https://app.bupt.edu.cn/buptdf/wap/default/search"
-            response = self.session.post(url, data={
-                'partmentId': room_info['apartment_id'],
-                'floorId': room_info['floor_id'],
-                'dromNumber': room_info['room_number'],
-                'areaid': room_info['area_id']
-            }, timeout=10)
+            response = self.client.search(
+                room_info['area_id'],
+                room_info['apartment_id'],
+                room_info['floor_id'],
+                room_info['room_number']
+            )
             
             if response.status_code == 200:
                 data = response.json()
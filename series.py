@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+余额曲线降采样 - 按时间范围读取余额数据并用LTTB算法降采样到指定点数
+数据量较大时从按小时/按天预聚合的 balance_rollup 表读取
+原始记录按整数时间列（time_keys）做范围查询和分组
+"""
+
+from datetime import datetime, timedelta
+
+import time_keys
+
+# 预聚合级别: (级别, 时间桶格式, 时间键列, 时间键 -> 时间桶, 时间桶长度)
+ROLLUP_LEVELS = (
+    ('hour', '%Y-%m-%d %H:00:00', 'hour_key', time_keys.hour_label, timedelta(hours=1)),
+    ('day', '%Y-%m-%d', 'day_key', time_keys.day_label, timedelta(days=1)),
+)
+
+# 原始数据或某一级预聚合的点数不超过 目标点数×该倍数 时直接使用
+OVERSAMPLE_FACTOR = 8
+
+
+def lttb(data, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样
+
+    Args:
+        data: 按x升序排列的 (x, y) 列表
+        threshold: 目标点数
+
+    Returns:
+        list: 降采样后的 (x, y) 列表，保留首尾两点
+    """
+    length = len(data)
+    if threshold >= length or threshold < 3:
+        return list(data)
+
+    sampled = [data[0]]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # 下一个桶的平均点
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        count = next_end - next_start
+        avg_x = sum(point[0] for point in data[next_start:next_end]) / count
+        avg_y = sum(point[1] for point in data[next_start:next_end]) / count
+
+        # 当前桶中与上一个选中点、下一个桶平均点构成最大三角形的点
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = data[a]
+        max_area = -1.0
+        selected = start
+        for j in range(start, end):
+            x, y = data[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = j
+
+        sampled.append(data[selected])
+        a = selected
+
+    sampled.append(data[-1])
+    return sampled
+
+
+def update_rollup(cursor, timestamp, balance):
+    """写入一条余额记录后更新各级预聚合"""
+    for level, fmt, _, _, _ in ROLLUP_LEVELS:
+        cursor.execute('''
+            INSERT INTO balance_rollup (level, bucket, balance_sum, balance_count, min_balance, max_balance)
+            VALUES (?, ?, ?, 1, ?, ?)
+            ON CONFLICT (level, bucket) DO UPDATE SET
+                balance_sum = balance_sum + excluded.balance_sum,
+                balance_count = balance_count + 1,
+                min_balance = MIN(min_balance, excluded.min_balance),
+                max_balance = MAX(max_balance, excluded.max_balance)
+        ''', (level, timestamp.strftime(fmt), balance, balance, balance))
+
+
+def rebuild_rollup(cursor, timestamp=None):
+    """
+    根据原始记录重建预聚合
+
+    Args:
+        timestamp: 只重建该时间所在的时间桶（删除单条记录后使用），为None时全部重建
+    """
+    for level, fmt, key, label, length in ROLLUP_LEVELS:
+        if timestamp is None:
+            cursor.execute('DELETE FROM balance_rollup WHERE level = ?', (level,))
+            condition, params = '', ()
+        else:
+            bucket = timestamp.strftime(fmt)
+            cursor.execute('DELETE FROM balance_rollup WHERE level = ? AND bucket = ?', (level, bucket))
+            start = datetime.strptime(bucket, fmt)
+            condition, params = 'AND epoch >= ? AND epoch < ?', (int(start.timestamp()), int((start + length).timestamp()))
+
+        cursor.execute(f'''
+            SELECT {key}, SUM(balance), COUNT(*), MIN(balance), MAX(balance)
+            FROM electric_records
+            WHERE balance IS NOT NULL {condition}
+            GROUP BY {key}
+        ''', params)
+        cursor.executemany('''
+            INSERT INTO balance_rollup (level, bucket, balance_sum, balance_count, min_balance, max_balance)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(level, label(row[0])) + row[1:] for row in cursor.fetchall()])
+
+
+def parse_time(value):
+    """解析查询参数中的时间：毫秒时间戳、日期或日期时间字符串"""
+    if value is None or value == '':
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value) / 1000)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'无法解析时间: {value}')
+
+
+def _to_ms(text, fmt):
+    return int(datetime.strptime(text, fmt).timestamp() * 1000)
+
+
+def load_series(conn, start, end, points):
+    """
+    读取时间范围内的余额曲线并降采样
+
+    Args:
+        conn: 数据库连接
+        start, end: 时间范围（datetime，None表示不限）
+        points: 目标点数（通常为图表宽度的像素数）
+
+    Returns:
+        dict: 包含数据来源、实际时间范围和 [毫秒时间戳, 余额] 点列表
+    """
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT MIN(epoch), MAX(epoch) FROM electric_records WHERE balance IS NOT NULL')
+    first, last = cursor.fetchone()
+    if first is None:
+        return {'source': 'raw', 'from': None, 'to': None, 'points': []}
+
+    start_epoch = int(start.timestamp()) if start else first
+    end_epoch = int(end.timestamp()) if end else last
+    start_text = datetime.fromtimestamp(start_epoch).strftime('%Y-%m-%d %H:%M:%S')
+    end_text = datetime.fromtimestamp(end_epoch).strftime('%Y-%m-%d %H:%M:%S')
+    limit = points * OVERSAMPLE_FACTOR
+
+    cursor.execute('''
+        SELECT COUNT(*) FROM electric_records
+        WHERE epoch BETWEEN ? AND ? AND balance IS NOT NULL
+    ''', (start_epoch, end_epoch))
+    raw_count = cursor.fetchone()[0]
+
+    if raw_count <= limit:
+        cursor.execute('''
+            SELECT epoch, balance FROM electric_records
+            WHERE epoch BETWEEN ? AND ? AND balance IS NOT NULL
+            ORDER BY epoch
+        ''', (start_epoch, end_epoch))
+        source = 'raw'
+        data = [(epoch * 1000, balance) for epoch, balance in cursor.fetchall()]
+    else:
+        data = []
+        source = None
+        for level, fmt, _, _, _ in ROLLUP_LEVELS:
+            bucket_start = datetime.strptime(start_text, '%Y-%m-%d %H:%M:%S').strftime(fmt)
+            cursor.execute('''
+                SELECT bucket, balance_sum / balance_count FROM balance_rollup
+                WHERE level = ? AND bucket BETWEEN ? AND ?
+                ORDER BY bucket
+            ''', (level, bucket_start, end_text))
+            rows = cursor.fetchall()
+            source = level
+            data = [(_to_ms(bucket, fmt), balance) for bucket, balance in rows]
+            if len(data) <= limit:
+                break
+
+    return {
+        'source': source,
+        'from': start_text,
+        'to': end_text,
+        'points': [[x, round(y, 2)] for x, y in lttb(data, points)]
+    }
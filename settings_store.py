@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行时设置 - 可在网页上修改的设置保存在 settings.json 中
+账号、密码等敏感信息和启动参数仍然只放在 config.py 中
+
+写入时先写临时文件再原子替换，并递增版本号；各进程读取时按间隔检查文件修改时间，
+文件变化后整体替换内存中的设置，不需要重新导入模块
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+SETTINGS_FILE = 'settings.json'
+
+# 可在线修改的设置: 名称 -> (类型, 默认值)
+SCHEMA = {
+    'LOW_BALANCE_THRESHOLD': (float, 10.0),
+    'ALERT_EMAILS': (list, []),
+    'CHECK_FREQUENCY_MINUTES': (int, 60),
+    'PREDICTION_THRESHOLD': (float, 10.0),
+    'PREDICTION_ALERT_DAYS': (int, 7),
+    'PREDICTION_METHOD': (str, 'advanced'),
+    'PREDICTION_LOOKBACK_DAYS': (int, 30),
+    'PREDICTION_ACCURACY_EVALUATION': (bool, True),
+    'ALERT_DIGEST_ENABLED': (bool, False),
+    'ALERT_DIGEST_MINUTES': (int, 60),
+    'ANOMALY_ALERT_ENABLED': (bool, True),
+    'ANOMALY_Z_THRESHOLD': (float, 4.0),
+}
+
+
+def coerce(name, value):
+    """按SCHEMA转换设置值的类型，类型不符时抛出ValueError"""
+    if name not in SCHEMA:
+        raise ValueError(f'未知的设置项: {name}')
+    kind = SCHEMA[name][0]
+    try:
+        if kind is bool:
+            if isinstance(value, str):
+                return value.strip().lower() in ('1', 'true', 'yes', 'on')
+            return bool(value)
+        if kind is list:
+            if isinstance(value, str):
+                value = [value]
+            return [str(item).strip() for item in value if str(item).strip()]
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'设置项 {name} 的值无效: {value!r}')
+
+
+class SettingsStore:
+    def __init__(self, path=SETTINGS_FILE, legacy=None, check_interval=1.0):
+        """
+        Args:
+            path: 设置文件路径
+            legacy: 旧版config模块，其中的同名设置作为默认值
+            check_interval: 检查设置文件是否变化的最小间隔（秒）
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._defaults = self._load_defaults(legacy)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = 0.0
+        self._version = 0
+        self._values = dict(self._defaults)
+        self._reload()
+
+    @staticmethod
+    def _load_defaults(legacy):
+        defaults = {}
+        for name, (_, default) in SCHEMA.items():
+            value = getattr(legacy, name, default) if legacy is not None else default
+            try:
+                defaults[name] = coerce(name, value)
+            except ValueError:
+                defaults[name] = default
+        # 旧版配置只有单个提醒邮箱
+        if not defaults['ALERT_EMAILS'] and getattr(legacy, 'ALERT_EMAIL', None):
+            defaults['ALERT_EMAILS'] = [legacy.ALERT_EMAIL]
+        return defaults
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read_file(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _reload(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp and stamp is not None:
+            return
+        try:
+            stored = self._read_file() if stamp is not None else {}
+            values = dict(self._defaults)
+            for name, value in stored.get('values', {}).items():
+                if name in SCHEMA:
+                    values[name] = coerce(name, value)
+            # 整体替换引用，读取方不会看到更新了一半的设置
+            self._values = values
+            self._version = stored.get('version', 0)
+            self._stamp = stamp
+        except Exception as e:
+            logging.error(f"读取设置文件失败，继续使用当前设置: {str(e)}")
+            self._stamp = stamp
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._reload()
+
+    @property
+    def version(self):
+        """设置版本号，每次保存递增"""
+        self._refresh()
+        return self._version
+
+    @property
+    def updated_at(self):
+        """设置文件最后修改的时间（Unix时间戳），没有设置文件时为None"""
+        self._refresh()
+        return self._stamp[0] / 1e9 if self._stamp else None
+
+    def get(self, name):
+        self._refresh()
+        value = self._values[name]
+        return list(value) if isinstance(value, list) else value
+
+    def __getattr__(self, name):
+        if name in SCHEMA:
+            return self.get(name)
+        raise AttributeError(name)
+
+    def snapshot(self):
+        """返回 (版本号, 全部设置的副本)"""
+        self._refresh()
+        return self._version, dict(self._values)
+
+    def update(self, changes):
+        """
+        修改设置并原子写入设置文件
+
+        Args:
+            changes: {设置名: 新值}
+
+        Returns:
+            int: 新的版本号
+        """
+        coerced = {name: coerce(name, value) for name, value in changes.items()}
+
+        with self._lock:
+            stored = self._read_file()
+            values = stored.get('values', {})
+            values.update(coerced)
+            version = stored.get('version', 0) + 1
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.settings.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': version, 'values': values}, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._stamp = None
+            self._reload()
+            return self._version
@@ -1,6 +1,19 @@
 // 全局变量
 let hourlyChartData, dailyChartData, monthlyChartData;
 let currentChart = 'daily'; // 当前显示的图表类型
+let seriesData = [];       // 历史曲线数据 [毫秒时间戳, 余额]
+let seriesRange = null;    // 历史曲线当前时间范围 {from, to}，null表示全部
+let seriesTimer = null;    // 缩放/平移时延迟请求的定时器
+let seriesSeq = 0;         // 历史曲线请求序号，只使用最新一次请求的响应
+
+// 预测方法显示名称（与 predictors.py 中注册的 label 对应）
+const PREDICTION_METHOD_NAMES = {
+    basic: '基础模式',
+    advanced: '高级模式',
+    holt_winters: '季节性平滑',
+    basic_fallback: '基础模式（数据不足）',
+    basic_error_fallback: '基础模式（出错回退）'
+};
 
 // 初始化图表数据（在HTML中设置）
 function initChartData(hourly, daily, monthly) {
@@ -81,6 +94,7 @@ function checkNow(event) {
                     location.reload();
                 }, 1000);
             } else {
+                updateUpstreamStatus(data.upstream);
                 showAlert(data.message || '检查失败', 'error');
             }
         })
@@ -131,6 +145,7 @@ function refreshData(event) {
             if (data.prediction) {
                 updatePredictionDisplay(data.prediction);
             }
+            updateUpstreamStatus(data.upstream);
             
             showAlert('数据刷新成功！', 'success');
         })
@@ -222,14 +237,26 @@ function updatePredictionDisplay(prediction) {
     // 更新预测方法
     const methodElement = document.getElementById('prediction-method');
     if (methodElement) {
-        let methodText = prediction.prediction_method || 'basic';
-        if (methodText === 'advanced') {
-            methodText = '高级模式';
-        } else if (methodText === 'basic') {
-            methodText = '基础模式';
-        }
-        methodElement.textContent = methodText;
+        const methodText = prediction.prediction_method || 'basic';
+        methodElement.textContent = PREDICTION_METHOD_NAMES[methodText] || methodText;
+    }
+}
+
+// 更新上游服务（熔断器）状态
+function updateUpstreamStatus(upstream) {
+    const element = document.getElementById('upstream-status');
+    if (!element || !upstream) {
+        return;
     }
+    element.className = `upstream-status upstream-${upstream.state}`;
+    if (upstream.state === 'open') {
+        element.textContent = `⛔ 北邮服务器暂时不可用，${upstream.retry_at} 后重试`;
+        element.title = upstream.last_error || '';
+    } else if (upstream.state === 'half_open') {
+        element.textContent = '⏳ 正在重新连接北邮服务器';
+        element.title = upstream.last_error || '';
+    }
+    element.hidden = upstream.state === 'closed';
 }
 
 // 清空所有记录
@@ -305,6 +332,8 @@ function loadSettings() {
                 document.getElementById('threshold').value = data.config.threshold || 10.00;
                 document.getElementById('emails').value = (data.config.emails || []).join('\n');
                 document.getElementById('checkFrequency').value = data.config.check_frequency || 30;
+                document.getElementById('digestEnabled').checked = !!data.config.digest_enabled;
+                document.getElementById('digestMinutes').value = data.config.digest_minutes || 60;
             }
         })
         .catch(error => {
@@ -324,6 +353,7 @@ function switchChart(chartType) {
     document.getElementById('hourlyChartContainer').style.display = chartType === 'hourly' ? 'block' : 'none';
     document.getElementById('dailyChartContainer').style.display = chartType === 'daily' ? 'block' : 'none';
     document.getElementById('monthlyChartContainer').style.display = chartType === 'monthly' ? 'block' : 'none';
+    document.getElementById('seriesChartContainer').style.display = chartType === 'series' ? 'block' : 'none';
     
     currentChart = chartType;
     drawCharts();
@@ -335,50 +365,132 @@ function drawCharts() {
         drawChart('hourlyChart', hourlyChartData, '按小时余额趋势 (元)', 'hourly');
     } else if (currentChart === 'daily') {
         drawChart('dailyChart', dailyChartData, '按天余额趋势 (元)', 'daily');
+    } else if (currentChart === 'series') {
+        loadSeries();
     } else {
         drawChart('monthlyChart', monthlyChartData, '按月余额趋势 (元)', 'monthly');
     }
 }
 
-// 绘制余额趋势图
-function drawChart(canvasId, chartData, title, chartType) {
-    if (!chartData || chartData.length === 0) {
-        return;
+// 每个趋势图固定的数据点容量（窗口内的小时/天/月数），追加数据时横坐标位置保持不变
+const CHART_CAPACITY = {hourly: 25, daily: 31, monthly: 13};
+const CHART_MARGIN = 60;
+const CHART_SCALE = 2;
+const CHART_LABEL_HALF_WIDTH = 30; // 数据点标签向左右延伸的最大宽度
+
+// 图表绘制层：背景、网格和坐标轴缓存在离屏画布上，折线单独缓存并只重绘变化的部分
+class ChartLayer {
+    constructor(canvas) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.width = 0;
+        this.height = 0;
+        this.base = null;     // 背景、网格、坐标轴和标题
+        this.baseKey = null;
+        this.line = null;     // 折线、数据点和标签
+        this.data = [];       // 折线层上已绘制的数据
     }
-    
-    const canvas = document.getElementById(canvasId);
-    if (!canvas) return;
-    
-    const ctx = canvas.getContext('2d');
-    
-    // 设置Canvas尺寸
-    canvas.width = canvas.offsetWidth * 2;
-    canvas.height = canvas.offsetHeight * 2;
-    ctx.scale(2, 2);
-    
-    const width = canvas.offsetWidth;
-    const height = canvas.offsetHeight;
-    const margin = 60;
-    const chartWidth = width - 2 * margin;
+
+    // 只在画布尺寸变化时重新分配，返回画布是否可见
+    resize() {
+        const width = this.canvas.offsetWidth;
+        const height = this.canvas.offsetHeight;
+        if (width === 0 || height === 0) return false;
+        if (width === this.width && height === this.height) return true;
+
+        this.width = width;
+        this.height = height;
+        this.canvas.width = width * CHART_SCALE;
+        this.canvas.height = height * CHART_SCALE;
+        this.ctx.setTransform(CHART_SCALE, 0, 0, CHART_SCALE, 0, 0);
+        this.base = this.createOffscreen();
+        this.line = this.createOffscreen();
+        this.baseKey = null;
+        this.data = [];
+        return true;
+    }
+
+    createOffscreen() {
+        const offscreen = document.createElement('canvas');
+        offscreen.width = this.width * CHART_SCALE;
+        offscreen.height = this.height * CHART_SCALE;
+        offscreen.getContext('2d').setTransform(CHART_SCALE, 0, 0, CHART_SCALE, 0, 0);
+        return offscreen;
+    }
+
+    // 把缓存的两层合成到可见画布上，开销与数据量无关
+    composite() {
+        this.ctx.clearRect(0, 0, this.width, this.height);
+        this.ctx.drawImage(this.base, 0, 0, this.width, this.height);
+        this.ctx.drawImage(this.line, 0, 0, this.width, this.height);
+    }
+}
+
+const chartLayers = {};
+
+function getChartLayer(canvasId) {
+    if (!chartLayers[canvasId]) {
+        const canvas = document.getElementById(canvasId);
+        if (!canvas) return null;
+        chartLayers[canvasId] = new ChartLayer(canvas);
+    }
+    return chartLayers[canvasId];
+}
+
+// 横向相邻两点的间距，取整到设备像素，折线层左移时可以按整像素复制而不模糊
+function chartStep(layer, slots) {
+    const chartWidth = layer.width - 2 * CHART_MARGIN;
+    return Math.floor(chartWidth * CHART_SCALE / Math.max(slots - 1, 1)) / CHART_SCALE;
+}
+
+// 逐个比较计算最大最小值（展开大数组传参可能导致调用栈溢出）
+function dataRange(chartData) {
+    let min = Infinity;
+    let max = -Infinity;
+    for (let i = 0; i < chartData.length; i++) {
+        const value = chartData[i][1];
+        if (value === null || value === undefined) continue;
+        if (value < min) min = value;
+        if (value > max) max = value;
+    }
+    if (min === Infinity) return {min: 0, max: 1};
+    return {min: min, max: max};
+}
+
+// 纵轴范围按整齐的刻度（1~8×10^n）向外取整为5格，数据小幅变化时范围和缓存的背景层保持不变
+function niceRange(range) {
+    const span = range.max - range.min;
+    let magnitude = Math.pow(10, Math.floor(Math.log10(span > 0 ? span / 5 : 0.2)));
+    for (;;) {
+        for (const factor of [1, 1.2, 1.5, 2, 2.5, 3, 4, 5, 6, 8]) {
+            const step = factor * magnitude;
+            const min = Math.floor(range.min / step) * step;
+            if (min + 5 * step >= range.max && min + 5 * step > range.min) {
+                return {min: min, max: min + 5 * step};
+            }
+        }
+        magnitude *= 10;
+    }
+}
+
+// 绘制背景、网格线、Y轴标签、坐标轴和标题
+function drawChartBase(layer, range, slots, title) {
+    const ctx = layer.base.getContext('2d');
+    const width = layer.width;
+    const height = layer.height;
+    const margin = CHART_MARGIN;
+    const stepX = chartStep(layer, slots);
+    const chartWidth = slots > 1 ? stepX * (slots - 1) : width - 2 * margin;
     const chartHeight = height - 2 * margin;
-    
-    // 清空画布
+    const balanceRange = range.max - range.min || 1;
+
     ctx.clearRect(0, 0, width, height);
-    
-    // 数据处理
-    const balances = chartData.map(item => item[1]);
-    const maxBalance = Math.max(...balances);
-    const minBalance = Math.min(...balances);
-    const balanceRange = maxBalance - minBalance || 1;
-    
-    // 绘制背景
     ctx.fillStyle = '#f8f9fa';
     ctx.fillRect(margin, margin, chartWidth, chartHeight);
-    
-    // 绘制网格线
+
     ctx.strokeStyle = '#e1e5e9';
     ctx.lineWidth = 1;
-    
+
     // 水平网格线
     for (let i = 0; i <= 5; i++) {
         const y = margin + (chartHeight / 5) * i;
@@ -386,87 +498,333 @@ function drawChart(canvasId, chartData, title, chartType) {
         ctx.moveTo(margin, y);
         ctx.lineTo(margin + chartWidth, y);
         ctx.stroke();
-        
+
         // Y轴标签
-        const value = maxBalance - (balanceRange / 5) * i;
+        const value = range.max - (balanceRange / 5) * i;
         ctx.fillStyle = '#666';
         ctx.font = '12px Arial';
         ctx.textAlign = 'right';
-        ctx.fillText((value !== null && value !== undefined) ? value.toFixed(2) : "--", margin - 10, y + 4);
+        ctx.fillText(value.toFixed(2), margin - 10, y + 4);
     }
-    
+
     // 垂直网格线
-    const stepX = chartWidth / Math.max(chartData.length - 1, 1);
-    for (let i = 0; i < chartData.length; i++) {
+    for (let i = 0; i < slots; i++) {
         const x = margin + stepX * i;
         ctx.beginPath();
         ctx.moveTo(x, margin);
         ctx.lineTo(x, margin + chartHeight);
         ctx.stroke();
     }
-    
-    // 绘制折线
-    if (chartData.length > 1) {
+
+    // 坐标轴
+    ctx.strokeStyle = '#333';
+    ctx.lineWidth = 2;
+    ctx.beginPath();
+    ctx.moveTo(margin, margin);
+    ctx.lineTo(margin, margin + chartHeight);
+    ctx.lineTo(margin + chartWidth, margin + chartHeight);
+    ctx.stroke();
+
+    // 标题
+    ctx.fillStyle = '#333';
+    ctx.font = 'bold 16px Arial';
+    ctx.textAlign = 'center';
+    ctx.fillText(title, width / 2, 30);
+}
+
+function chartLabel(value, chartType) {
+    if (chartType === 'hourly') {
+        // 按小时显示：显示小时格式
+        return new Date(value).getHours() + ':00';
+    } else if (chartType === 'monthly') {
+        // 按月显示：显示年-月格式
+        return value;
+    }
+    // 按天显示：显示月/日格式
+    const date = new Date(value);
+    return (date.getMonth() + 1) + '/' + date.getDate();
+}
+
+// 在折线层上绘制第from到第to-1个点的折线、数据点和标签
+function drawChartLine(layer, chartData, from, to, range, slots, chartType) {
+    const ctx = layer.line.getContext('2d');
+    const margin = CHART_MARGIN;
+    const chartHeight = layer.height - 2 * margin;
+    const balanceRange = range.max - range.min || 1;
+    const stepX = chartStep(layer, slots);
+    const pointY = balance => margin + (range.max - balance) / balanceRange * chartHeight;
+
+    if (to - from > 1) {
         ctx.strokeStyle = '#667eea';
         ctx.lineWidth = 3;
         ctx.beginPath();
-        
-        for (let i = 0; i < chartData.length; i++) {
+        for (let i = from; i < to; i++) {
             const x = margin + stepX * i;
-            const balance = chartData[i][1];
-            const y = margin + (maxBalance - balance) / balanceRange * chartHeight;
-            
-            if (i === 0) {
-                ctx.moveTo(x, y);
+            if (i === from) {
+                ctx.moveTo(x, pointY(chartData[i][1]));
             } else {
-                ctx.lineTo(x, y);
+                ctx.lineTo(x, pointY(chartData[i][1]));
             }
         }
         ctx.stroke();
-        
-        // 绘制数据点
+    }
+
+    for (let i = from; i < to; i++) {
+        const x = margin + stepX * i;
+        const balance = chartData[i][1];
+        const y = pointY(balance);
+
+        // 数据点
         ctx.fillStyle = '#667eea';
-        for (let i = 0; i < chartData.length; i++) {
-            const x = margin + stepX * i;
-            const balance = chartData[i][1];
-            const y = margin + (maxBalance - balance) / balanceRange * chartHeight;
-            
-            ctx.beginPath();
-            ctx.arc(x, y, 4, 0, 2 * Math.PI);
-            ctx.fill();
-            
-            // 数据点标签
-            ctx.fillStyle = '#333';
-            ctx.font = '11px Arial';
-            ctx.textAlign = 'center';
-            ctx.fillText((balance !== null && balance !== undefined) ? balance.toFixed(2) : "--", x, y - 10);
-            ctx.fillStyle = '#667eea';
+        ctx.beginPath();
+        ctx.arc(x, y, 4, 0, 2 * Math.PI);
+        ctx.fill();
+
+        // 数据点标签
+        ctx.fillStyle = '#333';
+        ctx.font = '11px Arial';
+        ctx.textAlign = 'center';
+        ctx.fillText((balance !== null && balance !== undefined) ? balance.toFixed(2) : "--", x, y - 10);
+
+        // X轴标签
+        ctx.fillStyle = '#666';
+        ctx.fillText(chartLabel(chartData[i][0], chartType), x, margin + chartHeight + 20);
+    }
+}
+
+// 重绘折线层上横坐标 [x0, x1) 的部分：清除后只在该区域内重画覆盖它的点，区域外已绘制的内容不会被重复绘制
+function redrawChartColumns(layer, chartData, x0, x1, range, slots, chartType) {
+    const ctx = layer.line.getContext('2d');
+    const stepX = chartStep(layer, slots);
+    x0 = Math.floor(x0 * CHART_SCALE) / CHART_SCALE;
+    x1 = Math.ceil(x1 * CHART_SCALE) / CHART_SCALE;
+    const pad = Math.ceil(CHART_LABEL_HALF_WIDTH / stepX) + 1;
+    const from = Math.max(Math.floor((x0 - CHART_MARGIN) / stepX) - pad, 0);
+    const to = Math.min(Math.ceil((x1 - CHART_MARGIN) / stepX) + pad + 1, chartData.length);
+
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(x0, 0, x1 - x0, layer.height);
+    ctx.clip();
+    ctx.clearRect(x0, 0, x1 - x0, layer.height);
+    if (from < to) {
+        drawChartLine(layer, chartData, from, to, range, slots, chartType);
+    }
+    ctx.restore();
+}
+
+// 时间窗口前移的格数：新数据的第一个点在旧数据中的位置，不是前移时返回0
+function windowShift(previous, current) {
+    if (current.length === 0) return 0;
+    for (let k = 1; k < previous.length; k++) {
+        if (previous[k][0] === current[0][0]) return k;
+    }
+    return 0;
+}
+
+// 返回两组数据从各自起点 offset 和 0 开始第一个不同的位置（以current的下标表示）
+function firstChangedIndex(previous, current, offset = 0) {
+    const length = Math.min(previous.length - offset, current.length);
+    for (let i = 0; i < length; i++) {
+        if (previous[i + offset][0] !== current[i][0] || previous[i + offset][1] !== current[i][1]) {
+            return i;
         }
     }
-    
-    // 绘制X轴标签
+    return length;
+}
+
+// 绘制余额趋势图：数据未变化时不重绘；末尾变化或追加时只重绘变化的部分；
+// 时间窗口前移时把已绘制的折线整体左移，再补画新进入窗口的部分
+function drawChart(canvasId, chartData, title, chartType) {
+    if (!chartData || chartData.length === 0) {
+        return;
+    }
+
+    const layer = getChartLayer(canvasId);
+    if (!layer || !layer.resize()) return;
+
+    const range = niceRange(dataRange(chartData));
+    const slots = Math.max(chartData.length, CHART_CAPACITY[chartType] || 0);
+    const baseKey = `${range.min}|${range.max}|${slots}|${title}`;
+
+    if (baseKey !== layer.baseKey) {
+        // 纵轴范围或横轴格数变化，所有点的位置都会改变
+        drawChartBase(layer, range, slots, title);
+        layer.baseKey = baseKey;
+        layer.line.getContext('2d').clearRect(0, 0, layer.width, layer.height);
+        drawChartLine(layer, chartData, 0, chartData.length, range, slots, chartType);
+    } else {
+        const stepX = chartStep(layer, slots);
+        const shift = windowShift(layer.data, chartData);
+        const changed = firstChangedIndex(layer.data, chartData, shift);
+        if (shift === 0 && changed === chartData.length && changed === layer.data.length) {
+            return;
+        }
+
+        if (shift > 0) {
+            // 按设备像素整体左移折线层，移出左边界的点随后清除
+            const ctx = layer.line.getContext('2d');
+            ctx.save();
+            ctx.setTransform(1, 0, 0, 1, 0, 0);
+            ctx.globalCompositeOperation = 'copy';
+            ctx.drawImage(layer.line, -stepX * shift * CHART_SCALE, 0);
+            ctx.restore();
+            redrawChartColumns(layer, chartData, 0, CHART_MARGIN + stepX * 0.5, range, slots, chartType);
+        }
+
+        // 重绘第一个变化点及其右侧
+        const clearFrom = changed === 0 ? 0 : CHART_MARGIN + stepX * (changed - 0.5);
+        redrawChartColumns(layer, chartData, clearFrom, layer.width, range, slots, chartType);
+    }
+
+    layer.data = chartData.slice();
+    layer.composite();
+}
+
+// 窗口宽度变化时重新绘制当前图表
+let resizeTimer = null;
+window.addEventListener('resize', function() {
+    clearTimeout(resizeTimer);
+    resizeTimer = setTimeout(function() {
+        if (currentChart === 'series') {
+            drawSeriesChart();
+        } else {
+            drawCharts();
+        }
+    }, 150);
+});
+
+// 历史曲线：按图表宽度请求服务端降采样后的数据
+const SERIES_MARGIN = 60;
+const SERIES_MIN_SPAN = 3600 * 1000; // 最小缩放范围1小时
+
+function loadSeries() {
+    const canvas = document.getElementById('seriesChart');
+    if (!canvas) return;
+
+    const points = Math.max(Math.floor(canvas.offsetWidth - 2 * SERIES_MARGIN), 10);
+    let url = `/api/series?points=${points}`;
+    if (seriesRange) {
+        url += `&from=${Math.round(seriesRange.from)}&to=${Math.round(seriesRange.to)}`;
+    }
+
+    const seq = ++seriesSeq;
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            // 快速切换范围时，较早的请求可能晚于较新的请求返回
+            if (seq !== seriesSeq) return;
+            if (!data.success) {
+                console.error('获取余额曲线失败:', data.message);
+                return;
+            }
+            seriesData = data.points || [];
+            if (!seriesRange && seriesData.length > 0) {
+                seriesRange = {from: seriesData[0][0], to: seriesData[seriesData.length - 1][0]};
+            }
+            drawSeriesChart();
+        })
+        .catch(error => console.error('获取余额曲线失败:', error));
+}
+
+// 缩放或平移后延迟请求，避免连续滚动时频繁请求
+function scheduleSeriesLoad() {
+    drawSeriesChart();
+    clearTimeout(seriesTimer);
+    seriesTimer = setTimeout(loadSeries, 200);
+}
+
+function formatSeriesTime(timestamp, span) {
+    const date = new Date(timestamp);
+    const pad = n => String(n).padStart(2, '0');
+    if (span <= 2 * 86400 * 1000) {
+        return `${date.getMonth() + 1}/${date.getDate()} ${pad(date.getHours())}:${pad(date.getMinutes())}`;
+    } else if (span <= 400 * 86400 * 1000) {
+        return `${date.getMonth() + 1}/${date.getDate()}`;
+    }
+    return `${date.getFullYear()}-${pad(date.getMonth() + 1)}`;
+}
+
+function drawSeriesChart() {
+    const layer = getChartLayer('seriesChart');
+    if (!layer || !seriesRange || !layer.resize()) return;
+
+    // 缩放和平移时每次都要整体重绘，只复用画布不重新分配
+    const ctx = layer.ctx;
+    const width = layer.width;
+    const height = layer.height;
+    const margin = SERIES_MARGIN;
+    const chartWidth = width - 2 * margin;
+    const chartHeight = height - 2 * margin;
+    const span = Math.max(seriesRange.to - seriesRange.from, 1);
+
+    ctx.clearRect(0, 0, width, height);
+    ctx.fillStyle = '#f8f9fa';
+    ctx.fillRect(margin, margin, chartWidth, chartHeight);
+
+    // 只统计可见范围内的点，逐个比较避免大数组展开
+    let minBalance = Infinity;
+    let maxBalance = -Infinity;
+    for (let i = 0; i < seriesData.length; i++) {
+        const [time, balance] = seriesData[i];
+        if (time < seriesRange.from || time > seriesRange.to) continue;
+        if (balance < minBalance) minBalance = balance;
+        if (balance > maxBalance) maxBalance = balance;
+    }
+    if (minBalance === Infinity) {
+        minBalance = 0;
+        maxBalance = 1;
+    }
+    const balanceRange = maxBalance - minBalance || 1;
+
+    // 网格线和Y轴标签
+    ctx.strokeStyle = '#e1e5e9';
+    ctx.lineWidth = 1;
     ctx.fillStyle = '#666';
+    ctx.font = '12px Arial';
+    ctx.textAlign = 'right';
+    for (let i = 0; i <= 5; i++) {
+        const y = margin + (chartHeight / 5) * i;
+        ctx.beginPath();
+        ctx.moveTo(margin, y);
+        ctx.lineTo(margin + chartWidth, y);
+        ctx.stroke();
+        ctx.fillText((maxBalance - (balanceRange / 5) * i).toFixed(2), margin - 10, y + 4);
+    }
+
+    // X轴时间标签
     ctx.font = '11px Arial';
     ctx.textAlign = 'center';
-    for (let i = 0; i < chartData.length; i++) {
-        const x = margin + stepX * i;
-        let label;
-        if (chartType === 'hourly') {
-            // 按小时显示：显示小时格式
-            const date = new Date(chartData[i][0]);
-            label = date.getHours() + ':00';
-        } else if (chartType === 'monthly') {
-            // 按月显示：显示年-月格式
-            label = chartData[i][0];
+    for (let i = 0; i <= 6; i++) {
+        const x = margin + (chartWidth / 6) * i;
+        ctx.beginPath();
+        ctx.moveTo(x, margin);
+        ctx.lineTo(x, margin + chartHeight);
+        ctx.stroke();
+        ctx.fillText(formatSeriesTime(seriesRange.from + span / 6 * i, span), x, margin + chartHeight + 20);
+    }
+
+    // 折线（裁剪到绘图区域内）
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(margin, margin, chartWidth, chartHeight);
+    ctx.clip();
+    ctx.strokeStyle = '#667eea';
+    ctx.lineWidth = 2;
+    ctx.beginPath();
+    for (let i = 0; i < seriesData.length; i++) {
+        const x = margin + (seriesData[i][0] - seriesRange.from) / span * chartWidth;
+        const y = margin + (maxBalance - seriesData[i][1]) / balanceRange * chartHeight;
+        if (i === 0) {
+            ctx.moveTo(x, y);
         } else {
-            // 按天显示：显示月/日格式
-            const date = new Date(chartData[i][0]);
-            label = (date.getMonth() + 1) + '/' + date.getDate();
+            ctx.lineTo(x, y);
         }
-        ctx.fillText(label, x, margin + chartHeight + 20);
     }
-    
-    // 绘制坐标轴
+    ctx.stroke();
+    ctx.restore();
+
+    // 坐标轴和标题
     ctx.strokeStyle = '#333';
     ctx.lineWidth = 2;
     ctx.beginPath();
@@ -474,14 +832,51 @@ function drawChart(canvasId, chartData, title, chartType) {
     ctx.lineTo(margin, margin + chartHeight);
     ctx.lineTo(margin + chartWidth, margin + chartHeight);
     ctx.stroke();
-    
-    // 添加标题
+
     ctx.fillStyle = '#333';
     ctx.font = 'bold 16px Arial';
     ctx.textAlign = 'center';
-    ctx.fillText(title, width / 2, 30);
+    ctx.fillText('历史余额 (滚轮缩放，拖动平移，双击重置)', width / 2, 30);
 }
 
+// 历史曲线的缩放和平移
+document.addEventListener('DOMContentLoaded', function() {
+    const canvas = document.getElementById('seriesChart');
+    if (!canvas) return;
+    let dragStart = null;
+
+    canvas.addEventListener('wheel', function(e) {
+        if (!seriesRange) return;
+        e.preventDefault();
+        const chartWidth = canvas.offsetWidth - 2 * SERIES_MARGIN;
+        const ratio = Math.min(Math.max((e.offsetX - SERIES_MARGIN) / chartWidth, 0), 1);
+        const span = seriesRange.to - seriesRange.from;
+        const center = seriesRange.from + span * ratio;
+        const newSpan = Math.max(span * (e.deltaY > 0 ? 1.25 : 0.8), SERIES_MIN_SPAN);
+        seriesRange = {from: center - newSpan * ratio, to: center + newSpan * (1 - ratio)};
+        scheduleSeriesLoad();
+    }, {passive: false});
+
+    canvas.addEventListener('mousedown', function(e) {
+        if (seriesRange) dragStart = {x: e.offsetX, range: seriesRange};
+    });
+    canvas.addEventListener('mousemove', function(e) {
+        if (!dragStart) return;
+        const chartWidth = canvas.offsetWidth - 2 * SERIES_MARGIN;
+        const span = dragStart.range.to - dragStart.range.from;
+        const shift = (dragStart.x - e.offsetX) / chartWidth * span;
+        seriesRange = {from: dragStart.range.from + shift, to: dragStart.range.to + shift};
+        scheduleSeriesLoad();
+    });
+    window.addEventListener('mouseup', function() {
+        dragStart = null;
+    });
+    canvas.addEventListener('dblclick', function() {
+        seriesRange = null;
+        loadSeries();
+    });
+});
+
 // 自动刷新数据（每10分钟）
 setInterval(() => {
     fetch('/api/stats')
@@ -514,6 +909,7 @@ setInterval(() => {
             if (data.prediction) {
                 updatePredictionDisplay(data.prediction);
             }
+            updateUpstreamStatus(data.upstream);
         })
         .catch(error => console.error('自动刷新失败:', error));
 }, 600000); // 10分钟
@@ -664,7 +1060,9 @@ document.addEventListener('DOMContentLoaded', function() {
             const formData = {
                 threshold: parseFloat(document.getElementById('threshold').value),
                 emails: document.getElementById('emails').value.split('\n').filter(email => email.trim()),
-                check_frequency: parseInt(document.getElementById('checkFrequency').value)
+                check_frequency: parseInt(document.getElementById('checkFrequency').value),
+                digest_enabled: document.getElementById('digestEnabled').checked,
+                digest_minutes: parseInt(document.getElementById('digestMinutes').value)
             };
             
             fetch('/api/config', {
@@ -743,7 +1141,7 @@ function showPredictionAccuracy() {
                     if (data.method_stats.length > 0) {
                         message += `📈 各方法统计：\n`;
                         data.method_stats.forEach(method => {
-                            const methodName = method.method === 'advanced' ? '高级模式' : '基础模式';
+                            const methodName = PREDICTION_METHOD_NAMES[method.method] || method.method;
                             message += `• ${methodName}：${method.total_predictions}个预测，平均准确率${method.average_accuracy}%\n`;
                         });
                     }
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间键 - 记录表的整数时间列
+
+记录表的 timestamp 列是本地时间的文本。为了让按时间范围查询和按小时/天分组直接比较整数，
+另外保存:
+    epoch     Unix时间戳（秒）
+    day_key   本地日期，如 20250601
+    hour_key  本地日期和小时，如 2025060113
+写入时由应用直接给出（keys），其他途径写入的行（批量导入、外部工具）由插入触发器补齐，
+旧数据库在初始化时回填（migrate）。所有日期分桶都按本地时间，与 timestamp 文本一致
+"""
+
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 与 keys() 等价的SQL表达式（SQLite的 'utc' 修饰符按本地时区把本地时间转换为UTC）
+_SQL_EPOCH = "CAST(strftime('%s', {0}, 'utc') AS INTEGER)"
+_SQL_DAY_KEY = "CAST(strftime('%Y%m%d', {0}) AS INTEGER)"
+_SQL_HOUR_KEY = "CAST(strftime('%Y%m%d%H', {0}) AS INTEGER)"
+
+
+def keys(moment):
+    """datetime 或 timestamp 文本 -> (epoch, day_key, hour_key)"""
+    if isinstance(moment, str):
+        moment = datetime.strptime(moment, TIME_FORMAT)
+    day_key = moment.year * 10000 + moment.month * 100 + moment.day
+    return int(moment.timestamp()), day_key, day_key * 100 + moment.hour
+
+
+def hour_label(hour_key):
+    """2025060113 -> '2025-06-01 13:00:00'"""
+    day_key, hour = divmod(hour_key, 100)
+    return f'{day_label(day_key)} {hour:02d}:00:00'
+
+
+def day_label(day_key):
+    """20250601 -> '2025-06-01'"""
+    month_key, day = divmod(day_key, 100)
+    return f'{month_label(month_key)}-{day:02d}'
+
+
+def month_label(month_key):
+    """202506 -> '2025-06'"""
+    year, month = divmod(month_key, 100)
+    return f'{year:04d}-{month:02d}'
+
+
+def migrate(cursor, table, with_buckets=True):
+    """
+    为记录表添加整数时间列、索引和插入触发器，并回填缺少时间列的行
+
+    Args:
+        table: 表名（electric_records 或 prediction_records）
+        with_buckets: 是否同时维护 day_key 和 hour_key
+    """
+    columns = ['epoch'] + (['day_key', 'hour_key'] if with_buckets else [])
+    expressions = [_SQL_EPOCH] + ([_SQL_DAY_KEY, _SQL_HOUR_KEY] if with_buckets else [])
+
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {column[1] for column in cursor.fetchall()}
+    for column in columns:
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER')
+
+    # 余额曲线和统计按时间范围读取余额并按小时/天分组，索引包含这些列即可只读索引
+    if with_buckets:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_epoch ON {table} (epoch, day_key, hour_key, balance)')
+    else:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_epoch ON {table} (epoch)')
+
+    assignments = ', '.join(f'{column} = {expression.format("NEW.timestamp")}'
+                            for column, expression in zip(columns, expressions))
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_time_keys
+        AFTER INSERT ON {table}
+        WHEN NEW.epoch IS NULL AND NEW.timestamp IS NOT NULL
+        BEGIN
+            UPDATE {table} SET {assignments} WHERE id = NEW.id;
+        END
+    ''')
+
+    # 旧版本数据库的行（epoch为空的行可以通过索引直接找到）
+    assignments = ', '.join(f'{column} = {expression.format("timestamp")}'
+                            for column, expression in zip(columns, expressions))
+    cursor.execute(f'UPDATE {table} SET {assignments} WHERE epoch IS NULL AND timestamp IS NOT NULL')
+    return cursor.rowcount
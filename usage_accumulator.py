@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用电量累加器 - 按自然日、自然周、自然月累计用电量
+
+每条新记录只和上一条记录比较：余额下降计为消费，余额上升视为充值，不会算成负的用电量；
+记录跨过本地零点、周一或月初时对应周期清零，跨过边界的区间计入新周期（与用电流水按结束时间归属一致）；
+超过 MAX_INTERVAL_HOURS 的区间（长时间未采集）按时长分摊到覆盖的各日期，新周期只计入属于它的部分。
+累计状态保存在 usage_accumulator 表中，每个周期一行，保存记录时只读写这几行
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+DEFAULT_PRICE = 0.48
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+MAX_INTERVAL_HOURS = 6  # 超过该时长的区间不整体归属结束日期，按时长分摊
+
+
+def _day_start(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# 周期名 -> 根据时间计算所在周期开始时间的函数
+PERIODS = {
+    'day': _day_start,
+    'week': lambda ts: _day_start(ts) - timedelta(days=ts.weekday()),
+    'month': lambda ts: _day_start(ts).replace(day=1),
+}
+
+
+def record_price(raw_data):
+    """从原始响应中取电价，缺失或无效时使用默认电价"""
+    try:
+        price = float(json.loads(raw_data)['d']['data']['price'])
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return DEFAULT_PRICE
+    return price if price > 0 else DEFAULT_PRICE
+
+
+def day_shares(start_time, end_time, seconds):
+    """
+    一个消费区间在各日期上的分摊比例
+
+    正常采集间隔的区间整体归属结束时间所在的日期；超过 MAX_INTERVAL_HOURS 的区间按各日期内的时长分摊，
+    避免长时间未采集时整段消费都计入结束的那一天
+
+    Returns:
+        list: [(日期字符串, 比例)]
+    """
+    if seconds <= MAX_INTERVAL_HOURS * 3600 or start_time[:10] == end_time[:10]:
+        return [(end_time[:10], 1.0)]
+
+    end = datetime.strptime(end_time, TIME_FORMAT)
+    cursor = datetime.strptime(start_time, TIME_FORMAT)
+    shares = []
+    while cursor < end:
+        boundary = min(_day_start(cursor) + timedelta(days=1), end)
+        shares.append((cursor.strftime('%Y-%m-%d'), (boundary - cursor).total_seconds() / seconds))
+        cursor = boundary
+    return shares
+
+
+def _empty(start):
+    return {'start': start, 'consumed': 0.0, 'kwh': 0.0, 'recharged': 0.0,
+            'last_balance': None, 'last_timestamp': None}
+
+
+def advance(cursor, timestamp, balance, price=DEFAULT_PRICE, periods=PERIODS):
+    """
+    把一条新记录累加到各周期，在调用方的事务中更新 usage_accumulator 表
+
+    Args:
+        timestamp: 记录时间（datetime）
+        balance: 记录余额
+        price: 电价，用于把消费金额换算为度数
+
+    Returns:
+        dict: {周期名: {'start', 'consumed', 'kwh', 'recharged', ...}}，consumed/recharged单位为元
+    """
+    price = price if price and price > 0 else DEFAULT_PRICE
+    stamp = timestamp.strftime(TIME_FORMAT)
+
+    cursor.execute('''
+        SELECT period, period_start, consumed, kwh, recharged, last_balance, last_timestamp
+        FROM usage_accumulator
+    ''')
+    stored = {row[0]: dict(zip(('start', 'consumed', 'kwh', 'recharged', 'last_balance', 'last_timestamp'), row[1:]))
+              for row in cursor.fetchall()}
+
+    totals = {}
+    for name, period_start in periods.items():
+        start = period_start(timestamp).strftime('%Y-%m-%d')
+        state = stored.get(name) or _empty(start)
+
+        # 早于已累加的最新记录（例如补录旧数据）时不改变累计值
+        if state['last_timestamp'] is not None and stamp < state['last_timestamp']:
+            totals[name] = state
+            continue
+
+        previous = state['last_timestamp']
+        if state['start'] != start:
+            state = dict(_empty(start), last_balance=state['last_balance'])
+        if state['last_balance'] is not None:
+            delta = state['last_balance'] - balance
+            if delta > 0:
+                # 长区间只计入落在本周期内的部分
+                if previous is not None:
+                    seconds = (timestamp - datetime.strptime(previous, TIME_FORMAT)).total_seconds()
+                    delta *= sum(share for day, share in day_shares(previous, stamp, seconds) if day >= start)
+                state['consumed'] += delta
+                state['kwh'] += delta / price
+            else:
+                state['recharged'] -= delta
+
+        state['last_balance'] = balance
+        state['last_timestamp'] = stamp
+        cursor.execute('''
+            INSERT INTO usage_accumulator (period, period_start, consumed, kwh, recharged, last_balance, last_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (period) DO UPDATE SET
+                period_start = excluded.period_start,
+                consumed = excluded.consumed,
+                kwh = excluded.kwh,
+                recharged = excluded.recharged,
+                last_balance = excluded.last_balance,
+                last_timestamp = excluded.last_timestamp
+        ''', (name, state['start'], state['consumed'], state['kwh'], state['recharged'],
+              state['last_balance'], state['last_timestamp']))
+        totals[name] = state
+    return totals
+
+
+def rebuild(cursor, periods=PERIODS):
+    """根据电费记录重新计算累加器（导入、删除或清空记录后调用），返回重放的记录数"""
+    cursor.execute('DELETE FROM usage_accumulator')
+    cursor.execute('SELECT MAX(timestamp) FROM electric_records WHERE balance IS NOT NULL')
+    latest = cursor.fetchone()[0]
+    if latest is None:
+        return 0
+
+    # 从最早的周期开始重放，并用窗口前的最后一条记录作为起始余额
+    latest = datetime.strptime(latest, TIME_FORMAT)
+    window = min(period_start(latest) for period_start in periods.values()).strftime(TIME_FORMAT)
+    cursor.execute('''
+        SELECT timestamp, balance, raw_data FROM electric_records
+        WHERE balance IS NOT NULL AND timestamp < ?
+        ORDER BY timestamp DESC, id DESC LIMIT 1
+    ''', (window,))
+    rows = cursor.fetchall()
+    cursor.execute('''
+        SELECT timestamp, balance, raw_data FROM electric_records
+        WHERE balance IS NOT NULL AND timestamp >= ?
+        ORDER BY timestamp, id
+    ''', (window,))
+    rows += cursor.fetchall()
+
+    for timestamp, balance, raw_data in rows:
+        advance(cursor, datetime.strptime(timestamp, TIME_FORMAT), balance, record_price(raw_data), periods)
+    logging.info(f"用电量累加器已重建，重放{len(rows)}条记录")
+    return len(rows)
+
+
+def totals(cursor, now=None):
+    """
+    读取各周期当前的累计值，已经过去的周期返回0
+
+    Returns:
+        dict: {周期名: {'start', 'consumed', 'kwh', 'recharged'}}
+    """
+    now = now or datetime.now()
+    cursor.execute('SELECT period, period_start, consumed, kwh, recharged FROM usage_accumulator')
+    stored = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    result = {}
+    for name, period_start in PERIODS.items():
+        start = period_start(now).strftime('%Y-%m-%d')
+        row = stored.get(name)
+        if row and row[0] == start:
+            result[name] = dict(zip(('start', 'consumed', 'kwh', 'recharged'), row))
+        else:
+            result[name] = {'start': start, 'consumed': 0.0, 'kwh': 0.0, 'recharged': 0.0}
+    return result
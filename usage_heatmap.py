@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用电热力图 - 按星期×小时（7×24）统计的用电速率
+
+每条消费流水按与各小时格的重叠时长分摊到对应格子，格子保存衰减后的消费金额和观测时长，
+两者之比即该时段的平均用电速率（元/小时）。每次更新前整体按指数衰减（半衰期 HALF_LIFE_DAYS），
+近期的用电习惯权重更高。整个矩阵以 336 个 float64 的二进制形式保存在 usage_profile 表的一行中，
+新记录到来时只读写这一行，预测时可以据此按小时模拟余额消耗而不必重新扫描历史记录
+"""
+
+import math
+import struct
+from datetime import datetime, timedelta
+
+HALF_LIFE_DAYS = 28
+CELLS = 7 * 24
+MAX_INTERVAL_HOURS = 48   # 超过该时长的区间（长时间未采集）无法判断分布，不计入
+MIN_PROFILE_HOURS = 7 * 24  # 观测时长达到一周后才用于预测
+PROFILE_NAME = 'hour_of_week'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_BLOB = struct.Struct(f'<{CELLS * 2}d')
+
+
+def _cell(ts):
+    """时间所在的格子下标，星期一0点为0"""
+    return ts.weekday() * 24 + ts.hour
+
+
+class UsageProfile:
+    def __init__(self, sums=None, weights=None, updated_at=None):
+        """
+        Args:
+            sums: 每个格子衰减后的消费金额（元）
+            weights: 每个格子衰减后的观测时长（小时）
+            updated_at: 最后一次衰减到的时间
+        """
+        self.sums = list(sums) if sums else [0.0] * CELLS
+        self.weights = list(weights) if weights else [0.0] * CELLS
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_blob(cls, blob, updated_at=None):
+        values = _BLOB.unpack(blob)
+        updated = datetime.strptime(updated_at, TIME_FORMAT) if updated_at else None
+        return cls(values[:CELLS], values[CELLS:], updated)
+
+    def to_blob(self):
+        return _BLOB.pack(*self.sums, *self.weights)
+
+    def decay_to(self, ts):
+        """把全部格子衰减到指定时间"""
+        if self.updated_at is not None and ts > self.updated_at:
+            days = (ts - self.updated_at).total_seconds() / 86400
+            factor = math.pow(0.5, days / HALF_LIFE_DAYS)
+            self.sums = [value * factor for value in self.sums]
+            self.weights = [value * factor for value in self.weights]
+        if self.updated_at is None or ts > self.updated_at:
+            self.updated_at = ts
+
+    def add_interval(self, start, end, amount, scale=None):
+        """
+        把一个区间内的消费金额按重叠时长分摊到各小时格
+
+        Args:
+            scale: 批量重建时使用的放大系数，给定时不做整体衰减（见rebuild）
+
+        Returns:
+            bool: 是否计入（区间过长或为空时不计入）
+        """
+        total = (end - start).total_seconds()
+        if total <= 0 or total > MAX_INTERVAL_HOURS * 3600:
+            return False
+
+        if scale is None:
+            self.decay_to(end)
+            scale = 1.0
+        amount *= scale
+        cursor = start
+        while cursor < end:
+            boundary = min(cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1), end)
+            seconds = (boundary - cursor).total_seconds()
+            cell = _cell(cursor)
+            self.sums[cell] += amount * seconds / total
+            self.weights[cell] += scale * seconds / 3600
+            cursor = boundary
+        return True
+
+    def coverage_hours(self):
+        return sum(self.weights)
+
+    def mean_rate(self):
+        """全部格子的平均用电速率（元/小时）"""
+        weight = self.coverage_hours()
+        return sum(self.sums) / weight if weight > 0 else 0.0
+
+    def rate(self, cell):
+        """格子的用电速率（元/小时），没有观测时返回None"""
+        return self.sums[cell] / self.weights[cell] if self.weights[cell] > 0 else None
+
+    def matrix(self):
+        """7×24 的速率矩阵，行为星期一到星期日"""
+        return [[self.rate(day * 24 + hour) for hour in range(24)] for day in range(7)]
+
+    def simulate(self, start, amount, max_days=365):
+        """
+        从start开始按小时模拟消耗，返回消耗完amount元需要的小时数，
+        没有观测的格子使用平均速率；无法在max_days天内消耗完时返回None
+        """
+        fallback = self.mean_rate()
+        rates = [self.rate(cell) for cell in range(CELLS)]
+        rates = [fallback if value is None else value for value in rates]
+        if amount <= 0:
+            return 0.0
+        if not any(rates):
+            return None
+
+        hours = 0.0
+        cursor = start
+        # 第一个小时只剩下部分时长
+        fraction = 1 - (start.minute * 60 + start.second) / 3600
+        while hours < max_days * 24:
+            rate = rates[_cell(cursor)]
+            cost = rate * fraction
+            if cost >= amount:
+                return hours + (amount / rate if rate > 0 else 0)
+            amount -= cost
+            hours += fraction
+            cursor = cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            fraction = 1.0
+        return None
+
+
+def load(cursor):
+    """读取用电热力图，尚未生成时返回空的热力图"""
+    cursor.execute('SELECT matrix, updated_at FROM usage_profile WHERE name = ?', (PROFILE_NAME,))
+    row = cursor.fetchone()
+    return UsageProfile.from_blob(row[0], row[1]) if row else UsageProfile()
+
+
+def save(cursor, profile):
+    updated_at = profile.updated_at.strftime(TIME_FORMAT) if profile.updated_at else None
+    cursor.execute('''
+        INSERT INTO usage_profile (name, matrix, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET matrix = excluded.matrix, updated_at = excluded.updated_at
+    ''', (PROFILE_NAME, profile.to_blob(), updated_at))
+
+
+def update(cursor, entry):
+    """把一行新的用电流水（ledger.append的返回值）计入热力图，在调用方的事务中执行"""
+    if entry is None or entry[1] != 'consumption':
+        return False
+    start = datetime.strptime(entry[2], TIME_FORMAT)
+    end = datetime.strptime(entry[3], TIME_FORMAT)
+    profile = load(cursor)
+    if not profile.add_interval(start, end, entry[7]):
+        return False
+    save(cursor, profile)
+    return True
+
+
+def rebuild(cursor):
+    """根据全部用电流水重新生成热力图，返回计入的区间数"""
+    cursor.execute('''
+        SELECT start_time, end_time, amount FROM consumption_ledger
+        WHERE kind = 'consumption'
+        ORDER BY end_time, id
+    ''')
+    profile = UsageProfile()
+    count = 0
+    first = last = None
+    # 重建时不逐条衰减整个矩阵，而是把越新的区间按 2^(距首条的半衰期数) 放大，最后统一缩回
+    for start, end, amount in cursor.fetchall():
+        end = datetime.strptime(end, TIME_FORMAT)
+        first = first or end
+        scale = math.pow(2, (end - first).total_seconds() / 86400 / HALF_LIFE_DAYS)
+        if profile.add_interval(datetime.strptime(start, TIME_FORMAT), end, amount, scale):
+            count += 1
+            last = end
+
+    # 没有可计入的流水时不保存，以便之后写入记录的数据库在初始化时重新回填
+    cursor.execute('DELETE FROM usage_profile WHERE name = ?', (PROFILE_NAME,))
+    if last is not None:
+        factor = math.pow(2, (last - first).total_seconds() / 86400 / HALF_LIFE_DAYS)
+        profile.sums = [value / factor for value in profile.sums]
+        profile.weights = [value / factor for value in profile.weights]
+        profile.updated_at = last
+        save(cursor, profile)
+    return count